@@ -1,11 +1,12 @@
+import os
 import streamlit as st
 import pandas as pd
 from recommender.recommender import ProductRecommender
-from recommender.database import get_db
-
-# Initialisation du système de recommandation avec la connexion à la base de données
-db = next(get_db())
-recommender = ProductRecommender(db=db)
+from recommender.item_validator import ItemValidator
+from recommender.cache import RecommendationCache
+from recommender.path_index import PurchasePathIndex
+from recommender.popularity import PopularityTracker
+from recommender.database import ScopedSession
 
 # Configuration de la page Streamlit
 st.set_page_config(
@@ -13,6 +14,41 @@ st.set_page_config(
     layout="wide"
 )
 
+@st.cache_resource
+def get_validator():
+    # Ensemble des items connus conservé entre les exécutions du script Streamlit ;
+    # la scoped_session fournit à chaque thread sa propre Session
+    return ItemValidator(ScopedSession)
+
+@st.cache_resource
+def get_cache():
+    # Résultats partagés entre sessions utilisateurs pour les produits populaires
+    return RecommendationCache(maxsize=10000, ttl=300)
+
+@st.cache_resource
+def get_path_index():
+    # Index des parcours construit hors ligne (python -m recommender.path_index)
+    path = os.environ.get("PURCHASE_PATH_INDEX", "purchase_paths.idx")
+    return PurchasePathIndex.load(path) if os.path.exists(path) else None
+
+@st.cache_resource
+def get_popularity():
+    # Items populaires pour les produits sans co-occurrence et les listes trop courtes, chargés
+    # au démarrage ; les items froids sont lus dans weighted_recommendations (recommender.refresher)
+    return PopularityTracker(ScopedSession).load()
+
+# Session propre au thread de cette exécution du script (jamais partagée entre utilisateurs),
+# libérée à la fin du script
+ScopedSession.remove()
+db = ScopedSession()
+recommender = ProductRecommender(
+    db=db,
+    validator=get_validator(),
+    cache=get_cache(),
+    path_index=get_path_index(),
+    popularity=get_popularity()
+)
+
 # Titre principal
 st.title("Système de Recommandation de Produits")
 
@@ -30,10 +66,13 @@ with tab1:
         # Validation de l'item
         if recommender.validator.item_exists(product_id):
             # Obtention des recommandations
-            recommendations = recommender.recommend_for_product(product_id, num_recommendations=num_recs)
+            recommendations = recommender.recommend_for_product(
+                product_id, num_recommendations=num_recs, validate=False
+            )
             
             if recommendations:
                 st.success(f"✅ {len(recommendations)} recommandations trouvées")
+                st.caption(f"Source : {recommender.last_source}")
                 df = pd.DataFrame(recommendations)
                 st.dataframe(df)
                 
@@ -69,7 +108,9 @@ with tab2:
             
             if valid_ids:
                 # Obtention des recommandations pour les produits valides
-                multi_recommendations = recommender.recommend_for_products(valid_ids, num_recommendations=num_multi_recs)
+                multi_recommendations = recommender.recommend_for_products(
+                    valid_ids, num_recommendations=num_multi_recs, validate=False
+                )
                 
                 if multi_recommendations:
                     st.success(f"✅ {len(multi_recommendations)} recommandations trouvées")
@@ -100,7 +141,8 @@ with tab3:
             paths = recommender.get_purchase_paths(
                 path_product_id, 
                 max_path_length=max_path_length,
-                min_support=min_support
+                min_support=min_support,
+                validate=False
             )
             
             if paths:
@@ -136,3 +178,6 @@ st.sidebar.info("""
     - Séquences de consultation-achat
     - Analyse de parcours d'achat
 """)
+
+# Rend la connexion au pool
+ScopedSession.remove()
@@ -0,0 +1,290 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from recommender.data_generator import generate_events, load_events
+from recommender.recommender import ProductRecommender
+from recommender.stats_analyzer import StatsAnalyzer
+from recommender.cooccurrence_index import CooccurrenceIndex
+from recommender.parallel_builder import ParallelCooccurrenceBuilder
+from recommender.neighbors import TopKNeighborBuilder, evaluate
+from recommender.schema import COVERING_INDEXES, apply_indexes, check_plans
+
+# Écart relatif de p50 au-delà duquel une méthode est signalée en régression
+REGRESSION_THRESHOLD = 0.2
+
+
+def summarize(latencies, total_seconds):
+    """Calcule p50/p95/p99 (ms) et le débit d'une série d'appels"""
+    if not latencies:
+        return {"calls": 0}
+    values = np.array(latencies) * 1000
+    return {
+        "calls": len(latencies),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean()),
+        "throughput_per_s": len(latencies) / total_seconds if total_seconds > 0 else None,
+    }
+
+
+def peak_memory(function, calls):
+    """Mesure le pic d'allocation Python (octets) sur quelques appels"""
+    tracemalloc.start()
+    try:
+        for args in calls:
+            try:
+                function(*args)
+            except Exception:
+                pass
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_case(function, calls, warmup=1, memory_calls=5):
+    """Chronomètre chaque appel puis mesure la mémoire sur une passe séparée"""
+    for args in calls[:warmup]:
+        try:
+            function(*args)
+        except Exception:
+            pass
+
+    latencies, errors = [], []
+    started = time.perf_counter()
+    for args in calls:
+        call_started = time.perf_counter()
+        try:
+            function(*args)
+            latencies.append(time.perf_counter() - call_started)
+        except Exception as e:
+            errors.append(str(e).splitlines()[0])
+    total = time.perf_counter() - started
+
+    result = summarize(latencies, total)
+    result["errors"] = len(errors)
+    if errors:
+        result["first_error"] = errors[0]
+    result["peak_memory_bytes"] = peak_memory(function, calls[:memory_calls])
+    return result
+
+
+def benchmark_dataset(url, num_sessions, num_items, args):
+    """Génère, charge puis mesure toutes les méthodes pour une taille de jeu de données"""
+    engine = create_engine(url)
+    purchases, sessions = generate_events(
+        num_sessions,
+        num_items,
+        views_per_session=args.views_per_session,
+        purchase_rate=args.purchase_rate,
+        months=args.months,
+        seed=args.seed
+    )
+    load_started = time.perf_counter()
+    load_events(engine, purchases, sessions)
+    dataset = {
+        "sessions": num_sessions,
+        "items": num_items,
+        "purchases": len(purchases[0]),
+        "views": len(sessions[0]),
+        "load_seconds": time.perf_counter() - load_started,
+    }
+
+    # Les index couvrants sont créés avec les tables ; on peut les retirer pour comparer
+    if args.without_covering_indexes:
+        for index in COVERING_INDEXES:
+            index.drop(engine)
+    else:
+        apply_indexes(engine)
+        plans = check_plans(engine, int(sessions[1][0]))
+        dataset["plans_ok"] = all(check["ok"] for check in plans.values())
+        for name, check in plans.items():
+            if not check["ok"]:
+                print(f"⚠️ {name} n'utilise pas {check['missing']} : {check['plan']}")
+
+    db = sessionmaker(bind=engine)()
+    rng = random.Random(args.seed)
+    # Les items sont tirés parmi les consultations : la popularité Zipf est respectée
+    viewed = [int(item) for item in sessions[1]]
+    single_calls = [(rng.choice(viewed),) for _ in range(args.calls)]
+    basket_calls = [(rng.sample(viewed, args.basket_size),) for _ in range(args.calls)]
+    stats_calls = [(rng.sample(viewed, args.stats_items),) for _ in range(max(args.calls // 10, 1))]
+
+    recommender = ProductRecommender(db)
+    analyzer = StatsAnalyzer(db, recommender=recommender)
+
+    cases = {
+        "recommend_for_product": (recommender.recommend_for_product, single_calls),
+        "recommend_for_products": (recommender.recommend_for_products, basket_calls),
+        "get_purchase_paths": (recommender.get_purchase_paths, single_calls),
+        "calculate_stats": (analyzer.calculate_stats, stats_calls),
+    }
+
+    build_started = time.perf_counter()
+    index = CooccurrenceIndex.load(db)
+    dataset["index_build_seconds"] = time.perf_counter() - build_started
+    index_recommender = ProductRecommender(db, index=index)
+    cases["index.recommend_for_product"] = (index_recommender.recommend_for_product, single_calls)
+    cases["index.recommend_for_products"] = (index_recommender.recommend_for_products, basket_calls)
+
+    # Top-K approché en mémoire bornée : rappel et taille par rapport à l'index exact
+    neighbor_builder = TopKNeighborBuilder(k=20)
+    neighbors = neighbor_builder.build(ParallelCooccurrenceBuilder.load_events(db))
+    dataset["neighbors"] = {**neighbor_builder.stats, **evaluate(neighbors, index, k=5)}
+    neighbor_recommender = ProductRecommender(db, neighbors=neighbors)
+    cases["neighbors.recommend_for_product"] = (neighbor_recommender.recommend_for_product, single_calls)
+
+    results = []
+    for method, (function, calls) in cases.items():
+        if args.methods and method not in args.methods:
+            continue
+        print(f"⏱️  {num_sessions} sessions - {method}")
+        results.append({"dataset": dataset, "method": method, **run_case(function, calls)})
+
+    # Construction parallèle : l'accélération relative à 1 worker n'est rapportée que si chaque
+    # worker dispose d'un cœur ; au-delà, les processus se partagent les cœurs et seul le
+    # surcoût du pool est mesuré
+    events = None
+    baseline_p50 = None
+    cores = available_cores()
+    for workers in args.build_workers:
+        method = f"parallel_build[{workers}]"
+        if args.methods and method not in args.methods and "parallel_build" not in args.methods:
+            continue
+        builder = ParallelCooccurrenceBuilder(workers=workers)
+        events = events or builder.load_events(db)
+        print(f"⏱️  {num_sessions} sessions - {method}")
+        entry = run_case(builder.build_index, [(events,)] * args.build_repeats, memory_calls=1)
+        if "p50_ms" in entry:
+            baseline_p50 = baseline_p50 or entry["p50_ms"]
+            if workers <= cores:
+                entry["speedup"] = baseline_p50 / entry["p50_ms"]
+        results.append({"dataset": dataset, "method": method, "workers": workers, "cores": cores, **entry})
+
+    db.close()
+    engine.dispose()
+    return results
+
+
+def compare(results, baseline_path):
+    """Compare les p50 à une exécution précédente et signale les régressions"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {
+        (entry["dataset"]["sessions"], entry["method"]): entry
+        for entry in baseline["results"]
+    }
+    regressions = []
+    for entry in results:
+        before = previous.get((entry["dataset"]["sessions"], entry["method"]))
+        if not before or "p50_ms" not in before or "p50_ms" not in entry:
+            continue
+        ratio = entry["p50_ms"] / before["p50_ms"] if before["p50_ms"] else float("inf")
+        entry["baseline_p50_ratio"] = ratio
+        if ratio > 1 + REGRESSION_THRESHOLD:
+            regressions.append((entry["dataset"]["sessions"], entry["method"], ratio))
+    return regressions
+
+
+def available_cores():
+    """Cœurs utilisables par ce processus (affinité CPU quand le système l'expose)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des méthodes de recommandation")
+    parser.add_argument("--sizes", default="1000,10000",
+                        help="Nombres de sessions à générer, séparés par des virgules")
+    parser.add_argument("--items-per-session-ratio", type=float, default=0.1,
+                        help="Nombre d'items du catalogue par session générée")
+    parser.add_argument("--views-per-session", type=float, default=5)
+    parser.add_argument("--purchase-rate", type=float, default=0.2)
+    parser.add_argument("--months", type=int, default=6)
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--basket-size", type=int, default=10)
+    parser.add_argument("--stats-items", type=int, default=10)
+    parser.add_argument("--build-workers", default="1,2,4",
+                        help="Nombres de workers de la construction parallèle, séparés par des virgules")
+    parser.add_argument("--build-repeats", type=int, default=3)
+    parser.add_argument("--methods", nargs="*", default=None)
+    parser.add_argument("--without-covering-indexes", action="store_true",
+                        help="Supprime les index couvrants pour mesurer leur apport")
+    parser.add_argument("--url", default=None,
+                        help="URL de base de données ({size} est remplacé par la taille), SQLite temporaire par défaut")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Fichier JSON de résultats")
+    parser.add_argument("--compare", default=None, help="Fichier JSON d'une exécution précédente")
+    args = parser.parse_args()
+    args.build_workers = [int(value) for value in args.build_workers.split(",")]
+
+    workdir = tempfile.mkdtemp(prefix="recommender_bench_")
+    results = []
+    for size in [int(value) for value in args.sizes.split(",")]:
+        url = (args.url or f"sqlite:///{os.path.join(workdir, 'bench_{size}.db')}").format(size=size)
+        num_items = max(int(size * args.items_per_session_ratio), args.basket_size + 1)
+        results.extend(benchmark_dataset(url, size, num_items, args))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "available_cores": available_cores(),
+            "parameters": vars(args),
+        },
+        "results": results,
+    }
+
+    regressions = compare(results, args.compare) if args.compare else []
+
+    print(f"{'sessions':>9} {'méthode':<30} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'appels/s':>9} {'mém. Ko':>9} {'err':>4}")
+    for entry in results:
+        if "p50_ms" not in entry:
+            print(f"{entry['dataset']['sessions']:>9} {entry['method']:<30} {'échec':>9} {entry.get('first_error', '')}")
+            continue
+        print(
+            f"{entry['dataset']['sessions']:>9} {entry['method']:<30} "
+            f"{entry['p50_ms']:>9.2f} {entry['p95_ms']:>9.2f} {entry['p99_ms']:>9.2f} "
+            f"{entry['throughput_per_s']:>9.1f} {entry['peak_memory_bytes'] / 1024:>9.0f} {entry['errors']:>4}"
+        )
+    for entry in results:
+        if "speedup" in entry:
+            print(f"⚡ {entry['method']} ({entry['dataset']['sessions']} sessions) : accélération x{entry['speedup']:.2f}")
+        elif "workers" in entry and "p50_ms" in entry:
+            print(f"ℹ️ {entry['method']} : {entry['workers']} workers pour {entry['cores']} cœur(s), accélération non mesurable")
+    for sessions, method, ratio in regressions:
+        print(f"⚠️ Régression {method} ({sessions} sessions) : p50 x{ratio:.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"✅ Résultats enregistrés dans {args.output}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,65 +1,49 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from datetime import datetime
+from recommender.database import engine
+from recommender.ingest import EventIngester
+import numpy as np
 
-def init_database():
-    # Création de la connexion à la base de données
-    engine = create_engine('mysql://root:@localhost/recommandation_system')
-    
+# Données de test : (session_id, item_id), datées de l'initialisation
+TEST_EVENTS = [(1, 1), (1, 2), (2, 2), (2, 3), (3, 1), (3, 3)]
+
+def init_database(purchases_file=None, views_file=None):
     try:
-        # Création des tables
-        with engine.connect() as conn:
-            # Suppression des données existantes
+        ingester = EventIngester(engine)
+
+        # Création des tables purchases et sessions
+        ingester.ensure_tables()
+
+        # Suppression des données existantes
+        with engine.begin() as conn:
             conn.execute(text("DELETE FROM purchases"))
             conn.execute(text("DELETE FROM sessions"))
-            
-            # Création de la table purchases
-            conn.execute(text("""
-                CREATE TABLE IF NOT EXISTS purchases (
-                    session_id INT,
-                    item_id INT,
-                    purchase_date DATETIME,
-                    PRIMARY KEY (session_id, item_id)
-                )
-            """))
-            
-            # Création de la table sessions
-            conn.execute(text("""
-                CREATE TABLE IF NOT EXISTS sessions (
-                    session_id INT,
-                    item_id INT,
-                    view_date DATETIME,
-                    PRIMARY KEY (session_id, item_id, view_date)
-                )
-            """))
-            
-            # Insertion des données de test dans purchases
-            conn.execute(text("""
-                INSERT INTO purchases (session_id, item_id, purchase_date)
-                VALUES 
-                    (1, 1, NOW()),
-                    (1, 2, NOW()),
-                    (2, 2, NOW()),
-                    (2, 3, NOW()),
-                    (3, 1, NOW()),
-                    (3, 3, NOW())
-            """))
-            
-            # Insertion des données de test dans sessions
-            conn.execute(text("""
-                INSERT INTO sessions (session_id, item_id, view_date)
-                VALUES 
-                    (1, 1, NOW()),
-                    (1, 2, NOW()),
-                    (2, 2, NOW()),
-                    (2, 3, NOW()),
-                    (3, 1, NOW()),
-                    (3, 3, NOW())
-            """))
-            
-            # Pas besoin de commit() explicite avec execute()
-            print("✅ Base de données initialisée avec succès !")
-            
+
+        # Chargement par lots depuis les fichiers fournis, sinon insertion des données de test
+        now = np.datetime64(datetime.now(), "s")
+        test_events = (
+            np.array([session for session, _ in TEST_EVENTS]),
+            np.array([item for _, item in TEST_EVENTS]),
+            np.full(len(TEST_EVENTS), now),
+        )
+        for table, path in (("purchases", purchases_file), ("views", views_file)):
+            if path:
+                stats = ingester.ingest_file(path, table)
+            else:
+                stats = ingester.ingest_chunks(table, [test_events])
+            print(f"{table}: {stats['rows_sent']} lignes envoyées ({stats['rows_per_second']:.0f} lignes/s)")
+
+        print("✅ Base de données initialisée avec succès !")
+
     except Exception as e:
         print(f"❌ Erreur lors de l'initialisation de la base de données : {str(e)}")
 
 if __name__ == "__main__":
-    init_database()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Initialisation de la base de recommandation")
+    parser.add_argument("--purchases", default=None, help="Fichier CSV/JSONL d'achats")
+    parser.add_argument("--views", default=None, help="Fichier CSV/JSONL de consultations")
+    args = parser.parse_args()
+
+    init_database(args.purchases, args.views)
@@ -0,0 +1,229 @@
+from sqlalchemy.ext.asyncio import create_async_engine
+from .cooccurrence_index import DEFAULT_WEIGHTS
+from .database import DATABASE_URL, engine_options
+from .item_validator import ItemValidator
+from .metrics import instrument_engine
+from .queries import get_queries, recent_purchase_cutoff
+from .recommender import PathCounter, PATH_FETCH_SIZE
+import asyncio
+import numpy as np
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Driver asyncio utilisé pour chaque dialecte (aiosqlite pour les tests en local)
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_url(url):
+    """Convertit une URL synchrone (ex. mysql://...) vers le driver asyncio du même dialecte"""
+    scheme, rest = url.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme.split('+')[0], scheme)}://{rest}"
+
+
+def get_async_engine(url=DATABASE_URL):
+    engine = create_async_engine(async_url(url), **engine_options(url))
+    # Les événements sont portés par l'engine synchrone sous-jacent ; pas d'EXPLAIN bloquant ici
+    instrument_engine(engine.sync_engine, explain=False)
+    return engine
+
+
+class AsyncItemValidator:
+    """Équivalent asyncio d'ItemValidator : même cache trié des item_id connus"""
+
+    def __init__(self, engine, cache_ids=True, refresh_interval=300):
+        self.engine = engine
+        self.queries = get_queries(engine)
+        self.cache_ids = cache_ids
+        self.refresh_interval = refresh_interval
+        self._known_ids = None
+        self._loaded_at = None
+        # Un seul rechargement à la fois, partagé par les coroutines qui l'attendent
+        self._lock = asyncio.Lock()
+
+    async def _fetch(self, name, params=None):
+        async with self.engine.connect() as conn:
+            result = await conn.execute(self.queries[name], params or {})
+            return result.fetchall()
+
+    async def refresh(self):
+        rows = await self._fetch("known_items")
+        self._known_ids = np.unique(np.fromiter((row[0] for row in rows), dtype=np.int64))
+        self._loaded_at = time.monotonic()
+        return len(self._known_ids)
+
+    async def _get_known_ids(self):
+        async with self._lock:
+            expired = (
+                self._loaded_at is None
+                or (self.refresh_interval is not None
+                    and time.monotonic() - self._loaded_at > self.refresh_interval)
+            )
+            if expired:
+                await self.refresh()
+        return self._known_ids
+
+    async def filter_existing(self, item_ids):
+        return ItemValidator._members(await self._get_known_ids(), item_ids)
+
+    async def item_exists(self, item_id):
+        """Vérifie si un item existe dans la base de données"""
+        if self.cache_ids:
+            exists = len(await self.filter_existing([item_id])) > 0
+        else:
+            exists = (await self._fetch("item_exists", {"item_id": item_id}))[0][0] > 0
+
+        if not exists:
+            logger.warning(f"L'item {item_id} n'existe pas dans la base de données")
+        return exists
+
+    async def items_exist(self, item_ids):
+        """Vérifie si plusieurs items existent et renvoie ceux qui existent"""
+        if not item_ids:
+            logger.warning("Aucun item à valider")
+            return False, []
+
+        if self.cache_ids:
+            valid_items = list(dict.fromkeys(int(item) for item in await self.filter_existing(item_ids)))
+        else:
+            valid_items = [row[0] for row in await self._fetch("items_exist", {"item_ids": list(item_ids)})]
+
+        missing_items = list(set(item_ids) - set(valid_items))
+        if missing_items:
+            logger.warning(f"Les items suivants n'existent pas: {missing_items}")
+        return len(valid_items) == len(item_ids), valid_items
+
+
+class AsyncProductRecommender:
+    """Variante asyncio de ProductRecommender : les requêtes indépendantes s'exécutent en parallèle
+
+    Chaque composante (achetés ensemble, consulté puis acheté, dernières interactions,
+    validation) utilise sa propre connexion ; la latence devient celle de la plus lente.
+    Les résultats sont identiques à ceux de l'API synchrone.
+    """
+
+    def __init__(self, engine, validator=None, weights=DEFAULT_WEIGHTS):
+        self.engine = engine
+        self.validator = validator or AsyncItemValidator(engine)
+        self.queries = get_queries(engine)
+        # Mêmes poids que l'index et les requêtes combinées (bt, unique_sessions, vp)
+        self.weights = tuple(weights)
+
+    async def _fetch(self, name, params):
+        async with self.engine.connect() as conn:
+            result = await conn.execute(self.queries[name], params)
+            return result.fetchall()
+
+    async def _gather(self, validation, *queries):
+        """Exécute la validation éventuelle et les requêtes en parallèle"""
+        if validation is None:
+            return (True, *await asyncio.gather(*queries))
+        return await asyncio.gather(validation, *queries)
+
+    async def recommend_for_product(self, item_id, num_recommendations=5, validate=True):
+        """Recommande des produits basés sur un seul produit d'entrée"""
+        since = recent_purchase_cutoff()
+        exists, bought, viewed, recent = await self._gather(
+            self.validator.item_exists(item_id) if validate else None,
+            self._fetch("product_bought_together", {"item_id": item_id, "since": since}),
+            self._fetch("product_view_purchase", {"item_id": item_id}),
+            self._fetch("product_recent_interactions", {"item_id": item_id})
+        )
+        if not exists:
+            return []
+
+        bt_weight, us_weight, vp_weight = self.weights
+        scores = {
+            item: bt_score * bt_weight + unique_sessions * us_weight
+            for item, bt_score, unique_sessions in bought
+        }
+        for item, vp_score in viewed:
+            scores[item] = scores.get(item, 0) + vp_score * vp_weight
+        last_interaction = {item: last for item, last in recent if last is not None}
+
+        # Même ordre que la requête combinée : score, puis interaction la plus récente (NULL en dernier)
+        ranked = sorted(scores, key=lambda item: (
+            -scores[item],
+            item not in last_interaction,
+            -last_interaction[item].timestamp() if item in last_interaction else 0
+        ))
+        return [{"item_id": item, "score": float(scores[item])} for item in ranked[:num_recommendations]]
+
+    async def recommend_for_products(self, item_ids, num_recommendations=5, validate=True):
+        """Recommande des produits basés sur plusieurs produits d'entrée"""
+        # Panier vide ou entièrement invalide : aucune requête de co-occurrence
+        if not item_ids:
+            return []
+        if validate:
+            _, valid_items = await self.validator.items_exist(item_ids)
+            if not valid_items:
+                return []
+        else:
+            valid_items = list(item_ids)
+
+        together, sequences = await asyncio.gather(
+            self._fetch("products_bought_together", {"item_ids": valid_items, "since": recent_purchase_cutoff()}),
+            self._fetch("products_view_purchase", {"item_ids": valid_items})
+        )
+
+        bt_weight, us_weight, vp_weight = self.weights
+        sequence_scores = dict(sequences)
+        scores = {
+            item: together_score * bt_weight + unique_sessions * us_weight
+            + sequence_scores.get(item, 0) * vp_weight
+            for item, together_score, unique_sessions in together
+        }
+        ranked = sorted(scores, key=lambda item: -scores[item])
+        return [{"item_id": item, "score": float(scores[item])} for item in ranked[:num_recommendations]]
+
+    async def _stream_paths(self, item_id, max_path_length, min_support, max_distinct_paths):
+        counter = PathCounter(max_path_length, max_distinct_paths)
+        async with self.engine.connect() as conn:
+            result = await conn.stream(self.queries["purchase_paths"], {"item_id": item_id})
+            async for partition in result.partitions(PATH_FETCH_SIZE):
+                for row in partition:
+                    counter.add(row)
+        return counter.frequent_paths(min_support)
+
+    async def get_purchase_paths(self, item_id, max_path_length=3, min_support=2, validate=True,
+                                 max_distinct_paths=None):
+        """Détermine les parcours d'achat typiques incluant l'item spécifié"""
+        exists, paths = await self._gather(
+            self.validator.item_exists(item_id) if validate else None,
+            self._stream_paths(item_id, max_path_length, min_support, max_distinct_paths)
+        )
+        return paths if exists else []
+
+    async def item_stats(self, item_id):
+        """Consultations et achats de l'item (mêmes métriques que StatsAnalyzer)"""
+        rows = await self._fetch("catalog_item_stats", {"low": item_id - 1, "high": item_id})
+        if not rows:
+            return None
+        _, total_views, total_purchases = rows[0]
+        return {
+            "total_views": total_views,
+            "total_purchases": total_purchases,
+            "view_to_purchase_rate": total_purchases / total_views if total_views else 0.0,
+        }
+
+    async def product_page(self, item_id, num_recommendations=5, max_path_length=3, min_support=2):
+        """Recommandations, parcours et statistiques d'un produit, calculés en parallèle"""
+        exists, recommendations, paths, stats = await asyncio.gather(
+            self.validator.item_exists(item_id),
+            self.recommend_for_product(item_id, num_recommendations, validate=False),
+            self.get_purchase_paths(item_id, max_path_length, min_support, validate=False),
+            self.item_stats(item_id)
+        )
+        if not exists:
+            return None
+        return {
+            "item_id": item_id,
+            "recommendations": recommendations,
+            "paths": paths,
+            "stats": stats,
+        }
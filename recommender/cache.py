@@ -0,0 +1,160 @@
+from collections import OrderedDict, defaultdict
+import copy
+import threading
+import time
+
+
+class _Flight:
+    """Calcul en cours pour une clé, partagé par les appels concurrents"""
+
+    def __init__(self, item_ids):
+        self.event = threading.Event()
+        self.item_ids = set(item_ids)
+        self.value = None
+        self.error = None
+        self.invalidated = False
+
+
+class RecommendationCache:
+    """Cache LRU + TTL des résultats de recommandation avec coalescence des calculs concurrents
+
+    Chaque appelant reçoit sa propre copie du résultat : modifier la liste renvoyée
+    n'altère ni l'entrée en cache ni la réponse des autres appelants.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._keys_by_item = defaultdict(set)
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(method, item_ids, limit, **params):
+        """Construit la clé (méthode, items, limite, paramètres)"""
+        return (method, tuple(sorted(set(item_ids))), limit, tuple(sorted(params.items())))
+
+    def stats(self):
+        """Renvoie les compteurs du cache pour le dimensionner"""
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            }
+
+    def _related_items(self, item_ids, value):
+        """Items dont de nouveaux événements rendent l'entrée obsolète"""
+        related = set(item_ids)
+        if isinstance(value, list):
+            for entry in value:
+                if isinstance(entry, dict) and "item_id" in entry:
+                    related.add(entry["item_id"])
+                elif isinstance(entry, dict) and "path" in entry:
+                    related.update(entry["path"])
+        return related
+
+    def _remove(self, key):
+        _, _, related = self._entries.pop(key)
+        for item_id in related:
+            keys = self._keys_by_item.get(item_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_item[item_id]
+
+    def _store(self, key, value, item_ids):
+        if key in self._entries:
+            self._remove(key)
+        related = self._related_items(item_ids, value)
+        self._entries[key] = (time.monotonic() + self.ttl, value, related)
+        for item_id in related:
+            self._keys_by_item[item_id].add(key)
+        while len(self._entries) > self.maxsize:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def get_or_compute(self, key, compute, item_ids=()):
+        """Renvoie la valeur en cache ou la calcule une seule fois pour tous les appelants"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return copy.deepcopy(entry[1])
+                self._remove(key)
+                self.expirations += 1
+
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight(item_ids)
+                self._inflight[key] = flight
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return copy.deepcopy(flight.value)
+
+        try:
+            value = compute()
+        except Exception as e:
+            flight.error = e
+            with self._lock:
+                del self._inflight[key]
+            flight.event.set()
+            raise
+
+        with self._lock:
+            # Un résultat invalidé pendant son calcul est renvoyé mais pas conservé
+            if not flight.invalidated:
+                self._store(key, copy.deepcopy(value), item_ids)
+            del self._inflight[key]
+        flight.value = copy.deepcopy(value)
+        flight.event.set()
+        return value
+
+    def invalidate_items(self, item_ids):
+        """Invalide les entrées concernées par de nouveaux achats ou consultations de ces items"""
+        item_ids = set(item_ids)
+        removed = 0
+        with self._lock:
+            for item_id in item_ids:
+                for key in list(self._keys_by_item.get(item_id, ())):
+                    if key in self._entries:
+                        self._remove(key)
+                        removed += 1
+            for flight in self._inflight.values():
+                if flight.item_ids.intersection(item_ids):
+                    flight.invalidated = True
+            self.invalidations += removed
+        return removed
+
+    def clear(self):
+        """Vide entièrement le cache"""
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_item.clear()
+            for flight in self._inflight.values():
+                flight.invalidated = True
@@ -0,0 +1,343 @@
+from datetime import datetime
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+import numpy as np
+import scipy.sparse as sp
+import pickle
+from .queries import recent_purchase_cutoff
+
+# Pondérations identiques à celles de la requête SQL de ProductRecommender
+DEFAULT_WEIGHTS = (2, 1.5, 3)
+
+# Valeur utilisée pour représenter une date absente (NULL / NaT)
+MISSING_TIMESTAMP = np.iinfo(np.int64).min
+
+# Matrices CSR de l'index, telles qu'enregistrées par EventSnapshot
+MATRICES = (
+    "bought_together", "unique_sessions", "view_purchase", "last_interaction",
+    "purchased", "recent_purchased", "scores",
+)
+
+
+def to_timestamps(values):
+    """Convertit une séquence de dates en secondes epoch (int64)"""
+    timestamps = np.array(values, dtype="datetime64[s]").astype(np.int64)
+    return timestamps
+
+
+def join_on_session(left_sessions, right_sessions):
+    """Retourne les paires d'indices (gauche, droite) partageant la même session"""
+    left_order = np.argsort(left_sessions, kind="stable")
+    right_order = np.argsort(right_sessions, kind="stable")
+    sorted_right = right_sessions[right_order]
+
+    start = np.searchsorted(sorted_right, left_sessions[left_order], side="left")
+    end = np.searchsorted(sorted_right, left_sessions[left_order], side="right")
+    counts = end - start
+
+    left_idx = np.repeat(left_order, counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    right_idx = right_order[np.repeat(start, counts) + offsets]
+    return left_idx, right_idx
+
+
+def max_by_pair(rows, cols, values, shape):
+    """Réduit des triplets (ligne, colonne, valeur) en matrice creuse du maximum par paire"""
+    if not len(rows):
+        return sp.csr_matrix(shape, dtype=np.float64)
+    codes = rows.astype(np.int64) * shape[1] + cols
+    order = np.argsort(codes, kind="stable")
+    unique_codes, first = np.unique(codes[order], return_index=True)
+    maxima = np.maximum.reduceat(values[order], first)
+    return sp.csr_matrix(
+        (maxima.astype(np.float64), (unique_codes // shape[1], unique_codes % shape[1])),
+        shape=shape
+    )
+
+
+def without_diagonal(matrix):
+    """Supprime les paires (item, item) d'une matrice item×item"""
+    coo = matrix.tocoo()
+    keep = coo.row != coo.col
+    result = sp.csr_matrix(
+        (coo.data[keep], (coo.row[keep], coo.col[keep])),
+        shape=matrix.shape
+    )
+    result.eliminate_zeros()
+    result.sort_indices()
+    return result
+
+
+def top_k(scores, tiebreak, k):
+    """Sélection partielle des k meilleurs scores, départagés par tiebreak décroissant"""
+    if k <= 0 or not len(scores):
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        # Seuil du k-ième score : on ne trie que les candidats au-dessus du seuil
+        threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+        candidates = np.flatnonzero(scores >= threshold)
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((-tiebreak[candidates], -scores[candidates]))
+    return candidates[order[:k]]
+
+
+def count_events(purchase_sessions, purchase_items, purchase_times,
+                 view_sessions, view_items, view_times, item_ids, cutoff_ts):
+    """Comptes de co-occurrence des événements sur l'univers d'items item_ids (trié)
+
+    Les sessions étant indépendantes, les comptes de fragments de sessions disjoints
+    s'additionnent (dernière interaction : maximum, incidences : empilement).
+    """
+    session_ids = np.unique(np.concatenate([purchase_sessions, view_sessions]))
+    n_items, n_sessions = len(item_ids), len(session_ids)
+
+    p_item = np.searchsorted(item_ids, purchase_items)
+    p_session = np.searchsorted(session_ids, purchase_sessions)
+    v_item = np.searchsorted(item_ids, view_items)
+    v_session = np.searchsorted(session_ids, view_sessions)
+
+    # Matrices d'incidence session×item des achats (toutes dates / 90 derniers jours)
+    ones = np.ones(len(p_item), dtype=np.float64)
+    purchased = sp.csr_matrix((ones, (p_session, p_item)), shape=(n_sessions, n_items))
+    recent_mask = purchase_times >= cutoff_ts
+    recent = sp.csr_matrix(
+        (ones[recent_mask], (p_session[recent_mask], p_item[recent_mask])),
+        shape=(n_sessions, n_items)
+    )
+
+    # Achetés ensemble : COUNT(*) et COUNT(DISTINCT session) des paires p1/p2
+    bought_together = without_diagonal(recent.T @ purchased)
+    unique_sessions = without_diagonal(
+        (recent > 0).astype(np.float64).T @ (purchased > 0).astype(np.float64)
+    )
+
+    # Consulté puis acheté : chaque consultation précédant un achat dans la session
+    left, right = join_on_session(v_session, p_session)
+    keep = (view_times[left] < purchase_times[right]) & (v_item[left] != p_item[right])
+    view_purchase = sp.csr_matrix(
+        (np.ones(keep.sum()), (v_item[left][keep], p_item[right][keep])),
+        shape=(n_items, n_items)
+    )
+
+    # Dernière interaction : achats puis consultations partageant une session
+    p_left, p_right = join_on_session(p_session, p_session)
+    v_left, v_right = join_on_session(v_session, v_session)
+    rows = np.concatenate([p_item[p_left], v_item[v_left]])
+    cols = np.concatenate([p_item[p_right], v_item[v_right]])
+    times = np.concatenate([purchase_times[p_right], view_times[v_right]])
+    valid = (rows != cols) & (times != MISSING_TIMESTAMP)
+    last_interaction = max_by_pair(rows[valid], cols[valid], times[valid], (n_items, n_items))
+
+    return {
+        "bought_together": bought_together,
+        "unique_sessions": unique_sessions,
+        "view_purchase": view_purchase,
+        "last_interaction": last_interaction,
+        "purchased": purchased,
+        "recent_purchased": recent,
+    }
+
+
+class CooccurrenceIndex:
+    """Index creux item×item chargé une fois en mémoire pour servir les recommandations"""
+
+    def __init__(self, item_ids, bought_together, unique_sessions, view_purchase,
+                 last_interaction, purchased, recent_purchased,
+                 weights=DEFAULT_WEIGHTS, built_at=None):
+        self.item_ids = np.asarray(item_ids, dtype=np.int64)
+        self.bought_together = bought_together.tocsr()
+        self.unique_sessions = unique_sessions.tocsr()
+        self.view_purchase = view_purchase.tocsr()
+        # Incidences session×item binaires, nécessaires au COUNT(DISTINCT session) multi-items
+        self.purchased = (purchased > 0).astype(np.float64).tocsr()
+        self.recent_purchased = (recent_purchased > 0).astype(np.float64).tocsr()
+        self.last_interaction = last_interaction.tocsr()
+        self.last_interaction.sort_indices()
+        self.weights = tuple(weights)
+        self.built_at = built_at or datetime.now()
+        self._positions = {int(item): pos for pos, item in enumerate(self.item_ids)}
+        self.scores = self._weighted_scores()
+
+    def _weighted_scores(self):
+        bt_weight, us_weight, vp_weight = self.weights
+        scores = (
+            self.bought_together * bt_weight
+            + self.unique_sessions * us_weight
+            + self.view_purchase * vp_weight
+        )
+        return without_diagonal(scores)
+
+    @classmethod
+    def from_matrices(cls, item_ids, matrices, weights=DEFAULT_WEIGHTS, built_at=None, scored_with=None):
+        """Reprend des matrices CSR déjà construites (voir MATRICES) sans les copier
+
+        Les tableaux peuvent être mappés en lecture seule : seul scores est recalculé,
+        et seulement si weights diffère des pondérations scored_with de matrices["scores"].
+        """
+        index = cls.__new__(cls)
+        index.item_ids = np.asarray(item_ids, dtype=np.int64)
+        for name in MATRICES[:-1]:
+            setattr(index, name, matrices[name])
+        index.weights = tuple(weights)
+        index.built_at = built_at or datetime.now()
+        index._positions = {int(item): pos for pos, item in enumerate(index.item_ids)}
+        if scored_with is not None and tuple(scored_with) == index.weights:
+            index.scores = matrices["scores"]
+        else:
+            index.scores = index._weighted_scores()
+        return index
+
+    @classmethod
+    def load(cls, db: Session, today=None, weights=DEFAULT_WEIGHTS):
+        """Charge purchases et sessions depuis la base et construit l'index"""
+        purchases = db.execute(
+            text("SELECT session_id, item_id, purchase_date FROM purchases")
+        ).fetchall()
+        sessions = db.execute(
+            text("SELECT session_id, item_id, view_date FROM sessions")
+        ).fetchall()
+
+        return cls.from_events(
+            np.array([row[0] for row in purchases], dtype=np.int64),
+            np.array([row[1] for row in purchases], dtype=np.int64),
+            to_timestamps([row[2] for row in purchases]),
+            np.array([row[0] for row in sessions], dtype=np.int64),
+            np.array([row[1] for row in sessions], dtype=np.int64),
+            to_timestamps([row[2] for row in sessions]),
+            today=today,
+            weights=weights
+        )
+
+    @classmethod
+    def from_snapshot(cls, snapshot, weights=DEFAULT_WEIGHTS):
+        """Ouvre l'index enregistré dans un EventSnapshot, sans requête en base ni reconstruction
+
+        Les matrices restent mappées sur les fichiers de l'instantané, partagées entre processus ;
+        la fenêtre de 90 jours est celle du jour de l'export.
+        """
+        return cls.from_matrices(
+            snapshot.item_ids,
+            snapshot.index_matrices,
+            weights=weights,
+            built_at=datetime.fromisoformat(snapshot.manifest["created_at"]),
+            scored_with=snapshot.manifest["index"]["weights"]
+        )
+
+    @classmethod
+    def from_events(cls, purchase_sessions, purchase_items, purchase_times,
+                    view_sessions, view_items, view_times, today=None,
+                    weights=DEFAULT_WEIGHTS):
+        """Construit l'index à partir des tableaux (session, item, timestamp) des deux tables"""
+        item_ids = np.unique(np.concatenate([purchase_items, view_items]))
+        counts = count_events(
+            purchase_sessions, purchase_items, purchase_times,
+            view_sessions, view_items, view_times,
+            item_ids, to_timestamps([recent_purchase_cutoff(today)])[0]
+        )
+        return cls(item_ids, weights=weights, **counts)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def open(path):
+        """Relit un index enregistré par save"""
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def __contains__(self, item_id):
+        return item_id in self._positions
+
+    def position(self, item_id):
+        """Ligne de l'item dans les matrices, None s'il est inconnu"""
+        return self._positions.get(item_id)
+
+    def _last_interactions(self, position, columns):
+        """Récupère la dernière interaction des colonnes demandées (-inf si absente)"""
+        start, end = self.last_interaction.indptr[position:position + 2]
+        known = self.last_interaction.indices[start:end]
+        values = np.full(len(columns), -np.inf)
+        if len(known):
+            found = np.searchsorted(known, columns)
+            found = np.minimum(found, len(known) - 1)
+            match = known[found] == columns
+            values[match] = self.last_interaction.data[start:end][found[match]]
+        return values
+
+    def recommend(self, item_id, num_recommendations=5):
+        """Recommande des produits pour un item par lecture de ligne et sélection top-k"""
+        position = self._positions.get(item_id)
+        if position is None:
+            return []
+
+        start, end = self.scores.indptr[position:position + 2]
+        columns = self.scores.indices[start:end]
+        scores = self.scores.data[start:end]
+        if not len(columns):
+            return []
+
+        best = top_k(scores, self._last_interactions(position, columns), num_recommendations)
+        return [
+            {"item_id": int(self.item_ids[columns[i]]), "score": float(scores[i])}
+            for i in best
+        ]
+
+    def recommend_each(self, item_ids, num_recommendations=5):
+        """Recommandations individuelles de plusieurs items sources"""
+        return {item_id: self.recommend(item_id, num_recommendations) for item_id in item_ids}
+
+    def _basket_matrix(self, baskets):
+        """Construit la matrice binaire panier×item des items connus de l'index"""
+        rows, columns = [], []
+        for row, basket in enumerate(baskets):
+            positions = {self._positions[item] for item in basket if item in self._positions}
+            rows.extend([row] * len(positions))
+            columns.extend(positions)
+        return sp.csr_matrix(
+            (np.ones(len(rows)), (rows, columns)),
+            shape=(len(baskets), len(self.item_ids))
+        )
+
+    def recommend_baskets(self, baskets, num_recommendations=5):
+        """Recommande des produits pour plusieurs paniers en un seul calcul matriciel"""
+        seeds = self._basket_matrix(baskets)
+        bt_weight, us_weight, vp_weight = self.weights
+
+        # Les comptes par paire s'additionnent directement sur les lignes des items sources
+        bought_together = seeds @ self.bought_together
+        view_purchase = seeds @ self.view_purchase
+        # Les sessions distinctes se recalculent via les sessions récentes de chaque panier
+        basket_sessions = ((seeds @ self.recent_purchased.T) > 0).astype(np.float64)
+        unique_sessions = basket_sessions @ self.purchased
+
+        scores = (
+            bought_together * bt_weight
+            + unique_sessions * us_weight
+            + view_purchase * vp_weight
+        )
+        # Seuls les items achetés ensemble sont candidats, hors items du panier
+        scores = scores.multiply(bought_together > 0)
+        scores = (scores - scores.multiply(seeds)).tocsr()
+        scores.eliminate_zeros()
+
+        results = []
+        for row in range(len(baskets)):
+            start, end = scores.indptr[row:row + 2]
+            columns = scores.indices[start:end]
+            values = scores.data[start:end]
+            if num_recommendations < len(values):
+                best = np.argpartition(-values, num_recommendations - 1)[:num_recommendations]
+            else:
+                best = np.arange(len(values))
+            best = best[np.argsort(-values[best], kind="stable")]
+            results.append([
+                {"item_id": int(self.item_ids[columns[i]]), "score": float(values[i])}
+                for i in best
+            ])
+        return results
+
+    def recommend_many(self, item_ids, num_recommendations=5):
+        """Recommande des produits basés sur plusieurs items d'entrée"""
+        return self.recommend_baskets([item_ids], num_recommendations)[0]
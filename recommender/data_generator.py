@@ -0,0 +1,105 @@
+from sqlalchemy import create_engine
+from datetime import datetime, timedelta
+from .models import Base, Purchase, Session, event_rows
+import numpy as np
+
+# Taille des lots d'insertion (executemany)
+INSERT_CHUNK_SIZE = 50000
+
+
+def zipf_popularity(num_items, exponent=1.1):
+    """Probabilités de consultation suivant une loi de Zipf sur le rang de l'item"""
+    ranks = np.arange(1, num_items + 1, dtype=np.float64)
+    weights = ranks ** -exponent
+    return weights / weights.sum()
+
+
+def generate_events(num_sessions, num_items, views_per_session=5, purchase_rate=0.2,
+                    zipf_exponent=1.1, months=6, end=None, seed=0):
+    """Génère des consultations et achats réalistes sous forme de tableaux NumPy
+
+    Chaque table est renvoyée comme un tuple (session_ids, item_ids, dates datetime64[s]).
+    """
+    rng = np.random.default_rng(seed)
+    end = np.datetime64(end or datetime.now(), "s")
+    span_seconds = int(months * 30 * 24 * 3600)
+
+    # Nombre de consultations par session (au moins une)
+    views_count = rng.poisson(max(views_per_session - 1, 0), num_sessions) + 1
+    session_ids = np.repeat(np.arange(1, num_sessions + 1, dtype=np.int64), views_count)
+    session_starts = end - rng.integers(0, span_seconds, num_sessions).astype("timedelta64[s]")
+
+    # Les item_id suivent l'ordre de popularité : l'item 1 est le plus consulté
+    item_ids = rng.choice(num_items, size=len(session_ids), p=zipf_popularity(num_items, zipf_exponent)) + 1
+
+    # Consultations espacées de quelques secondes à quelques minutes dans la session
+    gaps = rng.integers(5, 600, len(session_ids))
+    first_of_session = np.concatenate([[0], np.cumsum(views_count)[:-1]])
+    offsets = np.cumsum(gaps) - np.repeat(np.cumsum(gaps)[first_of_session] - gaps[first_of_session], views_count)
+    view_dates = np.repeat(session_starts, views_count) + offsets.astype("timedelta64[s]")
+
+    views = np.unique(
+        np.rec.fromarrays([session_ids, item_ids, view_dates.astype(np.int64)]),
+    )
+    view_sessions = views.f0.astype(np.int64)
+    view_items = views.f1.astype(np.int64)
+    view_dates = views.f2.astype("datetime64[s]")
+
+    # Une partie des items consultés est achetée quelques minutes plus tard
+    bought = rng.random(len(views)) < purchase_rate
+    purchase_keys, first = np.unique(
+        view_sessions[bought] * (num_items + 1) + view_items[bought], return_index=True
+    )
+    purchase_sessions = view_sessions[bought][first]
+    purchase_items = view_items[bought][first]
+    purchase_dates = view_dates[bought][first] + rng.integers(60, 1800, len(first)).astype("timedelta64[s]")
+
+    return (
+        (purchase_sessions, purchase_items, purchase_dates),
+        (view_sessions, view_items, view_dates),
+    )
+
+
+def load_events(engine, purchases, sessions, replace=True, chunk_size=INSERT_CHUNK_SIZE):
+    """Charge les événements générés en base par lots multi-lignes"""
+    Base.metadata.create_all(engine, tables=[Purchase.__table__, Session.__table__])
+
+    with engine.begin() as conn:
+        if replace:
+            conn.execute(Purchase.__table__.delete())
+            conn.execute(Session.__table__.delete())
+
+        for table, columns, events in (
+            (Purchase.__table__, ("session_id", "item_id", "purchase_date"), purchases),
+            (Session.__table__, ("session_id", "item_id", "view_date"), sessions),
+        ):
+            for start in range(0, len(events[0]), chunk_size):
+                chunk = [column[start:start + chunk_size] for column in events]
+                conn.execute(table.insert(), event_rows(columns, *chunk))
+
+    return len(purchases[0]), len(sessions[0])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Génération d'un jeu de données synthétique")
+    parser.add_argument("--url", default="sqlite:///recommandation_bench.db")
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--views-per-session", type=float, default=5)
+    parser.add_argument("--purchase-rate", type=float, default=0.2)
+    parser.add_argument("--months", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    purchases, sessions = generate_events(
+        args.sessions,
+        args.items,
+        views_per_session=args.views_per_session,
+        purchase_rate=args.purchase_rate,
+        months=args.months,
+        seed=args.seed
+    )
+    num_purchases, num_views = load_events(create_engine(args.url), purchases, sessions)
+    print(f"✅ {num_purchases} achats et {num_views} consultations chargés dans {args.url}")
@@ -1,12 +1,35 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, scoped_session
+from .metrics import instrument_engine
 import os
 
-DATABASE_URL = "mysql://root:@localhost/recommandation_system"
+# Surchargeable (ex. sqlite:///recommandation.db pour les tests de charge en local)
+DATABASE_URL = os.environ.get("DATABASE_URL", "mysql://root:@localhost/recommandation_system")
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+# Pool dimensionné pour le service HTTP : une connexion par thread de requête, plus une réserve
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+# Recyclage avant le wait_timeout de MySQL pour ne jamais réutiliser une connexion fermée
+POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", 30))
+
+def engine_options(url):
+    """Options du pool ; SQLite n'utilise pas de QueuePool et les refuse"""
+    options = {"pool_pre_ping": True}
+    if not url.startswith("sqlite"):
+        options.update(
+            pool_size=POOL_SIZE,
+            max_overflow=MAX_OVERFLOW,
+            pool_recycle=POOL_RECYCLE,
+            pool_timeout=POOL_TIMEOUT
+        )
+    return options
+
+engine = instrument_engine(create_engine(DATABASE_URL, **engine_options(DATABASE_URL)))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Session propre à chaque thread (requête HTTP, exécution Streamlit), libérée par remove()
+ScopedSession = scoped_session(SessionLocal)
 Base = declarative_base()
 
 def get_db():
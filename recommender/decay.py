@@ -0,0 +1,219 @@
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from collections import defaultdict
+from .cooccurrence_index import DEFAULT_WEIGHTS
+from .queries import get_queries
+from .models import Base, DecayedRecommendation, DecayState, WeightedRecommendation
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+BOUGHT_TOGETHER = "BOUGHT_TOGETHER"
+VIEW_TO_PURCHASE = "VIEW_TO_PURCHASE"
+STATE_NAME = "decayed_recommendations"
+DEFAULT_HALF_LIFE = timedelta(days=30)
+# Premier passage : toutes les lignes sont nouvelles
+EPOCH = datetime(1970, 1, 1)
+# Lignes recomptées en deçà du watermark (transactions validées en retard), comme pour refresher.py
+RESCAN_WINDOW = timedelta(minutes=10)
+SOURCE_CHUNK_SIZE = 1000
+
+
+class DecayedScores:
+    """Scores de co-occurrence à décroissance exponentielle, sans fenêtre temporelle
+
+    Chaque paire conserve un compte décru et la date de sa dernière mise à jour ; la
+    décroissance jusqu'à l'instant de lecture est appliquée à la volée. Les paires touchées
+    par des lignes ingérées depuis watermark - rescan_window sont recalculées sur tout leur
+    historique dans la base (INSERT ... SELECT) : recompter une paire est sans effet. La
+    demi-vie est enregistrée avec la table : une instance configurée autrement refuse de la
+    lire tant qu'elle n'est pas reconstruite (reset).
+    """
+
+    def __init__(self, db: Session, half_life=DEFAULT_HALF_LIFE, weights=DEFAULT_WEIGHTS,
+                 rescan_window=RESCAN_WINDOW):
+        self.db = db
+        self.queries = get_queries(db.get_bind())
+        self.half_life = half_life
+        # Une paire achetée ensemble l'est dans une session distincte : COUNT(*) = COUNT(DISTINCT session)
+        bt_weight, us_weight, vp_weight = weights
+        self.type_weights = {BOUGHT_TOGETHER: bt_weight + us_weight, VIEW_TO_PURCHASE: vp_weight}
+        self.rescan_window = rescan_window
+        self.watermark = None
+        self._checked = False
+
+    def ensure_tables(self):
+        Base.metadata.create_all(
+            self.db.get_bind(),
+            tables=[DecayedRecommendation.__table__, DecayState.__table__, WeightedRecommendation.__table__]
+        )
+
+    def decay(self, elapsed):
+        """Facteur de décroissance pour une durée écoulée (1 à 0, divisé par 2 à chaque demi-vie)"""
+        return 0.5 ** (max(elapsed.total_seconds(), 0) / self.half_life.total_seconds())
+
+    def load_state(self):
+        """Lit l'état de la table et refuse une demi-vie différente de celle de la construction"""
+        state = self.db.get(DecayState, STATE_NAME)
+        if state is not None and abs(state.half_life_seconds - self.half_life.total_seconds()) > 1e-6:
+            raise ValueError(
+                f"decayed_recommendations a été construite avec une demi-vie de "
+                f"{timedelta(seconds=state.half_life_seconds)}, pas {self.half_life} : reset() nécessaire"
+            )
+        self.watermark = state.watermark if state else None
+        self._checked = True
+        return state
+
+    def _save_state(self, state, watermark):
+        if state is None:
+            self.db.add(DecayState(
+                name=STATE_NAME, half_life_seconds=self.half_life.total_seconds(), watermark=watermark
+            ))
+        else:
+            state.watermark = watermark
+        self.watermark = watermark
+
+    def _ingested_until(self):
+        """Borne haute des lignes à compter : horloge de la base"""
+        return self.db.execute(self.queries["database_now"]).scalar()
+
+    def _load_states(self, source_ids):
+        """État (compte, compte décru, date) de toutes les paires des items sources"""
+        states = {}
+        source_ids = sorted(source_ids)
+        for start in range(0, len(source_ids), SOURCE_CHUNK_SIZE):
+            rows = self.db.execute(
+                self.queries["decay_source_states"],
+                {"source_ids": source_ids[start:start + SOURCE_CHUNK_SIZE]}
+            )
+            for source, recommended, recommendation_type, count, decayed_count, updated_at in rows:
+                states[(source, recommended, recommendation_type)] = (count, decayed_count, updated_at)
+        return states
+
+    def update(self, now=None, until=None):
+        """Recalcule les paires dont un événement a été ingéré depuis le watermark moins rescan_window
+
+        now est l'instant auquel les comptes sont décrus ; until, la borne haute
+        d'ingestion (par défaut l'horloge de la base).
+        """
+        now = now or datetime.now()
+        started = time.perf_counter()
+        pairs = 0
+        try:
+            state = self.load_state()
+            low = self.watermark
+            high = until or self._ingested_until()
+            if low is None:
+                self.db.execute(DecayedRecommendation.__table__.delete())
+            params = {
+                "low": low - self.rescan_window if low is not None else EPOCH,
+                "high": high,
+                "now": now,
+                "half_life_seconds": self.half_life.total_seconds(),
+            }
+            for name in ("decay_bought_together_merge", "decay_view_to_purchase_merge"):
+                pairs += self.db.execute(self.queries[name], params).rowcount
+            self._save_state(state, max(high, low or EPOCH))
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Erreur lors de la mise à jour des scores décroissants: {str(e)}")
+            raise
+
+        stats = {
+            "watermark": self.watermark,
+            "updated_pairs": pairs,
+            "duration_seconds": time.perf_counter() - started,
+        }
+        logger.info(f"Scores décroissants mis à jour: {stats}")
+        return stats
+
+    def run_forever(self, interval_seconds=60):
+        """Boucle de mise à jour, comme IncrementalRefresher.run_forever"""
+        while True:
+            try:
+                self.update()
+            except Exception:
+                # L'erreur est déjà journalisée : on retente au prochain cycle
+                pass
+            time.sleep(interval_seconds)
+
+    def reset(self):
+        """Vide la table et son état ; la prochaine mise à jour la reconstruit avec la demi-vie courante"""
+        self.db.execute(DecayedRecommendation.__table__.delete())
+        self.db.execute(DecayState.__table__.delete().where(DecayState.name == STATE_NAME))
+        self.db.commit()
+        self.watermark = None
+        self._checked = False
+
+    def _decayed_scores(self, source_ids, now):
+        """Score décru à now de chaque item recommandé, sommé sur les sources"""
+        if not self._checked:
+            self.load_state()
+        decayed = defaultdict(float)
+        for (source, recommended, recommendation_type), (count, decayed_count, updated_at) in \
+                self._load_states(source_ids).items():
+            weight = self.type_weights.get(recommendation_type, 0)
+            decayed[recommended] += weight * decayed_count * self.decay(now - updated_at)
+        return decayed
+
+    def _weighted_scores(self, source_ids, item_ids):
+        """Score de recommend_for_product (fenêtre de 90 jours) lu dans weighted_recommendations
+
+        La table est tenue à jour par refresher.py ; une paire absente n'a pas de score
+        sur la fenêtre.
+        """
+        weighted = defaultdict(float)
+        if item_ids:
+            rows = self.db.execute(self.queries["decay_weighted_scores"], {
+                "source_ids": sorted(source_ids),
+                "item_ids": sorted(item_ids),
+            })
+            for _, recommended, score in rows:
+                weighted[recommended] += score
+        return weighted
+
+    def _top(self, source_ids, num_recommendations, now, exclude=()):
+        decayed = self._decayed_scores(source_ids, now)
+        ranked = sorted(
+            (item for item in decayed if item not in exclude),
+            key=lambda item: (-decayed[item], item)
+        )[:num_recommendations]
+        weighted = self._weighted_scores(source_ids, ranked)
+        return [
+            {"item_id": item, "score": weighted[item], "decayed_score": decayed[item]}
+            for item in ranked
+        ]
+
+    def recommend(self, item_id, num_recommendations=5, now=None):
+        """Recommandations classées par score décru ; "score" est celui de recommend_for_product"""
+        return self._top([item_id], num_recommendations, now or datetime.now())
+
+    def recommend_many(self, item_ids, num_recommendations=5, now=None):
+        """Recommandations d'un ensemble d'items (scores sommés sur les sources)"""
+        return self._top(set(item_ids), num_recommendations, now or datetime.now(), exclude=set(item_ids))
+
+
+if __name__ == "__main__":
+    import argparse
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Mise à jour des scores à décroissance exponentielle")
+    parser.add_argument("--half-life-days", type=float, default=DEFAULT_HALF_LIFE.days)
+    parser.add_argument("--reset", action="store_true",
+                        help="Reconstruit la table depuis tout l'historique (changement de demi-vie)")
+    parser.add_argument("--loop", type=int, default=None, metavar="SECONDES",
+                        help="Relance la mise à jour toutes les SECONDES secondes")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    scores = DecayedScores(db, half_life=timedelta(days=args.half_life_days))
+    scores.ensure_tables()
+    if args.reset:
+        scores.reset()
+    if args.loop:
+        scores.run_forever(args.loop)
+    else:
+        print(scores.update())
@@ -0,0 +1,216 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import product
+import numpy as np
+import scipy.sparse as sp
+import logging
+import time
+from .cooccurrence_index import DEFAULT_WEIGHTS, to_timestamps
+from .parallel_builder import ParallelCooccurrenceBuilder
+
+logger = logging.getLogger(__name__)
+
+# Cellules denses (sessions × items) scorées par bloc : borne la mémoire du top-k
+EVAL_CHUNK_CELLS = 20_000_000
+DEFAULT_KS = (5, 10, 20)
+# Grille par défaut des poids (bought_together, unique_sessions, view_purchase)
+DEFAULT_GRID = ((1, 2, 3), (0, 1.5, 3), (0, 1.5, 3, 5))
+
+
+def _as_events(table):
+    sessions, items, times = table
+    return np.asarray(sessions, dtype=np.int64), np.asarray(items, dtype=np.int64), to_timestamps(times)
+
+
+def time_split(events, split_at=None, train_fraction=0.8):
+    """Sépare les événements à la date split_at (par défaut le quantile train_fraction des achats)
+
+    L'entraînement reçoit tous les événements antérieurs à split_at ; le test, les
+    sessions qui commencent après : aucune information du test ne fuit dans le modèle.
+    """
+    purchases, views = (_as_events(table) for table in events)
+    if split_at is None:
+        split_ts = int(np.quantile(purchases[2], train_fraction))
+    else:
+        split_ts = int(to_timestamps([split_at])[0])
+
+    # Début de chaque session : premier événement, toutes tables confondues
+    session_ids, inverse = np.unique(np.concatenate([purchases[0], views[0]]), return_inverse=True)
+    starts = np.full(len(session_ids), np.iinfo(np.int64).max)
+    np.minimum.at(starts, inverse, np.concatenate([purchases[2], views[2]]))
+    test_sessions = session_ids[starts >= split_ts]
+
+    train = tuple(tuple(column[table[2] < split_ts] for column in table) for table in (purchases, views))
+    test = tuple(tuple(column[np.isin(table[0], test_sessions)] for column in table) for table in (purchases, views))
+    return train, test, np.datetime64(split_ts, "s").astype(datetime)
+
+
+def heldout_sessions(test_purchases, num_seeds=1):
+    """Graines (premiers items achetés) et cibles (items achetés ensuite) des sessions de test
+
+    Renvoie (session, item, est_une_graine) d'un achat par paire (session, item), pour
+    les sessions ayant au moins une cible.
+    """
+    sessions, items, times = test_purchases
+    order = np.lexsort((times, sessions))
+    sessions, items = sessions[order], items[order]
+    # Premier achat de chaque paire (session, item), dans l'ordre chronologique
+    _, first = np.unique(np.stack([sessions, items], axis=1), axis=0, return_index=True)
+    first = np.sort(first)
+    sessions, items = sessions[first], items[first]
+
+    session_ids, starts, counts = np.unique(sessions, return_index=True, return_counts=True)
+    rank = np.arange(len(sessions)) - np.repeat(starts, counts)
+    keep = np.repeat(counts > num_seeds, counts)
+    return sessions[keep], items[keep], rank[keep] < num_seeds
+
+
+class EvaluationSet:
+    """Composantes de score des sessions de test face à un index d'entraînement
+
+    Les composantes (bought_together, unique_sessions, view_purchase) ne dépendent pas
+    des poids : elles sont calculées une fois, en un produit matriciel pour toutes les
+    sessions, puis chaque jeu de poids n'est qu'une combinaison linéaire suivie d'un top-k.
+    Mêmes scores que recommend_for_products (recommend_for_product avec une graine).
+    """
+
+    def __init__(self, index, sessions, items, is_seed):
+        self.item_ids = index.item_ids
+        _, rows = np.unique(sessions, return_inverse=True)
+        self.num_sessions = int(rows.max()) + 1 if len(rows) else 0
+        shape = (self.num_sessions, len(index.item_ids))
+
+        # Les items inconnus de l'entraînement restent des cibles manquées
+        known = np.isin(items, index.item_ids)
+        positions = np.searchsorted(index.item_ids, items[known])
+        self.num_targets = np.bincount(rows[~is_seed], minlength=self.num_sessions)
+
+        def incidence(mask):
+            return sp.csr_matrix(
+                (np.ones(mask.sum()), (rows[known][mask], positions[mask])), shape=shape
+            )
+
+        self.seeds = incidence(is_seed[known])
+        self.targets = incidence(~is_seed[known])
+        self.bought_together = (self.seeds @ index.bought_together).tocsr()
+        self.view_purchase = (self.seeds @ index.view_purchase).tocsr()
+        basket_sessions = ((self.seeds @ index.recent_purchased.T) > 0).astype(np.float64)
+        self.unique_sessions = (basket_sessions @ index.purchased).tocsr()
+
+    @classmethod
+    def from_split(cls, index, test_events, num_seeds=1):
+        return cls(index, *heldout_sessions(test_events[0], num_seeds))
+
+    def _chunks(self):
+        size = max(1, EVAL_CHUNK_CELLS // max(len(self.item_ids), 1))
+        for start in range(0, self.num_sessions, size):
+            yield slice(start, min(start + size, self.num_sessions))
+
+    def evaluate(self, weights=DEFAULT_WEIGHTS, ks=DEFAULT_KS):
+        """hit-rate@k, recall@k et MRR@k des recommandations avec ces poids
+
+        Les ex-aequo au k-ième rang sont départagés arbitrairement, comme dans recommend_baskets.
+        """
+        bt_weight, us_weight, vp_weight = weights
+        max_k = min(max(ks), len(self.item_ids))
+        hits = np.zeros((self.num_sessions, max_k), dtype=bool)
+
+        for rows in self._chunks():
+            bought_together = self.bought_together[rows].toarray()
+            scores = (
+                bought_together * bt_weight
+                + self.unique_sessions[rows].toarray() * us_weight
+                + self.view_purchase[rows].toarray() * vp_weight
+            )
+            # Seuls les items achetés ensemble sont candidats, hors graines
+            scores[(bought_together <= 0) | (self.seeds[rows].toarray() > 0)] = -np.inf
+
+            best = np.argpartition(-scores, max_k - 1, axis=1)[:, :max_k]
+            best_scores = np.take_along_axis(scores, best, axis=1)
+            order = np.argsort(-best_scores, axis=1, kind="stable")
+            best = np.take_along_axis(best, order, axis=1)
+            ranked = np.isfinite(np.take_along_axis(best_scores, order, axis=1))
+            hits[rows] = np.take_along_axis(self.targets[rows].toarray() > 0, best, axis=1) & ranked
+
+        first_hit = np.where(hits.any(axis=1), hits.argmax(axis=1), max_k)
+        result = {"weights": tuple(weights), "sessions": self.num_sessions}
+        for k in ks:
+            k_hits = hits[:, :min(k, max_k)]
+            result[f"hit_rate@{k}"] = float(k_hits.any(axis=1).mean()) if self.num_sessions else 0.0
+            result[f"recall@{k}"] = float((k_hits.sum(axis=1) / self.num_targets).mean()) if self.num_sessions else 0.0
+            reciprocal = np.where(first_hit < k, 1.0 / (first_hit + 1), 0.0)
+            result[f"mrr@{k}"] = float(reciprocal.mean()) if self.num_sessions else 0.0
+        return result
+
+
+# Jeu d'évaluation propre à chaque processus du pool, transmis par _init_eval_worker
+_worker_evaluation = None
+
+
+def _init_eval_worker(evaluation):
+    global _worker_evaluation
+    _worker_evaluation = evaluation
+
+
+def _evaluate_weights(args):
+    weights, ks = args
+    return _worker_evaluation.evaluate(weights, ks)
+
+
+def grid_search(evaluation, grid=DEFAULT_GRID, ks=DEFAULT_KS, metric="recall@10", workers=1):
+    """Évalue chaque combinaison de poids de la grille, triées par metric décroissante
+
+    Avec workers > 1, les combinaisons sont réparties entre processus ; le jeu
+    d'évaluation n'est transmis qu'une fois à chacun.
+    """
+    started = time.perf_counter()
+    tasks = [(weights, ks) for weights in product(*grid)]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_eval_worker, initargs=(evaluation,)) as executor:
+            results = list(executor.map(_evaluate_weights, tasks))
+    else:
+        results = [evaluation.evaluate(weights, ks) for weights, ks in tasks]
+    logger.info(f"{len(tasks)} jeux de poids évalués en {time.perf_counter() - started:.1f} s ({workers} workers)")
+    return sorted(results, key=lambda result: -result[metric])
+
+
+def evaluate_events(events, split_at=None, train_fraction=0.8, num_seeds=1, workers=1):
+    """Découpage temporel, index d'entraînement et jeu d'évaluation des sessions de test"""
+    train, test, split_at = time_split(events, split_at, train_fraction)
+    index = ParallelCooccurrenceBuilder(workers=workers).build_index(train, today=split_at.date())
+    evaluation = EvaluationSet.from_split(index, test, num_seeds)
+    logger.info(f"Découpage au {split_at}: {evaluation.num_sessions} sessions de test, {len(index.item_ids)} items")
+    return evaluation
+
+
+if __name__ == "__main__":
+    import argparse
+    import pandas as pd
+    from .database import SessionLocal
+    from .snapshot import EventSnapshot
+
+    parser = argparse.ArgumentParser(description="Évaluation hors ligne des recommandations par rejeu temporel")
+    parser.add_argument("--snapshot", default=None, help="Instantané EventSnapshot à lire plutôt que la base")
+    parser.add_argument("--split", default=None, help="Date de découpage AAAA-MM-JJ (défaut : quantile --train-fraction)")
+    parser.add_argument("--train-fraction", type=float, default=0.8)
+    parser.add_argument("--num-seeds", type=int, default=1, help="Premiers achats de chaque session servant de graines")
+    parser.add_argument("-k", type=int, nargs="+", default=list(DEFAULT_KS))
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--grid-search", action="store_true", help="Recherche des poids sur DEFAULT_GRID")
+    parser.add_argument("--metric", default="recall@10")
+    parser.add_argument("--output", default=None, help="CSV des résultats de la grille")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    snapshot = EventSnapshot.open(args.snapshot) if args.snapshot else None
+    events = ParallelCooccurrenceBuilder.load_events(SessionLocal(), snapshot=snapshot)
+    split_at = datetime.strptime(args.split, "%Y-%m-%d") if args.split else None
+    evaluation = evaluate_events(events, split_at, args.train_fraction, args.num_seeds, args.workers)
+
+    if args.grid_search:
+        results = pd.DataFrame(grid_search(evaluation, ks=args.k, metric=args.metric, workers=args.workers))
+        if args.output:
+            results.to_csv(args.output, index=False)
+        print(results.head(10).to_string(index=False))
+    else:
+        print(evaluation.evaluate(DEFAULT_WEIGHTS, args.k))
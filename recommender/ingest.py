@@ -0,0 +1,220 @@
+from sqlalchemy import text
+from .models import Base, Purchase, Session, event_rows
+from .queries import get_queries
+import numpy as np
+import pandas as pd
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Lignes lues, écrites et validées (commit) par lot
+INGEST_CHUNK_SIZE = 50000
+
+# Table cible, requête d'upsert et colonnes de chaque type d'événement
+EVENT_TABLES = {
+    "purchases": (Purchase.__table__, "purchase_upsert", ("session_id", "item_id", "purchase_date")),
+    "views": (Session.__table__, "view_upsert", ("session_id", "item_id", "view_date")),
+}
+# Noms acceptés pour la colonne de date des fichiers, en plus de celle de la table
+DATE_ALIASES = ("timestamp", "date", "event_date")
+JSONL_EXTENSIONS = (".jsonl", ".ndjson", ".json")
+
+
+def _event_arrays(frame, date_column):
+    """(session_ids, item_ids, dates datetime64[s]) d'un bloc lu, au format de generate_events"""
+    for column in (date_column, *DATE_ALIASES):
+        if column in frame.columns:
+            break
+    else:
+        raise ValueError(f"Colonne de date absente (attendu: {date_column} ou {', '.join(DATE_ALIASES)})")
+    # Dates avec fuseau ramenées en UTC naïf, dates naïves conservées telles quelles
+    dates = pd.to_datetime(frame[column], utc=True).dt.tz_localize(None)
+    return (
+        frame["session_id"].to_numpy(dtype=np.int64),
+        frame["item_id"].to_numpy(dtype=np.int64),
+        dates.to_numpy().astype("datetime64[s]"),
+    )
+
+
+def read_event_chunks(path, table, chunk_size=INGEST_CHUNK_SIZE, fmt=None):
+    """Lit un fichier CSV ou JSONL (éventuellement compressé) par blocs de chunk_size lignes"""
+    _, _, columns = EVENT_TABLES[table]
+    name = path[:-3] if path.endswith(".gz") else path
+    fmt = fmt or ("jsonl" if name.endswith(JSONL_EXTENSIONS) else "csv")
+    if fmt == "jsonl":
+        reader = pd.read_json(path, lines=True, chunksize=chunk_size, convert_dates=False, dtype=False)
+    else:
+        reader = pd.read_csv(path, chunksize=chunk_size)
+    with reader:
+        for frame in reader:
+            yield _event_arrays(frame, columns[2])
+
+
+def validator_listener(validator):
+    """Ajoute les items ingérés à l'ensemble en mémoire d'un ItemValidator"""
+    return lambda table, events: validator.add_items(np.unique(events[1]))
+
+
+def cache_listener(cache):
+    """Invalide les entrées d'un RecommendationCache concernées par les items ingérés"""
+    return lambda table, events: cache.invalidate_items(np.unique(events[1]).tolist())
+
+
+def popularity_listener(tracker):
+    """Ajoute les achats ingérés aux compteurs d'un PopularityTracker (les degrés suivent refresher.py)"""
+    def listener(table, events):
+        if table == "purchases":
+            tracker.record_purchases(events)
+    return listener
+
+
+def live_session_listener(store):
+    """Rejoue les événements ingérés dans un LiveSessionStore, dans l'ordre chronologique"""
+    def listener(table, events):
+        record = store.buy if table == "purchases" else store.view
+        for position in np.argsort(events[2], kind="stable"):
+            record(int(events[0][position]), int(events[1][position]))
+    return listener
+
+
+class EventIngester:
+    """Chargement en masse d'événements, idempotent (upsert sur la clé primaire)
+
+    Chaque lot est écrit en un executemany puis validé : une ingestion interrompue
+    peut être relancée sur le même fichier. Les listeners reçoivent chaque lot validé
+    (table, (session_ids, item_ids, dates)) ; les rafraîchissements (on_complete)
+    sont lancés une fois l'ingestion terminée.
+    """
+
+    def __init__(self, engine, chunk_size=INGEST_CHUNK_SIZE, listeners=(), on_complete=()):
+        self.engine = engine
+        self.chunk_size = chunk_size
+        self.queries = get_queries(engine)
+        self.listeners = list(listeners)
+        self.on_complete = list(on_complete)
+
+    def ensure_tables(self):
+        Base.metadata.create_all(self.engine, tables=[Purchase.__table__, Session.__table__])
+
+    def _write_chunk(self, table, events):
+        _, statement, columns = EVENT_TABLES[table]
+        with self.engine.begin() as conn:
+            conn.execute(self.queries[statement], event_rows(columns, *events))
+        for listener in self.listeners:
+            listener(table, events)
+
+    def _finish(self, table, rows, chunks, started, counted="rows_sent"):
+        """Statistiques de débit ; counted nomme ce que rows compte
+
+        rows_sent : lignes envoyées à la base, doublons ignorés par l'upsert compris.
+        rows_inserted : lignes réellement insérées (rowcount de LOAD DATA ... IGNORE).
+        """
+        elapsed = time.perf_counter() - started
+        for refresh in self.on_complete:
+            refresh()
+        stats = {
+            "table": table,
+            counted: rows,
+            "chunks": chunks,
+            "seconds": elapsed,
+            "rows_per_second": rows / elapsed if elapsed else 0.0,
+        }
+        logger.info(f"Ingestion terminée: {stats}")
+        return stats
+
+    def ingest_chunks(self, table, chunks):
+        """Écrit des blocs (session_ids, item_ids, dates) et renvoie les statistiques de débit"""
+        started = time.perf_counter()
+        rows = written_chunks = 0
+        for events in chunks:
+            # Découpe les blocs trop grands (ex. sortie de generate_events)
+            for start in range(0, len(events[0]), self.chunk_size):
+                chunk = tuple(np.asarray(column)[start:start + self.chunk_size] for column in events)
+                self._write_chunk(table, chunk)
+                rows += len(chunk[0])
+                written_chunks += 1
+                logger.info(f"{table}: {rows} lignes envoyées ({rows / (time.perf_counter() - started):.0f} lignes/s)")
+        return self._finish(table, rows, written_chunks, started)
+
+    def ingest_file(self, path, table, fmt=None):
+        """Ingère un fichier CSV/JSONL d'achats ("purchases") ou de consultations ("views")"""
+        return self.ingest_chunks(table, read_event_chunks(path, table, self.chunk_size, fmt))
+
+    def load_data(self, path, table):
+        """Chargement natif MySQL (LOAD DATA LOCAL INFILE) d'un CSV à en-tête
+
+        Les doublons de clé primaire sont ignorés (IGNORE). Les listeners par lot ne
+        sont pas appelés : les lignes ne transitent pas par Python. L'engine doit être
+        créé avec connect_args={"local_infile": 1} et les dates être au format MySQL.
+        """
+        if self.engine.dialect.name != "mysql":
+            raise ValueError("LOAD DATA n'est disponible qu'avec MySQL")
+        table_object, _, columns = EVENT_TABLES[table]
+        with open(path, encoding="utf-8") as source:
+            header = source.readline().strip().split(",")
+        targets = [
+            column if column in columns
+            else columns[2] if column in DATE_ALIASES
+            else "@ignored"
+            for column in header
+        ]
+        started = time.perf_counter()
+        with self.engine.begin() as conn:
+            result = conn.execute(text(f"""
+                LOAD DATA LOCAL INFILE :path IGNORE INTO TABLE {table_object.name}
+                FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"'
+                LINES TERMINATED BY '\\n'
+                IGNORE 1 LINES
+                ({", ".join(targets)})
+            """), {"path": os.path.abspath(path)})
+        return self._finish(table, result.rowcount, 1, started, counted="rows_inserted")
+
+
+if __name__ == "__main__":
+    import argparse
+    from sqlalchemy import create_engine
+    from .database import DATABASE_URL, SessionLocal, engine_options
+    from .refresher import IncrementalRefresher
+    from .decay import DecayedScores
+
+    parser = argparse.ArgumentParser(description="Ingestion en masse de fichiers d'événements CSV/JSONL")
+    parser.add_argument("files", nargs="+", help="Fichiers à ingérer, dans l'ordre")
+    parser.add_argument("--table", choices=sorted(EVENT_TABLES), required=True)
+    parser.add_argument("--format", choices=("csv", "jsonl"), default=None)
+    parser.add_argument("--chunk-size", type=int, default=INGEST_CHUNK_SIZE)
+    parser.add_argument("--load-data", action="store_true", help="Chargement natif LOAD DATA (MySQL)")
+    parser.add_argument("--refresh", action="store_true", help="Rafraîchit weighted_recommendations ensuite")
+    parser.add_argument("--decay", action="store_true", help="Met à jour les scores décroissants ensuite")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    options = engine_options(DATABASE_URL)
+    if args.load_data:
+        options["connect_args"] = {"local_infile": 1}
+    engine = create_engine(DATABASE_URL, **options)
+
+    db = SessionLocal(bind=engine)
+    on_complete = []
+    if args.refresh:
+        refresher = IncrementalRefresher(db)
+        refresher.ensure_tables()
+        on_complete.append(refresher.run_once)
+    if args.decay:
+        scores = DecayedScores(db)
+        scores.ensure_tables()
+        on_complete.append(scores.update)
+
+    ingester = EventIngester(engine, chunk_size=args.chunk_size)
+    ingester.ensure_tables()
+    for path in args.files:
+        if args.load_data:
+            stats = ingester.load_data(path, args.table)
+        else:
+            stats = ingester.ingest_file(path, args.table, fmt=args.format)
+        counted = "insérées" if "rows_inserted" in stats else "envoyées"
+        rows = stats.get("rows_inserted", stats.get("rows_sent"))
+        print(f"✅ {path}: {rows} lignes {counted} en {stats['seconds']:.1f} s ({stats['rows_per_second']:.0f} lignes/s)")
+    for refresh in on_complete:
+        print(refresh())
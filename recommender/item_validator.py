@@ -1,60 +1,166 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from .queries import get_queries
+from .metrics import METRICS, timed
+import numpy as np
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
 
 class ItemValidator:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, cache_ids=True, refresh_interval=300):
         self.db = db
-    
+        self.queries = get_queries(db.get_bind())
+        # Ensemble trié des item_id connus, rechargé toutes les refresh_interval secondes
+        self.cache_ids = cache_ids
+        self.refresh_interval = refresh_interval
+        self._known_ids = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        # Un seul rechargement à la fois ; les items ajoutés pendant celui-ci y sont reportés
+        self._refresh_lock = threading.RLock()
+        self._added_during_refresh = None
+
+    @timed("ItemValidator.refresh")
+    def refresh(self):
+        """Recharge en mémoire l'ensemble des item_id présents dans la base"""
+        with self._refresh_lock:
+            with self._lock:
+                self._added_during_refresh = []
+            try:
+                result = self.db.execute(self.queries["known_items"])
+                known_ids = np.unique(np.fromiter((row[0] for row in result), dtype=np.int64))
+            except Exception:
+                with self._lock:
+                    self._added_during_refresh = None
+                raise
+            with self._lock:
+                if self._added_during_refresh:
+                    known_ids = np.union1d(known_ids, np.concatenate(self._added_during_refresh))
+                self._added_during_refresh = None
+                # Remplacement atomique : les lecteurs voient l'ancien ou le nouveau tableau
+                self._known_ids = known_ids
+                self._loaded_at = time.monotonic()
+            return len(known_ids)
+
+    def add_items(self, item_ids):
+        """Ajoute des items nouvellement ingérés sans recharger toute la table"""
+        new_ids = np.asarray(item_ids, dtype=np.int64)
+        with self._lock:
+            if self._added_during_refresh is not None:
+                self._added_during_refresh.append(new_ids)
+            if self._known_ids is not None:
+                self._known_ids = np.union1d(self._known_ids, new_ids)
+
+    def _expired(self):
+        return (
+            self._loaded_at is None
+            or (self.refresh_interval is not None
+                and time.monotonic() - self._loaded_at > self.refresh_interval)
+        )
+
+    def _get_known_ids(self):
+        """Renvoie l'ensemble en mémoire, rechargé s'il est absent ou expiré
+
+        Les appels concurrents attendent le rechargement en cours au lieu d'en lancer un
+        autre ; après expiration, l'ancien ensemble reste servi tant qu'un autre thread recharge.
+        """
+        if self._expired():
+            if self._known_ids is None:
+                with self._refresh_lock:
+                    if self._expired():
+                        self.refresh()
+            elif self._refresh_lock.acquire(blocking=False):
+                try:
+                    if self._expired():
+                        self.refresh()
+                finally:
+                    self._refresh_lock.release()
+        with self._lock:
+            return self._known_ids
+
+    @staticmethod
+    def _members(known_ids, item_ids):
+        """Items de item_ids présents dans le tableau trié known_ids"""
+        candidates = np.asarray(item_ids, dtype=np.int64)
+        if not len(known_ids):
+            return candidates[:0]
+        positions = np.minimum(np.searchsorted(known_ids, candidates), len(known_ids) - 1)
+        return candidates[known_ids[positions] == candidates]
+
+    def filter_existing(self, item_ids):
+        """Renvoie, sous forme de tableau, les items existants parmi item_ids"""
+        return self._members(self._get_known_ids(), item_ids)
+
+    @timed("ItemValidator.item_exists")
     def item_exists(self, item_id):
         """Vérifie si un item existe dans la base de données"""
+        if not self.cache_ids:
+            return self._item_exists_in_db(item_id)
+
         try:
-            # Optimisation: une seule requête avec UNION
-            query = text("""
-                SELECT COUNT(*) FROM (
-                    SELECT item_id FROM purchases WHERE item_id = :item_id
-                    UNION
-                    SELECT item_id FROM sessions WHERE item_id = :item_id
-                ) AS combined_items
-            """)
-            
-            count = self.db.execute(query, {"item_id": item_id}).scalar()
-            exists = count > 0
-            
-            if not exists:
-                print(f"⚠️ L'item {item_id} n'existe pas dans la base de données")
-            
-            return exists
+            exists = len(self.filter_existing([item_id])) > 0
         except Exception as e:
-            print(f"❌ Erreur lors de la validation de l'item {item_id}: {str(e)}")
-            return False
-    
+            logger.error(f"Erreur lors du chargement des items connus: {str(e)}")
+            METRICS.increment("fallbacks", "known_items_to_db")
+            return self._item_exists_in_db(item_id)
+
+        if not exists:
+            logger.warning(f"L'item {item_id} n'existe pas dans la base de données")
+        return exists
+
+    @timed("ItemValidator.items_exist")
     def items_exist(self, item_ids):
         """Vérifie si plusieurs items existent et renvoie ceux qui existent"""
         if not item_ids:
-            print("⚠️ Aucun item à valider")
+            logger.warning("Aucun item à valider")
             return False, []
-            
+
+        if not self.cache_ids:
+            return self._items_exist_in_db(item_ids)
+
         try:
-            # Requête optimisée pour récupérer les items valides en une opération
-            query = text("""
-                SELECT DISTINCT item_id 
-                FROM (
-                    SELECT item_id FROM purchases WHERE item_id IN :item_ids
-                    UNION
-                    SELECT item_id FROM sessions WHERE item_id IN :item_ids
-                ) AS combined_items
-            """)
-            
-            result = self.db.execute(query, {"item_ids": tuple(item_ids)})
+            valid_items = list(dict.fromkeys(int(item) for item in self.filter_existing(item_ids)))
+        except Exception as e:
+            logger.error(f"Erreur lors du chargement des items connus: {str(e)}")
+            METRICS.increment("fallbacks", "known_items_to_db")
+            return self._items_exist_in_db(item_ids)
+
+        missing_items = list(set(item_ids) - set(valid_items))
+        if missing_items:
+            logger.warning(f"Les items suivants n'existent pas: {missing_items}")
+
+        all_exist = len(valid_items) == len(item_ids)
+        return all_exist, valid_items
+
+    def _item_exists_in_db(self, item_id):
+        """Vérifie l'existence d'un item directement en base"""
+        try:
+            count = self.db.execute(self.queries["item_exists"], {"item_id": item_id}).scalar()
+            exists = count > 0
+
+            if not exists:
+                logger.warning(f"L'item {item_id} n'existe pas dans la base de données")
+
+            return exists
+        except Exception as e:
+            logger.error(f"Erreur lors de la validation de l'item {item_id}: {str(e)}")
+            return False
+
+    def _items_exist_in_db(self, item_ids):
+        """Vérifie l'existence de plusieurs items directement en base"""
+        try:
+            result = self.db.execute(self.queries["items_exist"], {"item_ids": list(item_ids)})
             valid_items = [row[0] for row in result]
-            
+
             missing_items = list(set(item_ids) - set(valid_items))
             if missing_items:
-                print(f"⚠️ Les items suivants n'existent pas: {missing_items}")
-            
+                logger.warning(f"Les items suivants n'existent pas: {missing_items}")
+
             all_exist = len(valid_items) == len(item_ids)
             return all_exist, valid_items
-            
+
         except Exception as e:
-            print(f"❌ Erreur lors de la validation des items: {str(e)}")
+            logger.error(f"Erreur lors de la validation des items: {str(e)}")
             return False, []
@@ -0,0 +1,184 @@
+from collections import OrderedDict, defaultdict
+import heapq
+import threading
+import time
+
+# Estimation de l'occupation mémoire d'une entrée de dictionnaire (clé, flottant, slot)
+BYTES_PER_ENTRY = 120
+
+
+class LiveSession:
+    """État d'une session en cours : vecteur de scores des candidats mis à jour à chaque événement
+
+    Les scores sont ceux de recommend_for_products sur l'ensemble des items de la session.
+    Un nouvel item n'ajoute que ses voisins (lignes de l'index) et les sessions récentes
+    où il a été acheté qui n'étaient pas encore couvertes : rien n'est recalculé.
+    """
+
+    def __init__(self, index, item_sessions=None):
+        self.index = index
+        # Sessions récentes par item (colonnes de recent_purchased), partagé entre sessions
+        self._item_sessions = item_sessions if item_sessions is not None else index.recent_purchased.tocsc()
+        self.items = []
+        self.bought = set()
+        self._seeds = set()
+        self._bought_together = defaultdict(float)
+        self._view_purchase = defaultdict(float)
+        self._unique_sessions = defaultdict(float)
+        self._covered_sessions = set()
+        self._top = None
+        self.last_access = time.monotonic()
+
+    def __len__(self):
+        """Nombre d'entrées conservées, pour le budget mémoire"""
+        return (
+            len(self._bought_together) + len(self._view_purchase)
+            + len(self._unique_sessions) + len(self._covered_sessions)
+        )
+
+    @staticmethod
+    def _add_row(target, matrix, row):
+        start, end = matrix.indptr[row:row + 2]
+        for column, value in zip(matrix.indices[start:end].tolist(), matrix.data[start:end].tolist()):
+            target[column] += value
+
+    def _add(self, item_id):
+        self.last_access = time.monotonic()
+        position = self.index.position(item_id)
+        if position is None or position in self._seeds:
+            return False
+
+        self.items.append(item_id)
+        self._seeds.add(position)
+        self._add_row(self._bought_together, self.index.bought_together, position)
+        self._add_row(self._view_purchase, self.index.view_purchase, position)
+        start, end = self._item_sessions.indptr[position:position + 2]
+        for session in self._item_sessions.indices[start:end].tolist():
+            if session not in self._covered_sessions:
+                self._covered_sessions.add(session)
+                self._add_row(self._unique_sessions, self.index.purchased, session)
+        self._top = None
+        return True
+
+    def view(self, item_id):
+        """Ajoute un item consulté ; False s'il est inconnu de l'index ou déjà présent"""
+        return self._add(item_id)
+
+    def buy(self, item_id):
+        """Ajoute un item acheté (même rôle qu'un item consulté pour le score)"""
+        self.bought.add(item_id)
+        return self._add(item_id)
+
+    def top(self, num_recommendations=5):
+        """Top-k courant, conservé jusqu'au prochain événement"""
+        self.last_access = time.monotonic()
+        if self._top is not None and self._top[0] >= num_recommendations:
+            return self._top[1][:num_recommendations]
+
+        bt_weight, us_weight, vp_weight = self.index.weights
+        # Seuls les items achetés ensemble sont candidats, hors items de la session
+        scored = (
+            (
+                bought_together * bt_weight
+                + self._unique_sessions.get(position, 0.0) * us_weight
+                + self._view_purchase.get(position, 0.0) * vp_weight,
+                position
+            )
+            for position, bought_together in self._bought_together.items()
+            if bought_together > 0 and position not in self._seeds
+        )
+        best = heapq.nlargest(num_recommendations, scored, key=lambda entry: entry[0])
+        recommendations = [
+            {"item_id": int(self.index.item_ids[position]), "score": float(score)}
+            for score, position in best
+        ]
+        self._top = (num_recommendations, recommendations)
+        return recommendations
+
+
+class LiveSessionStore:
+    """Sessions en cours indexées par identifiant, évincées après inactivité ou au-delà du budget mémoire"""
+
+    def __init__(self, index, max_bytes=256 * 1024 * 1024, idle_timeout=1800):
+        self.index = index
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        self._item_sessions = index.recent_purchased.tocsc()
+        self._sessions = OrderedDict()
+        self._entries = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _get(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = LiveSession(self.index, self._item_sessions)
+            self._sessions[session_id] = session
+        else:
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def _remove(self, session_id):
+        self._entries -= len(self._sessions.pop(session_id))
+
+    def _expire(self):
+        """Supprime les sessions inactives depuis plus de idle_timeout secondes"""
+        deadline = time.monotonic() - self.idle_timeout
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_access >= deadline:
+                break
+            self._remove(session_id)
+            self.expirations += 1
+
+    def _evict(self):
+        """Supprime les sessions les moins récemment utilisées au-delà du budget mémoire"""
+        while self._entries * BYTES_PER_ENTRY > self.max_bytes and len(self._sessions) > 1:
+            self._remove(next(iter(self._sessions)))
+            self.evictions += 1
+
+    def _record(self, session_id, item_id, bought):
+        with self._lock:
+            self._expire()
+            session = self._get(session_id)
+            before = len(session)
+            added = session.buy(item_id) if bought else session.view(item_id)
+            self._entries += len(session) - before
+            self._evict()
+            return added
+
+    def view(self, session_id, item_id):
+        return self._record(session_id, item_id, bought=False)
+
+    def buy(self, session_id, item_id):
+        return self._record(session_id, item_id, bought=True)
+
+    def top(self, session_id, num_recommendations=5):
+        """Top-k de la session (liste vide pour une session inconnue ou évincée)"""
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is None:
+                return []
+            self._sessions.move_to_end(session_id)
+            return session.top(num_recommendations)
+
+    def end(self, session_id):
+        """Libère explicitement une session terminée"""
+        with self._lock:
+            if session_id in self._sessions:
+                self._remove(session_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "estimated_bytes": self._entries * BYTES_PER_ENTRY,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,265 @@
+from sqlalchemy import event
+from collections import Counter, defaultdict
+import functools
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import weakref
+
+slow_query_logger = logging.getLogger("recommender.slow_queries")
+
+# Bornes supérieures des classes de latence, en millisecondes
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+# Seuil du journal des requêtes lentes (0 ou absent : désactivé)
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 0)) or None
+# Préfixe du plan d'exécution par dialecte
+EXPLAIN_PREFIXES = {"sqlite": "EXPLAIN QUERY PLAN ", "mysql": "EXPLAIN ", "postgresql": "EXPLAIN "}
+LABEL_LENGTH = 80
+# Requêtes lentes en attente d'EXPLAIN ; au-delà, elles sont journalisées sans plan
+EXPLAIN_QUEUE_SIZE = 100
+
+
+class Histogram:
+    """Histogramme de latences à classes fixes, avec nombre de lignes cumulé"""
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+
+    def observe(self, milliseconds, rows=None):
+        for position, bound in enumerate(self.bounds):
+            if milliseconds <= bound:
+                self.counts[position] += 1
+                break
+        self.count += 1
+        self.total_ms += milliseconds
+        self.max_ms = max(self.max_ms, milliseconds)
+        if rows is not None:
+            self.rows += rows
+
+    def percentile(self, fraction):
+        """Borne supérieure de la classe contenant le percentile (le maximum pour la dernière)"""
+        threshold = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if count and seen >= threshold:
+                return round(min(bound, self.max_ms), 3)
+        return round(self.max_ms, 3)
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max_ms, 3),
+            "rows": self.rows,
+            "buckets": {
+                ("inf" if bound == float("inf") else str(bound)): count
+                for bound, count in zip(self.bounds, self.counts) if count
+            },
+        }
+
+
+class Metrics:
+    """Histogrammes par méthode et par requête, et compteurs nommés (repli, cache, source, erreur)"""
+
+    def __init__(self):
+        self._histograms = defaultdict(dict)
+        self._counters = defaultdict(Counter)
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def observe(self, kind, name, seconds, rows=None):
+        with self._lock:
+            histogram = self._histograms[kind].get(name)
+            if histogram is None:
+                histogram = self._histograms[kind][name] = Histogram()
+            histogram.observe(seconds * 1000, rows)
+
+    def increment(self, group, name, value=1):
+        with self._lock:
+            self._counters[group][name] += value
+
+    def counters(self, group):
+        """Copie des compteurs d'un groupe (ex. "sources")"""
+        with self._lock:
+            return dict(self._counters.get(group, {}))
+
+    def dump(self):
+        """Instantané JSON-sérialisable de toutes les mesures"""
+        with self._lock:
+            return {
+                "uptime_seconds": round(time.time() - self.started_at, 1),
+                **{kind: {name: histogram.to_dict() for name, histogram in sorted(histograms.items())}
+                   for kind, histograms in self._histograms.items()},
+                "counters": {group: dict(counter) for group, counter in self._counters.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.started_at = time.time()
+
+
+# Registre partagé par tout le processus
+METRICS = Metrics()
+_instrumented_engines = weakref.WeakSet()
+
+
+def _row_count(result):
+    if isinstance(result, (list, dict)):
+        return len(result)
+    if isinstance(result, tuple) and len(result) == 2 and isinstance(result[1], list):
+        # (tous présents, items valides) de items_exist
+        return len(result[1])
+    if hasattr(result, "shape"):
+        return result.shape[0]
+    return None
+
+
+def timed(name, metrics=METRICS):
+    """Décorateur : latence, nombre de lignes renvoyées et exceptions de la méthode"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            except Exception:
+                metrics.increment("errors", name)
+                raise
+            metrics.observe("methods", name, time.perf_counter() - started, _row_count(result))
+            return result
+        return wrapper
+    return decorator
+
+
+def statement_label(statement):
+    """Libellé court d'une requête sans nom de registre (espaces normalisés, tronqué)"""
+    return re.sub(r"\s+", " ", statement).strip()[:LABEL_LENGTH]
+
+
+def _explain(engine, statement, parameters):
+    """Plan d'exécution de la requête, sur une connexion DBAPI distincte (hors événements)"""
+    prefix = EXPLAIN_PREFIXES.get(engine.dialect.name)
+    if prefix is None or not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+        return None
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(prefix + statement, parameters)
+        plan = [tuple(row) for row in cursor.fetchall()]
+        cursor.close()
+        return plan
+    finally:
+        connection.close()
+
+
+def _log_slow_query(name, elapsed, statement, parameters, plan):
+    slow_query_logger.warning(
+        f"Requête lente {name} ({elapsed * 1000:.1f} ms)\n{statement}\n"
+        f"Paramètres: {parameters}\nPlan: {plan}"
+    )
+
+
+class ExplainWorker:
+    """Calcule et journalise le plan des requêtes lentes dans un thread dédié
+
+    La requête lente ne paie ni l'EXPLAIN ni l'ouverture de sa connexion ; si la
+    file est pleine, elle est journalisée sans plan.
+    """
+
+    def __init__(self, maxsize=EXPLAIN_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, engine, name, elapsed, statement, parameters):
+        """Met la requête en file, False si la file est pleine"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="explain-worker", daemon=True)
+                self._thread.start()
+        try:
+            self.queue.put_nowait((engine, name, elapsed, statement, parameters))
+        except queue.Full:
+            return False
+        return True
+
+    def join(self):
+        """Attend que toutes les requêtes en file soient journalisées"""
+        self.queue.join()
+
+    def _run(self):
+        while True:
+            engine, name, elapsed, statement, parameters = self.queue.get()
+            try:
+                try:
+                    plan = _explain(engine, statement, parameters)
+                except Exception as e:
+                    plan = f"EXPLAIN impossible: {str(e)}"
+                _log_slow_query(name, elapsed, statement, parameters, plan)
+            finally:
+                self.queue.task_done()
+
+
+# Thread d'EXPLAIN partagé par tous les engines instrumentés
+EXPLAIN_WORKER = ExplainWorker()
+
+
+def instrument_engine(engine, metrics=METRICS, slow_query_ms=SLOW_QUERY_MS, explain=True,
+                      explain_worker=EXPLAIN_WORKER):
+    """Mesure chaque requête de l'engine ; au-delà de slow_query_ms, journalise son EXPLAIN
+
+    Les requêtes du registre (queries.py) sont identifiées par leur nom, les autres
+    par le début de leur texte. L'EXPLAIN est exécuté par explain_worker, hors du
+    chemin de la requête.
+    """
+    if engine in _instrumented_engines:
+        return engine
+    _instrumented_engines.add(engine)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        name = context.execution_options.get("query_name") if context is not None else None
+        name = name or statement_label(statement)
+        # rowcount n'est renseigné que pour les écritures et les SELECT bufferisés (MySQL)
+        rows = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None
+        metrics.observe("statements", name, elapsed, rows)
+
+        if slow_query_ms is not None and elapsed * 1000 >= slow_query_ms:
+            metrics.increment("slow_queries", name)
+            if explain and not executemany:
+                if explain_worker.submit(engine, name, elapsed, statement, parameters):
+                    return
+                metrics.increment("explain_dropped", name)
+            _log_slow_query(name, elapsed, statement, parameters, None)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        statement = exception_context.statement or ""
+        context = exception_context.execution_context
+        name = context.execution_options.get("query_name") if context is not None else None
+        metrics.increment("statement_errors", name or statement_label(statement))
+        started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+        if exception_context.cursor is not None and started:
+            started.pop()
+
+    return engine
@@ -1,18 +1,114 @@
-from sqlalchemy import Column, Integer, DateTime, ForeignKey, Index
+from sqlalchemy import Column, Integer, Float, String, Date, DateTime, ForeignKey, Index, func
 from sqlalchemy.orm import relationship
 from .database import Base
 from datetime import datetime
+import numpy as np
 
 class Purchase(Base):
     __tablename__ = "purchases"
+    __table_args__ = (
+        # Index couvrants des requêtes du recommender (voir schema.py) :
+        # filtre par item puis fenêtre de dates, jointure par session, parcours par date
+        Index("idx_purchases_item_date", "item_id", "purchase_date", "session_id"),
+        Index("idx_purchases_session_item", "session_id", "item_id", "purchase_date"),
+        Index("idx_purchases_date", "purchase_date", "session_id", "item_id"),
+        # Événements arrivés depuis le dernier rafraîchissement, quelle que soit leur date
+        Index("idx_purchases_ingested", "ingested_at", "session_id", "item_id", "purchase_date"),
+    )
     
     session_id = Column(Integer, primary_key=True)
     item_id = Column(Integer, primary_key=True, index=True)
     purchase_date = Column(DateTime, default=datetime.utcnow)
+    # Horloge de la base à l'insertion, quel que soit le chemin d'écriture
+    ingested_at = Column(DateTime, nullable=False, server_default=func.current_timestamp())
 
 class Session(Base):
     __tablename__ = "sessions"
+    __table_args__ = (
+        Index("idx_sessions_item_date", "item_id", "view_date", "session_id"),
+        # Consultations d'une session dans l'ordre chronologique (parcours d'achat)
+        Index("idx_sessions_session_date", "session_id", "view_date", "item_id"),
+        Index("idx_sessions_ingested", "ingested_at", "session_id", "item_id", "view_date"),
+    )
     
     session_id = Column(Integer, primary_key=True)
     item_id = Column(Integer, primary_key=True, index=True)
     view_date = Column(DateTime, primary_key=True, index=True)
+    ingested_at = Column(DateTime, nullable=False, server_default=func.current_timestamp())
+
+
+class ProductRecommendation(Base):
+    __tablename__ = "product_recommendations"
+    __table_args__ = (
+        # Lecture des top-N par item source : un simple parcours d'intervalle sur l'index
+        Index("idx_product_recommendations_lookup", "source_item_id", "recommendation_type", "score"),
+    )
+    
+    source_item_id = Column(Integer, primary_key=True)
+    recommended_item_id = Column(Integer, primary_key=True)
+    score = Column(Integer)
+    recommendation_type = Column(String(50), primary_key=True)
+    last_updated = Column(DateTime)
+
+
+class WeightedRecommendation(Base):
+    __tablename__ = "weighted_recommendations"
+    __table_args__ = (
+        # Top-N d'un item source par ORDER BY score DESC LIMIT n, lu entièrement dans l'index
+        Index("idx_weighted_recommendations_top", "source_item_id", "score", "recommended_item_id", "last_updated"),
+    )
+    
+    # Score final de recommend_for_product (mêmes poids, fenêtre et condition de séquence)
+    source_item_id = Column(Integer, primary_key=True)
+    recommended_item_id = Column(Integer, primary_key=True)
+    score = Column(Float, nullable=False)
+    last_updated = Column(DateTime)
+
+
+class RecommendationBucket(Base):
+    __tablename__ = "recommendation_buckets"
+    __table_args__ = (
+        Index("idx_recommendation_buckets_date", "bucket_date"),
+    )
+    
+    # Comptes journaliers par paire : permet d'expirer ce qui sort de la fenêtre
+    source_item_id = Column(Integer, primary_key=True)
+    recommended_item_id = Column(Integer, primary_key=True)
+    recommendation_type = Column(String(50), primary_key=True)
+    bucket_date = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class DecayedRecommendation(Base):
+    __tablename__ = "decayed_recommendations"
+    
+    # Compte décroissant exponentiellement, valable à updated_at et décru à la lecture
+    source_item_id = Column(Integer, primary_key=True)
+    recommended_item_id = Column(Integer, primary_key=True)
+    recommendation_type = Column(String(50), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    decayed_count = Column(Float, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False)
+
+class DecayState(Base):
+    __tablename__ = "decayed_recommendations_state"
+    
+    # Demi-vie avec laquelle decayed_recommendations a été construite, et watermark d'ingestion
+    name = Column(String(50), primary_key=True)
+    half_life_seconds = Column(Float, nullable=False)
+    watermark = Column(DateTime, nullable=False)
+
+class RefreshWatermark(Base):
+    __tablename__ = "recommendation_refresh_state"
+    
+    # Borne haute (horloge de la base) des ingested_at déjà comptés
+    name = Column(String(50), primary_key=True)
+    watermark = Column(DateTime, nullable=False)
+
+
+def event_rows(columns, sessions, items, dates):
+    """Paramètres executemany de lignes d'événements (session, item, date datetime64)"""
+    python_dates = np.asarray(dates).astype("datetime64[us]").tolist()
+    return [
+        {columns[0]: int(s), columns[1]: int(i), columns[2]: d}
+        for s, i, d in zip(sessions, items, python_dates)
+    ]
@@ -0,0 +1,290 @@
+from collections import defaultdict
+import numpy as np
+import logging
+import math
+import time
+from .cooccurrence_index import DEFAULT_WEIGHTS, join_on_session, to_timestamps
+from .queries import recent_purchase_cutoff
+from .sketches import SpaceSaving
+
+logger = logging.getLogger(__name__)
+
+# Sessions traitées par bloc vectorisé avant d'alimenter les compteurs
+SESSION_CHUNK_SIZE = 10000
+# Estimation de l'occupation d'un compteur Space-Saving (compte, erreur, entrée du tas)
+BYTES_PER_COUNTER = 200
+
+
+def _sorted_by_session(events):
+    sessions = np.asarray(events[0], dtype=np.int64)
+    if len(sessions) and np.any(sessions[1:] < sessions[:-1]):
+        order = np.argsort(sessions, kind="stable")
+        return tuple(np.asarray(column)[order] for column in events)
+    return tuple(np.asarray(column) for column in events)
+
+
+def _span(sessions, low, high):
+    """Lignes d'un tableau trié par session dont la session est dans [low, high]"""
+    return slice(np.searchsorted(sessions, low, side="left"), np.searchsorted(sessions, high, side="right"))
+
+
+def pair_scores(purchase_sessions, purchase_items, purchase_times,
+                view_sessions, view_items, view_times, cutoff_ts, weights=DEFAULT_WEIGHTS):
+    """Contributions (source, voisin, score) d'un bloc de sessions au score de recommend_for_product
+
+    Une paire achetée ensemble compte pour bt + unique_sessions (une paire par session),
+    une consultation suivie d'un achat pour vp.
+    """
+    bt_weight, us_weight, vp_weight = weights
+    left, right = join_on_session(purchase_sessions, purchase_sessions)
+    bought = (purchase_times[left] >= cutoff_ts) & (purchase_items[left] != purchase_items[right])
+    v_left, p_right = join_on_session(view_sessions, purchase_sessions)
+    viewed = (view_times[v_left] < purchase_times[p_right]) & (view_items[v_left] != purchase_items[p_right])
+
+    sources = np.concatenate([purchase_items[left][bought], view_items[v_left][viewed]])
+    targets = np.concatenate([purchase_items[right][bought], purchase_items[p_right][viewed]])
+    scores = np.concatenate([
+        np.full(bought.sum(), bt_weight + us_weight, dtype=np.float64),
+        np.full(viewed.sum(), vp_weight, dtype=np.float64),
+    ])
+    if not len(sources):
+        return sources, targets, scores
+
+    # Agrégation par paire : un seul ajout par paire et par bloc dans les compteurs
+    pairs, inverse = np.unique(np.stack([sources, targets], axis=1), axis=0, return_inverse=True)
+    return pairs[:, 0], pairs[:, 1], np.bincount(inverse.ravel(), weights=scores)
+
+
+class NeighborTable:
+    """Top-K voisins par item source, en tableaux compacts (format CSR)
+
+    Les scores sont exacts (mêmes valeurs que recommend_for_product). Seule la sélection
+    est approchée : un voisin absent de la liste a un score exact d'au plus
+    error_bound × score total de l'item source.
+    """
+
+    def __init__(self, item_ids, indptr, neighbors, scores, k, error_bound):
+        self.item_ids = np.asarray(item_ids, dtype=np.int64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.neighbors = np.asarray(neighbors, dtype=np.int64)
+        self.scores = np.asarray(scores, dtype=np.float64)
+        self.k = k
+        self.error_bound = error_bound
+        self._positions = {int(item): pos for pos, item in enumerate(self.item_ids)}
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.item_ids, self.indptr, self.neighbors, self.scores))
+
+    def __contains__(self, item_id):
+        return item_id in self._positions
+
+    def recommend(self, item_id, num_recommendations=5):
+        """Recommandations d'un item (au plus k) par lecture de sa ligne"""
+        position = self._positions.get(item_id)
+        if position is None:
+            return []
+        start, end = self.indptr[position:position + 2]
+        end = min(end, start + num_recommendations)
+        return [
+            {"item_id": int(item), "score": float(score)}
+            for item, score in zip(self.neighbors[start:end], self.scores[start:end])
+        ]
+
+    def recommend_each(self, item_ids, num_recommendations=5):
+        return {item_id: self.recommend(item_id, num_recommendations) for item_id in item_ids}
+
+    def save(self, path):
+        np.savez(
+            path, item_ids=self.item_ids, indptr=self.indptr, neighbors=self.neighbors,
+            scores=self.scores, k=self.k, error_bound=self.error_bound
+        )
+
+    @classmethod
+    def open(cls, path):
+        with np.load(path) as data:
+            return cls(
+                data["item_ids"], data["indptr"], data["neighbors"], data["scores"],
+                int(data["k"]), float(data["error_bound"])
+            )
+
+
+class TopKNeighborBuilder:
+    """Construit une NeighborTable en flux, session par session, en mémoire bornée
+
+    Chaque item source garde un compteur Space-Saving de capacity voisins au lieu de
+    sa ligne complète : capacity = max(k, 1 / error_bound), réduite si nécessaire pour
+    tenir dans memory_budget octets. La mémoire ne dépend plus du nombre de paires.
+    Un second passage sur les événements calcule le score exact des voisins suivis,
+    qui fixe leur ordre et le score servi.
+    """
+
+    def __init__(self, k=20, error_bound=0.01, memory_budget=None, weights=DEFAULT_WEIGHTS,
+                 session_chunk_size=SESSION_CHUNK_SIZE):
+        self.k = k
+        self.error_bound = error_bound
+        self.memory_budget = memory_budget
+        self.weights = tuple(weights)
+        self.session_chunk_size = session_chunk_size
+
+    def capacity(self, num_sources):
+        """Compteurs par item source compte tenu de la borne d'erreur et du budget"""
+        capacity = max(self.k, math.ceil(1 / self.error_bound))
+        if self.memory_budget is not None:
+            affordable = self.memory_budget // (BYTES_PER_COUNTER * max(num_sources, 1))
+            if affordable < self.k:
+                raise ValueError(
+                    f"Budget mémoire insuffisant : {affordable} compteurs par item pour k={self.k}"
+                )
+            capacity = min(capacity, affordable)
+        return capacity
+
+    def _chunks(self, purchases, views):
+        """Blocs de session_chunk_size sessions consécutives des deux tables"""
+        sessions = np.unique(np.concatenate([purchases[0], views[0]]))
+        for start in range(0, len(sessions), self.session_chunk_size):
+            low = sessions[start]
+            high = sessions[min(start + self.session_chunk_size, len(sessions)) - 1]
+            p_span = _span(purchases[0], low, high)
+            v_span = _span(views[0], low, high)
+            yield (
+                *(column[p_span] for column in purchases),
+                *(column[v_span] for column in views),
+            )
+
+    @staticmethod
+    def _pair_keys(universe, sources, targets):
+        """Clé entière unique d'une paire (source, voisin) d'items de universe"""
+        return np.searchsorted(universe, sources) * len(universe) + np.searchsorted(universe, targets)
+
+    def build(self, events, today=None):
+        """Construit la table depuis des événements ((sessions, items, dates) des deux tables)"""
+        started = time.perf_counter()
+        purchases, views = (_sorted_by_session(table) for table in events)
+        purchases = (purchases[0], purchases[1].astype(np.int64), to_timestamps(purchases[2]))
+        views = (views[0], views[1].astype(np.int64), to_timestamps(views[2]))
+        cutoff_ts = to_timestamps([recent_purchase_cutoff(today)])[0]
+
+        universe = np.unique(np.concatenate([purchases[1], views[1]]))
+        capacity = self.capacity(len(universe))
+        counters = defaultdict(lambda: SpaceSaving(capacity))
+        for chunk in self._chunks(purchases, views):
+            sources, targets, scores = pair_scores(*chunk, cutoff_ts, self.weights)
+            for source, target, score in zip(sources.tolist(), targets.tolist(), scores.tolist()):
+                counters[source].add(target, score)
+
+        # Candidats : toutes les paires suivies par les compteurs, qui contiennent chaque
+        # voisin de score exact supérieur à error_bound × total de l'item source
+        item_ids = np.array(sorted(counters), dtype=np.int64)
+        sizes = np.array([len(counters[item_id]) for item_id in item_ids.tolist()], dtype=np.int64)
+        candidate_sources = np.repeat(item_ids, sizes)
+        candidate_neighbors = np.fromiter(
+            (neighbor for item_id in item_ids.tolist() for neighbor in counters[item_id].counts),
+            dtype=np.int64, count=int(sizes.sum())
+        )
+        counter_bytes = int(sizes.sum()) * BYTES_PER_COUNTER
+        del counters
+        keys = self._pair_keys(universe, candidate_sources, candidate_neighbors)
+        order = np.argsort(keys)
+        keys, candidate_sources, candidate_neighbors = keys[order], candidate_sources[order], candidate_neighbors[order]
+
+        # Second passage : scores exacts des seules paires candidates (les estimations
+        # Space-Saving surestiment le score d'au plus error_bound × total)
+        exact = np.zeros(len(keys), dtype=np.float64)
+        for chunk in self._chunks(purchases, views):
+            sources, targets, scores = pair_scores(*chunk, cutoff_ts, self.weights)
+            chunk_keys = self._pair_keys(universe, sources, targets)
+            positions = np.minimum(np.searchsorted(keys, chunk_keys), max(len(keys) - 1, 0))
+            found = keys[positions] == chunk_keys if len(keys) else np.zeros(len(chunk_keys), dtype=bool)
+            np.add.at(exact, positions[found], scores[found])
+
+        # Score exact décroissant, puis identifiant pour un ordre stable ; k premiers par source
+        order = np.lexsort((candidate_neighbors, -exact, candidate_sources))
+        candidate_sources, candidate_neighbors, exact = candidate_sources[order], candidate_neighbors[order], exact[order]
+        starts = np.searchsorted(candidate_sources, item_ids)
+        rank = np.arange(len(candidate_sources)) - np.repeat(starts, sizes)
+        kept = rank < self.k
+        neighbors, scores = candidate_neighbors[kept], exact[kept]
+        indptr = np.concatenate([[0], np.cumsum(np.minimum(sizes, self.k))])
+
+        table = NeighborTable(item_ids, indptr, neighbors, scores, self.k, 1 / capacity)
+        self.stats = {
+            "sources": len(item_ids),
+            "capacity": capacity,
+            "error_bound": 1 / capacity,
+            "counter_bytes": counter_bytes,
+            "table_bytes": table.nbytes,
+            "seconds": time.perf_counter() - started,
+        }
+        logger.info(f"Table de voisins construite: {self.stats}")
+        return table
+
+
+def evaluate(table, index, k=None):
+    """Rappel du top-k de la table par rapport aux scores exacts d'un CooccurrenceIndex
+
+    Les ex-aequo du k-ième score exact sont tous acceptés. score_error est l'écart
+    maximal entre un score servi et le score exact de la même paire.
+    """
+    k = k or table.k
+    recalls = []
+    score_error = 0.0
+    for position, item_id in enumerate(index.item_ids.tolist()):
+        start, end = index.scores.indptr[position:position + 2]
+        exact = index.scores.data[start:end]
+        if not len(exact):
+            continue
+        threshold = np.sort(exact)[::-1][min(k, len(exact)) - 1]
+        accepted = set(index.item_ids[index.scores.indices[start:end][exact >= threshold]].tolist())
+        served = table.recommend(item_id, k)
+        found = {rec["item_id"] for rec in served}
+        recalls.append(len(found & accepted) / min(k, len(exact)))
+        row = dict(zip(index.item_ids[index.scores.indices[start:end]].tolist(), exact.tolist()))
+        for rec in served:
+            score_error = max(score_error, abs(rec["score"] - row.get(rec["item_id"], 0.0)))
+
+    exact_bytes = index.scores.data.nbytes + index.scores.indices.nbytes + index.scores.indptr.nbytes
+    return {
+        "k": k,
+        "recall": float(np.mean(recalls)) if recalls else 0.0,
+        "score_error": score_error,
+        "evaluated_items": len(recalls),
+        "table_bytes": table.nbytes,
+        "exact_bytes": exact_bytes,
+        "exact_pairs": int(index.scores.nnz),
+        "table_pairs": len(table.neighbors),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    from .database import SessionLocal
+    from .snapshot import EventSnapshot, read_events
+    from .cooccurrence_index import CooccurrenceIndex
+
+    parser = argparse.ArgumentParser(description="Table des top-K voisins en mémoire bornée")
+    parser.add_argument("--output", required=True, help="Fichier .npz de la table")
+    parser.add_argument("-k", type=int, default=20)
+    parser.add_argument("--error-bound", type=float, default=0.01)
+    parser.add_argument("--memory-budget-mb", type=float, default=None)
+    parser.add_argument("--snapshot", default=None, help="Instantané EventSnapshot à lire plutôt que la base")
+    parser.add_argument("--evaluate", action="store_true", help="Compare au calcul exact (mémoire non bornée)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.snapshot:
+        snapshot = EventSnapshot.open(args.snapshot)
+        events = (
+            (snapshot.purchase_sessions, snapshot.purchase_items, snapshot.purchase_times),
+            (snapshot.view_sessions, snapshot.view_items, snapshot.view_times),
+        )
+    else:
+        events = read_events(SessionLocal())
+
+    budget = int(args.memory_budget_mb * 1024 * 1024) if args.memory_budget_mb else None
+    builder = TopKNeighborBuilder(k=args.k, error_bound=args.error_bound, memory_budget=budget)
+    table = builder.build(events)
+    table.save(args.output)
+    print(f"✅ Table enregistrée dans {args.output}: {builder.stats}")
+    if args.evaluate:
+        print(evaluate(table, CooccurrenceIndex.from_events(*events[0], *events[1])))
@@ -0,0 +1,163 @@
+from sqlalchemy.orm import Session
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+import numpy as np
+import scipy.sparse as sp
+import logging
+import time
+from .cooccurrence_index import (
+    CooccurrenceIndex, DEFAULT_WEIGHTS, count_events, to_timestamps, without_diagonal
+)
+from .models import Base, WeightedRecommendation
+from .queries import recent_purchase_cutoff
+from .snapshot import read_events
+
+logger = logging.getLogger(__name__)
+
+INSERT_CHUNK_SIZE = 10000
+
+
+def _count_shard(args):
+    """Comptes partiels d'un fragment de sessions (exécuté dans un processus du pool)"""
+    events, item_ids, cutoff_ts = args
+    return count_events(*events, item_ids, cutoff_ts)
+
+
+def _merge(total, partial):
+    """Réduit un résultat partiel dans l'accumulateur (somme, maximum ou empilement)"""
+    if total is None:
+        return {name: [value] if name in ("purchased", "recent_purchased") else value
+                for name, value in partial.items()}
+    for name, value in partial.items():
+        if name in ("purchased", "recent_purchased"):
+            total[name].append(value)
+        elif name == "last_interaction":
+            total[name] = total[name].maximum(value)
+        else:
+            total[name] = total[name] + value
+    return total
+
+
+class ParallelCooccurrenceBuilder:
+    """Construit les comptes de co-occurrence sur plusieurs cœurs, par fragments de session_id
+
+    Toutes les co-occurrences restent internes à une session : chaque fragment est compté
+    indépendamment puis réduit au fil de l'eau, avec au plus deux fragments en vol par worker.
+    La lecture des événements et la réduction restent séquentielles : le gain dépend des
+    cœurs réellement disponibles et se mesure avec benchmark.py (--build-workers).
+    """
+
+    def __init__(self, workers=1, shards_per_worker=4):
+        self.workers = max(workers, 1)
+        self.num_shards = self.workers * shards_per_worker
+
+    @staticmethod
+    def load_events(db: Session = None, snapshot=None):
+        """Lit les événements depuis un EventSnapshot ou, à défaut, depuis la base"""
+        if snapshot is not None:
+            return (
+                (snapshot.purchase_sessions, snapshot.purchase_items, snapshot.purchase_times),
+                (snapshot.view_sessions, snapshot.view_items, snapshot.view_times),
+            )
+        return read_events(db)
+
+    def _shards(self, purchases, views):
+        """Répartit les événements par session_id % num_shards"""
+        purchase_shard = np.asarray(purchases[0]) % self.num_shards
+        view_shard = np.asarray(views[0]) % self.num_shards
+        for shard in range(self.num_shards):
+            p_mask, v_mask = purchase_shard == shard, view_shard == shard
+            if p_mask.any() or v_mask.any():
+                yield (
+                    *(np.asarray(column, dtype=np.int64)[p_mask] for column in purchases),
+                    *(np.asarray(column, dtype=np.int64)[v_mask] for column in views),
+                )
+
+    def _reduce(self, events, item_ids, cutoff_ts):
+        purchases, views = events
+        tasks = ((shard, item_ids, cutoff_ts) for shard in self._shards(purchases, views))
+        total = None
+        if self.workers == 1:
+            for task in tasks:
+                total = _merge(total, _count_shard(task))
+            return total
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = set()
+            for task in tasks:
+                pending.add(executor.submit(_count_shard, task))
+                if len(pending) >= 2 * self.workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        total = _merge(total, future.result())
+            for future in pending:
+                total = _merge(total, future.result())
+        return total
+
+    def build_index(self, events, today=None, weights=DEFAULT_WEIGHTS):
+        """Construit un CooccurrenceIndex identique à CooccurrenceIndex.from_events"""
+        started = time.perf_counter()
+        purchases, views = events
+        item_ids = np.unique(np.concatenate([purchases[1], views[1]])).astype(np.int64)
+        cutoff_ts = to_timestamps([recent_purchase_cutoff(today)])[0]
+        counts = self._reduce(events, item_ids, cutoff_ts)
+        if counts is None:
+            return CooccurrenceIndex.from_events(*purchases, *views, today=today, weights=weights)
+
+        counts["purchased"] = sp.vstack(counts["purchased"])
+        counts["recent_purchased"] = sp.vstack(counts["recent_purchased"])
+        index = CooccurrenceIndex(item_ids, weights=weights, **counts)
+        logger.info(f"Index construit en {time.perf_counter() - started:.2f} s ({self.workers} workers)")
+        return index
+
+    def write_scores(self, db: Session, index, now=None):
+        """Remplace weighted_recommendations par les scores de l'index (ceux de recommend_for_product)"""
+        now = now or datetime.now()
+        table = WeightedRecommendation.__table__
+        Base.metadata.create_all(db.get_bind(), tables=[table])
+        coo = index.scores.tocoo()
+        try:
+            db.execute(table.delete())
+            for start in range(0, coo.nnz, INSERT_CHUNK_SIZE):
+                end = start + INSERT_CHUNK_SIZE
+                db.execute(table.insert(), [
+                    {
+                        "source_item_id": int(index.item_ids[row]),
+                        "recommended_item_id": int(index.item_ids[col]),
+                        "score": float(score),
+                        "last_updated": now,
+                    }
+                    for row, col, score in zip(coo.row[start:end], coo.col[start:end], coo.data[start:end])
+                ])
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Erreur lors de l'écriture des recommandations: {str(e)}")
+            raise
+        return coo.nnz
+
+
+if __name__ == "__main__":
+    import argparse
+    from .database import SessionLocal
+    from .snapshot import EventSnapshot
+
+    parser = argparse.ArgumentParser(description="Construction parallèle du modèle de co-occurrence")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--snapshot", default=None, help="Instantané EventSnapshot à lire plutôt que la base")
+    parser.add_argument("--output", default=None, help="Fichier de l'index ; sinon écriture dans weighted_recommendations")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    builder = ParallelCooccurrenceBuilder(workers=args.workers)
+    snapshot = EventSnapshot.open(args.snapshot) if args.snapshot else None
+    events = builder.load_events(db, snapshot=snapshot)
+    started = time.perf_counter()
+    index = builder.build_index(events)
+    if args.output:
+        index.save(args.output)
+        print(f"✅ Index enregistré dans {args.output} ({time.perf_counter() - started:.1f} s)")
+    else:
+        written = builder.write_scores(db, index)
+        print(f"✅ {written} recommandations écrites ({time.perf_counter() - started:.1f} s)")
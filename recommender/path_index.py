@@ -0,0 +1,141 @@
+from sqlalchemy.orm import Session
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import bisect
+import pickle
+from .queries import get_queries
+
+FETCH_SIZE = 10000
+
+
+def _count_level(args):
+    """Compte les parcours de longueur `level` d'un fragment de sessions
+
+    Seuls les parcours dont le préfixe de longueur level - 1 était fréquent
+    sont étendus (le support ne peut que décroître avec la longueur).
+    """
+    shard, level, frequent = args
+    counts = Counter()
+    for views, purchase, items in shard:
+        path = (views[:level], purchase)
+        parent = (views[:level - 1], purchase)
+        for item in items:
+            if frequent is None or (item, parent) in frequent:
+                counts[(item, path)] += 1
+    return counts
+
+
+class PurchasePathIndex:
+    """Parcours d'achat fréquents précalculés pour tout le catalogue, indexés par item"""
+
+    def __init__(self, paths, max_depth, min_support, built_at=None):
+        # paths[item_id][longueur] : liste triée de (fréquence décroissante, parcours)
+        self.paths = paths
+        self.max_depth = max_depth
+        self.min_support = min_support
+        self.built_at = built_at or datetime.now()
+
+    @staticmethod
+    def _load_sessions(db: Session, max_depth):
+        """Lit en flux les parcours de chaque session et les items consultés qu'elle contient"""
+        queries = get_queries(db.get_bind())
+        sessions = {}
+        current_session, views = None, None
+        result = db.execute(queries["catalog_purchase_paths"], execution_options={"stream_results": True})
+        for partition in result.partitions(FETCH_SIZE):
+            for session_id, viewed_item, purchased_item in partition:
+                if session_id != current_session:
+                    current_session, views = session_id, []
+                    sessions[session_id] = [views, purchased_item]
+                if len(views) < max_depth:
+                    views.append(viewed_item)
+
+        items_by_session = {}
+        result = db.execute(queries["session_items"], execution_options={"stream_results": True})
+        for partition in result.partitions(FETCH_SIZE):
+            for session_id, item_id in partition:
+                if session_id in sessions:
+                    items_by_session.setdefault(session_id, []).append(item_id)
+
+        return [
+            (session_id, tuple(views), purchase, tuple(items_by_session.get(session_id, ())))
+            for session_id, (views, purchase) in sessions.items()
+        ]
+
+    @classmethod
+    def build(cls, db: Session, max_depth=5, min_support=2, workers=1):
+        """Extrait en une passe les parcours fréquents de tous les items, par niveaux de longueur"""
+        sessions = cls._load_sessions(db, max_depth)
+
+        # Fragmentation par session_id : chaque session est traitée par un seul worker
+        num_shards = max(workers, 1)
+        shards = [[] for _ in range(num_shards)]
+        for session_id, views, purchase, items in sessions:
+            shards[hash(session_id) % num_shards].append((views, purchase, items))
+
+        paths = {}
+        frequent = None
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            for level in range(1, max_depth + 1):
+                tasks = [(shard, level, frequent) for shard in shards]
+                partials = executor.map(_count_level, tasks) if executor else map(_count_level, tasks)
+                counts = Counter()
+                for partial in partials:
+                    counts.update(partial)
+
+                frequent = {key for key, count in counts.items() if count >= min_support}
+                if not frequent:
+                    break
+                for item, (views, purchase) in frequent:
+                    paths.setdefault(item, {}).setdefault(level, []).append(
+                        (-counts[(item, (views, purchase))], views + (purchase,))
+                    )
+        finally:
+            if executor:
+                executor.shutdown()
+
+        for levels in paths.values():
+            for level in levels:
+                levels[level].sort()
+        return cls(paths, max_depth, min_support)
+
+    def covers(self, max_path_length, min_support):
+        """Indique si l'index peut répondre pour ces paramètres"""
+        return 1 <= max_path_length <= self.max_depth and min_support >= self.min_support
+
+    def get(self, item_id, max_path_length=3, min_support=2):
+        """Parcours fréquents de l'item au format de ProductRecommender.get_purchase_paths"""
+        ranked = self.paths.get(item_id, {}).get(max_path_length)
+        if not ranked:
+            return []
+        # Liste triée par fréquence décroissante : on coupe au support demandé
+        end = bisect.bisect_right(ranked, (-min_support, (float("inf"),)))
+        return [{"path": list(path), "frequency": -count} for count, path in ranked[:end]]
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+if __name__ == "__main__":
+    import argparse
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Construction de l'index des parcours d'achat")
+    parser.add_argument("--depth", type=int, default=5)
+    parser.add_argument("--min-support", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", default="purchase_paths.idx")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    index = PurchasePathIndex.build(db, max_depth=args.depth, min_support=args.min_support, workers=args.workers)
+    index.save(args.output)
+    print(f"✅ Parcours de {len(index.paths)} items enregistrés dans {args.output}")
@@ -0,0 +1,225 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import inspect
+from collections import Counter
+from datetime import datetime, timedelta
+from .cooccurrence_index import to_timestamps
+from .queries import get_queries
+from .models import WeightedRecommendation
+from .metrics import timed
+import numpy as np
+import heapq
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Intervalles de comptage de la popularité récente et nombre d'intervalles conservés
+BUCKET_SIZE = timedelta(hours=1)
+BUCKETS_KEPT = 7 * 24
+# Intervalles les plus récents composant la tendance
+TRENDING_BUCKETS = 24
+# Longueur des classements gardés en mémoire
+TOP_N = 100
+POPULARITY_FETCH_SIZE = 10000
+
+
+class PopularityTracker:
+    """Items les plus achetés (globalement et par intervalle de temps), tenus à jour au fil des achats
+
+    La table des degrés (nombre d'items distincts que recommend_for_product peut renvoyer
+    pour chaque item source) désigne d'avance les items froids : leur requête de
+    co-occurrence renverrait une liste vide. Elle est lue dans weighted_recommendations,
+    tenue à jour par refresher.py quel que soit le chemin d'écriture des événements, ou
+    dans l'index servi (degrees_from_index). Elle est rechargée toutes les
+    refresh_interval secondes par un seul thread, les autres lisant l'ancienne table ;
+    tant qu'aucune n'est disponible, aucun item n'est considéré comme froid.
+    """
+
+    def __init__(self, db: Session, bucket_size=BUCKET_SIZE, buckets_kept=BUCKETS_KEPT,
+                 trending_buckets=TRENDING_BUCKETS, top_n=TOP_N, refresh_interval=300):
+        self.db = db
+        self.queries = get_queries(db.get_bind())
+        self.bucket_seconds = int(bucket_size.total_seconds())
+        self.buckets_kept = buckets_kept
+        self.trending_buckets = trending_buckets
+        self.top_n = top_n
+        self.refresh_interval = refresh_interval
+        self.global_counts = Counter()
+        # Début d'intervalle (secondes epoch) → achats par item
+        self.buckets = {}
+        self.degrees = None
+        # CooccurrenceIndex optionnel dont les degrés remplacent ceux de la base
+        self.index = None
+        self._rankings = {}
+        self._loaded_at = None
+        self._degrees_at = None
+        self._lock = threading.Lock()
+        # Un seul chargement à la fois (load appelle refresh_degrees)
+        self._refresh_lock = threading.RLock()
+
+    def _bucket_starts(self, timestamps):
+        return timestamps - timestamps % self.bucket_seconds
+
+    def _add_to_buckets(self, items, timestamps):
+        starts = self._bucket_starts(timestamps)
+        for start in np.unique(starts).tolist():
+            self.buckets.setdefault(start, Counter()).update(items[starts == start].tolist())
+        # Les intervalles sont conservés relativement au plus récent observé
+        for start in sorted(self.buckets)[:-self.buckets_kept]:
+            del self.buckets[start]
+
+    @timed("PopularityTracker.load")
+    def load(self, now=None):
+        """Charge les compteurs globaux, les intervalles récents et les degrés depuis la base"""
+        now = now or datetime.now()
+        since = now - timedelta(seconds=self.bucket_seconds * self.buckets_kept)
+        with self._refresh_lock:
+            global_counts = Counter({
+                int(item_id): int(count) for item_id, count in self.db.execute(self.queries["item_purchase_counts"])
+            })
+            result = self.db.execute(
+                self.queries["purchases_since"], {"since": since},
+                execution_options={"stream_results": True}
+            )
+            with self._lock:
+                self.global_counts = global_counts
+                self.buckets = {}
+                for partition in result.partitions(POPULARITY_FETCH_SIZE):
+                    items = np.array([row[0] for row in partition], dtype=np.int64)
+                    self._add_to_buckets(items, to_timestamps([row[1] for row in partition]))
+                self._rankings = {}
+                self._loaded_at = time.monotonic()
+            self.refresh_degrees()
+        logger.info(f"Popularité chargée: {self.stats()}")
+        return self
+
+    @timed("PopularityTracker.refresh_degrees")
+    def refresh_degrees(self):
+        """Relit les degrés : lignes non nulles de l'index servi, sinon weighted_recommendations"""
+        with self._refresh_lock:
+            if self.index is not None:
+                degrees = dict(zip(self.index.item_ids.tolist(), np.diff(self.index.scores.indptr).tolist()))
+            elif not inspect(self.db.get_bind()).has_table(WeightedRecommendation.__tablename__):
+                # Base initialisée sans refresher : traitée comme une table vide
+                degrees = {}
+            else:
+                result = self.db.execute(self.queries["item_degrees"])
+                degrees = {int(item_id): int(degree) for item_id, degree in result}
+            if not degrees:
+                logger.warning("weighted_recommendations absente ou vide : détection des items froids désactivée")
+            with self._lock:
+                self.degrees = degrees or None
+                self._degrees_at = time.monotonic()
+            return len(degrees)
+
+    def degrees_from_index(self, index):
+        """Lit désormais les degrés dans un CooccurrenceIndex servi à la place de la base"""
+        self.index = index
+        return self.refresh_degrees()
+
+    def _degrees_expired(self):
+        return (
+            self.refresh_interval is not None
+            and time.monotonic() - self._degrees_at > self.refresh_interval
+        )
+
+    def _ensure_loaded(self):
+        """Charge au premier appel (à faire au démarrage), puis recharge les degrés expirés
+
+        Les appels concurrents attendent le premier chargement au lieu d'en lancer un autre ;
+        après expiration, l'ancienne table reste servie tant qu'un autre thread recharge.
+        """
+        if self._loaded_at is None:
+            with self._refresh_lock:
+                if self._loaded_at is None:
+                    self.load()
+        elif self._degrees_expired() and self._refresh_lock.acquire(blocking=False):
+            try:
+                if self._degrees_expired():
+                    self.refresh_degrees()
+            except Exception as e:
+                logger.error(f"Erreur lors du rechargement des degrés: {str(e)}")
+            finally:
+                self._refresh_lock.release()
+
+    def record_purchases(self, events):
+        """Ajoute un lot d'achats (session_ids, item_ids, dates) aux compteurs"""
+        items = np.asarray(events[1], dtype=np.int64)
+        timestamps = to_timestamps(events[2])
+        if not len(items):
+            return
+
+        with self._lock:
+            self.global_counts.update(items.tolist())
+            self._add_to_buckets(items, timestamps)
+            self._rankings = {}
+
+    def is_cold(self, item_id):
+        """Vrai si recommend_for_product ne trouverait aucune co-occurrence pour cet item"""
+        self._ensure_loaded()
+        degrees = self.degrees
+        return degrees is not None and degrees.get(item_id, 0) == 0
+
+    def _counts(self, name):
+        if name == "global":
+            return self.global_counts
+        trending = Counter()
+        for start in sorted(self.buckets)[-self.trending_buckets:]:
+            trending.update(self.buckets[start])
+        return trending
+
+    def _ranking(self, name, size):
+        """Classement décroissant (achats, puis item_id), mis en cache jusqu'au prochain lot"""
+        with self._lock:
+            ranking, complete = self._rankings.get(name, (None, False))
+            if ranking is None or (len(ranking) < size and not complete):
+                counts = self._counts(name)
+                ranking = [
+                    item_id for item_id, _ in
+                    heapq.nsmallest(max(size, self.top_n), counts.items(), key=lambda entry: (-entry[1], entry[0]))
+                ]
+                self._rankings[name] = (ranking, len(ranking) == len(counts))
+            return ranking
+
+    def top(self, num_items=10, exclude=(), trending=False):
+        """Items les plus achetés, sur tout l'historique ou sur les intervalles récents"""
+        self._ensure_loaded()
+        exclude = set(exclude)
+        ranking = self._ranking("trending" if trending else "global", num_items + len(exclude))
+        return [item_id for item_id in ranking if item_id not in exclude][:num_items]
+
+    def popular(self, num_items=10, exclude=()):
+        """Tendance d'abord, complétée par la popularité globale"""
+        items = self.top(num_items, exclude, trending=True)
+        if len(items) < num_items:
+            items += self.top(num_items - len(items), set(exclude) | set(items))
+        return items
+
+    def pad(self, recommendations, num_recommendations, exclude=()):
+        """Complète une liste trop courte par des items populaires (score 0, après les autres)"""
+        missing = num_recommendations - len(recommendations)
+        if missing <= 0:
+            return recommendations
+        exclude = set(exclude) | {rec["item_id"] for rec in recommendations}
+        return recommendations + [
+            {"item_id": item_id, "score": 0.0} for item_id in self.popular(missing, exclude)
+        ]
+
+    def bucket_top(self, bucket_start, num_items=10):
+        """Items les plus achetés d'un intervalle donné (datetime de début)"""
+        start = int(self._bucket_starts(to_timestamps([bucket_start]))[0])
+        with self._lock:
+            counts = self.buckets.get(start, Counter())
+            return [item_id for item_id, _ in counts.most_common(num_items)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "items": len(self.global_counts),
+                "warm_items": sum(1 for degree in (self.degrees or {}).values() if degree > 0),
+                "buckets": len(self.buckets),
+                "latest_bucket": (
+                    str(np.datetime64(max(self.buckets), "s").astype(datetime)) if self.buckets else None
+                ),
+            }
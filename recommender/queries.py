@@ -0,0 +1,858 @@
+from sqlalchemy import text, bindparam, Integer, Float, String, DateTime
+from datetime import date, datetime, time, timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Fenêtre de pertinence des achats « achetés ensemble »
+RECENT_PURCHASE_DAYS = 90
+
+
+def recent_purchase_cutoff(today=None):
+    """Début de la fenêtre (minuit, il y a RECENT_PURCHASE_DAYS jours), calculé côté Python pour tous les dialectes"""
+    today = today or date.today()
+    return datetime.combine(today - timedelta(days=RECENT_PURCHASE_DAYS), time())
+
+
+def _expanding(statement, *names):
+    """Déclare des paramètres IN (liste) rendus correctement par chaque driver"""
+    return statement.bindparams(*(bindparam(name, expanding=True) for name in names))
+
+
+def _datetimes(statement, *names):
+    """Type les paramètres de date : même format que les colonnes DateTime (SQLite compare des chaînes)"""
+    return statement.bindparams(*(bindparam(name, type_=DateTime) for name in names))
+
+
+# Composantes de la recommandation pour un produit, exécutables aussi séparément
+_RECENT_INTERACTIONS = """
+        SELECT item_id, MAX(event_date) as last_interaction FROM (
+            SELECT p2.item_id, p2.purchase_date as event_date
+            FROM purchases p1
+            JOIN purchases p2 ON p1.session_id = p2.session_id
+            WHERE p1.item_id = :item_id AND p2.item_id <> :item_id
+
+            UNION ALL
+
+            SELECT s2.item_id, s2.view_date as event_date
+            FROM sessions s1
+            JOIN sessions s2 ON s1.session_id = s2.session_id
+            WHERE s1.item_id = :item_id AND s2.item_id <> :item_id
+        ) all_events
+        GROUP BY item_id"""
+
+_BOUGHT_TOGETHER = """
+        SELECT
+            p2.item_id,
+            COUNT(*) as bt_score,
+            COUNT(DISTINCT p1.session_id) as unique_sessions
+        FROM purchases p1
+        JOIN purchases p2 ON p1.session_id = p2.session_id
+        WHERE p1.item_id = :item_id
+        AND p2.item_id <> :item_id
+        AND p1.purchase_date >= :since
+        GROUP BY p2.item_id"""
+
+_VIEW_PURCHASE = """
+        SELECT
+            p.item_id,
+            COUNT(*) as vp_score
+        FROM sessions s
+        JOIN purchases p
+            ON s.session_id = p.session_id
+            AND s.view_date < p.purchase_date
+        WHERE s.item_id = :item_id
+        AND p.item_id <> :item_id
+        GROUP BY p.item_id"""
+
+_SINGLE_PRODUCT_CTES = f"""
+    WITH recent_interactions AS ({_RECENT_INTERACTIONS}
+    ),
+    bought_together AS ({_BOUGHT_TOGETHER}
+    ),
+    view_purchase AS ({_VIEW_PURCHASE}
+    )"""
+
+PRODUCT_RECENT_INTERACTIONS = text(_RECENT_INTERACTIONS).columns(item_id=Integer, last_interaction=DateTime)
+PRODUCT_BOUGHT_TOGETHER = text(_BOUGHT_TOGETHER)
+PRODUCT_VIEW_PURCHASE = text(_VIEW_PURCHASE)
+
+# PostgreSQL : FULL OUTER JOIN et NULLS LAST natifs
+RECOMMEND_FOR_PRODUCT_POSTGRESQL = text(_SINGLE_PRODUCT_CTES + """
+    SELECT
+        COALESCE(bt.item_id, vp.item_id) as item_id,
+        (COALESCE(bt.bt_score, 0) * 2) +
+        (COALESCE(bt.unique_sessions, 0) * 1.5) +
+        (COALESCE(vp.vp_score, 0) * 3) as score,
+        ri.last_interaction
+    FROM
+        bought_together bt
+    FULL OUTER JOIN
+        view_purchase vp ON bt.item_id = vp.item_id
+    LEFT JOIN
+        recent_interactions ri ON COALESCE(bt.item_id, vp.item_id) = ri.item_id
+    ORDER BY
+        score DESC,
+        last_interaction DESC NULLS LAST
+    LIMIT :limit
+""")
+
+# MySQL / SQLite : union des candidats à la place du FULL OUTER JOIN,
+# et « IS NULL » en premier critère pour reproduire NULLS LAST
+RECOMMEND_FOR_PRODUCT_PORTABLE = text(_SINGLE_PRODUCT_CTES + """,
+    candidates AS (
+        SELECT item_id FROM bought_together
+        UNION
+        SELECT item_id FROM view_purchase
+    )
+    SELECT
+        c.item_id,
+        (COALESCE(bt.bt_score, 0) * 2) +
+        (COALESCE(bt.unique_sessions, 0) * 1.5) +
+        (COALESCE(vp.vp_score, 0) * 3) as score,
+        ri.last_interaction
+    FROM
+        candidates c
+    LEFT JOIN
+        bought_together bt ON bt.item_id = c.item_id
+    LEFT JOIN
+        view_purchase vp ON vp.item_id = c.item_id
+    LEFT JOIN
+        recent_interactions ri ON ri.item_id = c.item_id
+    ORDER BY
+        score DESC,
+        ri.last_interaction IS NULL,
+        ri.last_interaction DESC
+    LIMIT :limit
+""")
+
+# Composantes de la recommandation multi-produits
+_PRODUCTS_BOUGHT_TOGETHER = """
+        SELECT
+            p2.item_id,
+            COUNT(*) as together_score,
+            COUNT(DISTINCT p1.session_id) as unique_sessions
+        FROM purchases p1
+        JOIN purchases p2 ON p1.session_id = p2.session_id
+        WHERE p1.item_id IN :item_ids
+        AND p2.item_id NOT IN :item_ids
+        -- Filtre sur les 90 derniers jours pour la pertinence temporelle
+        AND p1.purchase_date >= :since
+        GROUP BY p2.item_id"""
+
+_PRODUCTS_VIEW_PURCHASE = """
+        SELECT
+            p.item_id,
+            COUNT(*) as sequence_score
+        FROM sessions s
+        JOIN purchases p
+            ON s.session_id = p.session_id
+            -- Assurez-vous que la consultation a précédé l'achat
+            AND s.view_date < p.purchase_date
+        WHERE s.item_id IN :item_ids
+        AND p.item_id NOT IN :item_ids
+        GROUP BY p.item_id"""
+
+RECOMMEND_FOR_PRODUCTS = _expanding(text(f"""
+    -- Produits achetés ensemble
+    WITH purchase_together AS ({_PRODUCTS_BOUGHT_TOGETHER}
+    ),
+    -- Détection de séquences (consulté puis acheté)
+    sequence_patterns AS ({_PRODUCTS_VIEW_PURCHASE}
+    )
+    -- Combinaison des scores avec pondération
+    SELECT
+        COALESCE(pt.item_id, sp.item_id) as item_id,
+        (COALESCE(pt.together_score, 0) * 2) +
+        (COALESCE(pt.unique_sessions, 0) * 1.5) +
+        (COALESCE(sp.sequence_score, 0) * 3) as weighted_score
+    FROM
+        purchase_together pt
+    LEFT JOIN
+        sequence_patterns sp ON pt.item_id = sp.item_id
+    ORDER BY
+        weighted_score DESC
+    LIMIT :limit
+"""), "item_ids")
+
+PRODUCTS_BOUGHT_TOGETHER = _expanding(text(_PRODUCTS_BOUGHT_TOGETHER), "item_ids")
+PRODUCTS_VIEW_PURCHASE = _expanding(text(_PRODUCTS_VIEW_PURCHASE), "item_ids")
+
+# Top-k de plusieurs items sources en une seule requête ensembliste
+RECOMMEND_FOR_EACH = _expanding(text("""
+    WITH recent_interactions AS (
+        SELECT source_id, item_id, MAX(event_date) as last_interaction FROM (
+            SELECT p1.item_id as source_id, p2.item_id, p2.purchase_date as event_date
+            FROM purchases p1
+            JOIN purchases p2 ON p1.session_id = p2.session_id
+            WHERE p1.item_id IN :item_ids AND p2.item_id <> p1.item_id
+
+            UNION ALL
+
+            SELECT s1.item_id as source_id, s2.item_id, s2.view_date as event_date
+            FROM sessions s1
+            JOIN sessions s2 ON s1.session_id = s2.session_id
+            WHERE s1.item_id IN :item_ids AND s2.item_id <> s1.item_id
+        ) all_events
+        GROUP BY source_id, item_id
+    ),
+    bought_together AS (
+        SELECT
+            p1.item_id as source_id,
+            p2.item_id,
+            COUNT(*) as bt_score,
+            COUNT(DISTINCT p1.session_id) as unique_sessions
+        FROM purchases p1
+        JOIN purchases p2 ON p1.session_id = p2.session_id
+        WHERE p1.item_id IN :item_ids
+        AND p2.item_id <> p1.item_id
+        AND p1.purchase_date >= :since
+        GROUP BY p1.item_id, p2.item_id
+    ),
+    view_purchase AS (
+        SELECT
+            s.item_id as source_id,
+            p.item_id,
+            COUNT(*) as vp_score
+        FROM sessions s
+        JOIN purchases p
+            ON s.session_id = p.session_id
+            AND s.view_date < p.purchase_date
+        WHERE s.item_id IN :item_ids
+        AND p.item_id <> s.item_id
+        GROUP BY s.item_id, p.item_id
+    ),
+    candidates AS (
+        SELECT source_id, item_id FROM bought_together
+        UNION
+        SELECT source_id, item_id FROM view_purchase
+    ),
+    scored AS (
+        SELECT
+            c.source_id,
+            c.item_id,
+            (COALESCE(bt.bt_score, 0) * 2) +
+            (COALESCE(bt.unique_sessions, 0) * 1.5) +
+            (COALESCE(vp.vp_score, 0) * 3) as score,
+            ri.last_interaction
+        FROM
+            candidates c
+        LEFT JOIN
+            bought_together bt ON bt.source_id = c.source_id AND bt.item_id = c.item_id
+        LEFT JOIN
+            view_purchase vp ON vp.source_id = c.source_id AND vp.item_id = c.item_id
+        LEFT JOIN
+            recent_interactions ri ON ri.source_id = c.source_id AND ri.item_id = c.item_id
+    ),
+    ranked AS (
+        SELECT
+            source_id,
+            item_id,
+            score,
+            ROW_NUMBER() OVER (
+                PARTITION BY source_id
+                ORDER BY score DESC, last_interaction IS NULL, last_interaction DESC
+            ) as position
+        FROM scored
+    )
+    SELECT source_id, item_id, score
+    FROM ranked
+    WHERE position <= :limit
+    ORDER BY source_id, position
+"""), "item_ids")
+
+PURCHASE_PATHS = text("""
+    SELECT
+        s1.session_id,
+        s1.item_id as viewed_item,
+        s1.view_date,
+        p.item_id as purchased_item,
+        p.purchase_date
+    FROM
+        sessions s1
+    JOIN
+        purchases p ON s1.session_id = p.session_id
+    WHERE
+        -- Limiter aux sessions qui incluent l'item d'intérêt
+        s1.session_id IN (
+            SELECT DISTINCT session_id
+            FROM sessions
+            WHERE item_id = :item_id
+        )
+        -- S'assurer que la consultation précède l'achat
+        AND s1.view_date < p.purchase_date
+    ORDER BY
+        s1.session_id, s1.view_date
+""")
+
+# Lignes consultation → achat de tout le catalogue, dans l'ordre de PURCHASE_PATHS (path_index.py)
+CATALOG_PURCHASE_PATHS = text("""
+    SELECT s1.session_id, s1.item_id, p.item_id
+    FROM sessions s1
+    JOIN purchases p ON s1.session_id = p.session_id
+    WHERE s1.view_date < p.purchase_date
+    ORDER BY s1.session_id, s1.view_date
+""")
+
+# Items consultés de chaque session (path_index.py)
+SESSION_ITEMS = text("""
+    SELECT DISTINCT session_id, item_id FROM sessions
+""")
+
+# Sessions ayant acheté ou consulté l'un des items (construction d'un shard, sharding.py)
+SESSIONS_WITH_ITEMS = _expanding(text("""
+    SELECT session_id FROM purchases WHERE item_id IN :item_ids
+    UNION
+    SELECT session_id FROM sessions WHERE item_id IN :item_ids
+"""), "item_ids")
+
+# COUNT(*) et COUNT(DISTINCT session) sont égaux pour BOUGHT_TOGETHER
+# (clé primaire session_id, item_id), d'où le poids 2 + 1.5
+PRECOMPUTED_RECOMMENDATIONS = text("""
+    SELECT recommended_item_id, score, last_updated
+    FROM weighted_recommendations
+    WHERE source_item_id = :item_id
+    ORDER BY score DESC
+    LIMIT :limit
+""").columns(recommended_item_id=Integer, score=Float, last_updated=DateTime)
+
+# Scores de recommend_for_product de tous les items sources à la fois (reconstruction complète)
+WEIGHTED_SCORES = text("""
+    SELECT source_item_id, recommended_item_id, SUM(score) as score
+    FROM (
+        SELECT
+            p1.item_id as source_item_id,
+            p2.item_id as recommended_item_id,
+            COUNT(*) * :bt_weight + COUNT(DISTINCT p1.session_id) * :us_weight as score
+        FROM purchases p1
+        JOIN purchases p2 ON p1.session_id = p2.session_id
+        WHERE p1.item_id <> p2.item_id
+        AND p1.purchase_date >= :since
+        GROUP BY p1.item_id, p2.item_id
+
+        UNION ALL
+
+        SELECT s.item_id, p.item_id, COUNT(*) * :vp_weight
+        FROM sessions s
+        JOIN purchases p
+            ON s.session_id = p.session_id
+            AND s.view_date < p.purchase_date
+        WHERE s.item_id <> p.item_id
+        GROUP BY s.item_id, p.item_id
+    ) scored
+    GROUP BY source_item_id, recommended_item_id
+""").columns(source_item_id=Integer, recommended_item_id=Integer, score=Float)
+
+KNOWN_ITEMS = text("""
+    SELECT item_id FROM purchases
+    UNION
+    SELECT item_id FROM sessions
+""")
+
+ITEM_EXISTS = text("""
+    SELECT COUNT(*) FROM (
+        SELECT item_id FROM purchases WHERE item_id = :item_id
+        UNION
+        SELECT item_id FROM sessions WHERE item_id = :item_id
+    ) AS combined_items
+""")
+
+ITEMS_EXIST = _expanding(text("""
+    SELECT DISTINCT item_id
+    FROM (
+        SELECT item_id FROM purchases WHERE item_id IN :item_ids
+        UNION
+        SELECT item_id FROM sessions WHERE item_id IN :item_ids
+    ) AS combined_items
+"""), "item_ids")
+
+# Échantillonnage aléatoire par recherche d'index : bornes du catalogue, puis
+# premier item_id supérieur ou égal à un pivot tiré au hasard
+ITEM_ID_BOUNDS = text("""
+    SELECT MIN(low_id), MAX(high_id) FROM (
+        SELECT MIN(item_id) as low_id, MAX(item_id) as high_id FROM purchases
+        UNION ALL
+        SELECT MIN(item_id) as low_id, MAX(item_id) as high_id FROM sessions
+    ) AS bounds
+""")
+
+ITEM_AT_OR_AFTER = text("""
+    SELECT MIN(item_id) FROM (
+        SELECT MIN(item_id) as item_id FROM purchases WHERE item_id >= :pivot
+        UNION ALL
+        SELECT MIN(item_id) as item_id FROM sessions WHERE item_id >= :pivot
+    ) AS next_items
+""")
+
+# Rapport catalogue : borne haute du prochain lot de chunk_size items consultés
+CATALOG_CHUNK_END = text("""
+    SELECT MAX(item_id) FROM (
+        SELECT DISTINCT item_id FROM sessions
+        WHERE item_id > :after
+        ORDER BY item_id
+        LIMIT :chunk_size
+    ) AS chunk
+""")
+
+# Mêmes métriques que StatsAnalyzer.calculate_stats, agrégées en base sur un intervalle d'items
+CATALOG_ITEM_STATS = text("""
+    SELECT
+        s.item_id,
+        COUNT(*) as total_views,
+        COUNT(p.purchase_date) as total_purchases
+    FROM sessions s
+    LEFT JOIN purchases p
+        ON p.session_id = s.session_id
+        AND p.item_id = s.item_id
+    WHERE s.item_id > :low AND s.item_id <= :high
+    GROUP BY s.item_id
+    ORDER BY s.item_id
+""")
+
+# Popularité : achats par item, toutes dates confondues
+ITEM_PURCHASE_COUNTS = text("""
+    SELECT item_id, COUNT(*) as purchases
+    FROM purchases
+    GROUP BY item_id
+""")
+
+# Achats récents, regroupés par intervalle de temps côté Python
+PURCHASES_SINCE = text("""
+    SELECT item_id, purchase_date
+    FROM purchases
+    WHERE purchase_date >= :since
+""").columns(item_id=Integer, purchase_date=DateTime)
+
+# Degré de chaque item source : nombre d'items distincts que recommend_for_product peut renvoyer,
+# lu dans les scores tenus à jour par refresher.py (clé primaire parcourue dans l'ordre)
+ITEM_DEGREES = text("""
+    SELECT source_item_id, COUNT(*) as degree
+    FROM weighted_recommendations
+    GROUP BY source_item_id
+""")
+
+# Rafraîchissement incrémental (refresher.py) : comptes complets des buckets (source, recommandé,
+# jour de l'item source) touchés par une ligne ingérée dans ]low, high], quelle que soit sa date.
+# Les comptes remplacent ceux de la table : recompter un bucket déjà compté est sans effet.
+REFRESH_BOUGHT_TOGETHER_COUNTS = _datetimes(text("""
+    SELECT t.source_item_id, t.recommended_item_id, t.bucket_date, COUNT(*)
+    FROM (
+        SELECT p1.item_id AS source_item_id, p2.item_id AS recommended_item_id,
+            DATE(p1.purchase_date) AS bucket_date
+        FROM purchases p1
+        JOIN purchases p2 ON p1.session_id = p2.session_id
+        WHERE p1.item_id <> p2.item_id
+        AND p1.ingested_at > :low AND p1.ingested_at <= :high
+        AND p2.ingested_at <= :high
+        AND p1.purchase_date >= :cutoff
+
+        UNION
+
+        SELECT p1.item_id, p2.item_id, DATE(p1.purchase_date)
+        FROM purchases p2
+        JOIN purchases p1 ON p1.session_id = p2.session_id
+        WHERE p1.item_id <> p2.item_id
+        AND p2.ingested_at > :low AND p2.ingested_at <= :high
+        AND p1.ingested_at <= :high
+        AND p1.purchase_date >= :cutoff
+    ) AS t
+    JOIN purchases p1
+        ON p1.item_id = t.source_item_id
+        AND DATE(p1.purchase_date) = t.bucket_date
+    JOIN purchases p2
+        ON p2.session_id = p1.session_id
+        AND p2.item_id = t.recommended_item_id
+    WHERE p1.ingested_at <= :high AND p2.ingested_at <= :high
+    GROUP BY t.source_item_id, t.recommended_item_id, t.bucket_date
+"""), "low", "high", "cutoff")
+
+REFRESH_VIEW_TO_PURCHASE_COUNTS = _datetimes(text("""
+    SELECT t.source_item_id, t.recommended_item_id, t.bucket_date, COUNT(*)
+    FROM (
+        SELECT s.item_id AS source_item_id, p.item_id AS recommended_item_id,
+            DATE(s.view_date) AS bucket_date
+        FROM sessions s
+        JOIN purchases p
+            ON s.session_id = p.session_id
+            AND s.view_date < p.purchase_date
+        WHERE s.item_id <> p.item_id
+        AND s.ingested_at > :low AND s.ingested_at <= :high
+        AND p.ingested_at <= :high
+
+        UNION
+
+        SELECT s.item_id, p.item_id, DATE(s.view_date)
+        FROM purchases p
+        JOIN sessions s
+            ON s.session_id = p.session_id
+            AND s.view_date < p.purchase_date
+        WHERE s.item_id <> p.item_id
+        AND p.ingested_at > :low AND p.ingested_at <= :high
+        AND s.ingested_at <= :high
+    ) AS t
+    JOIN sessions s
+        ON s.item_id = t.source_item_id
+        AND DATE(s.view_date) = t.bucket_date
+    JOIN purchases p
+        ON p.session_id = s.session_id
+        AND p.item_id = t.recommended_item_id
+        AND s.view_date < p.purchase_date
+    WHERE s.ingested_at <= :high AND p.ingested_at <= :high
+    GROUP BY t.source_item_id, t.recommended_item_id, t.bucket_date
+"""), "low", "high")
+
+# Seuls les comptes « achetés ensemble » sortent de la fenêtre de 90 jours
+REFRESH_EXPIRED_SOURCES = text("""
+    SELECT DISTINCT source_item_id
+    FROM recommendation_buckets
+    WHERE recommendation_type = 'BOUGHT_TOGETHER'
+    AND bucket_date < :cutoff
+""")
+
+REFRESH_DELETE_EXPIRED_BUCKETS = text("""
+    DELETE FROM recommendation_buckets
+    WHERE recommendation_type = 'BOUGHT_TOGETHER'
+    AND bucket_date < :cutoff
+""")
+
+REFRESH_DELETE_SOURCES = _expanding(text("""
+    DELETE FROM weighted_recommendations
+    WHERE source_item_id IN :source_ids
+"""), "source_ids")
+
+# bt_weight vaut bt + unique_sessions : (session_id, item_id) étant la clé de purchases,
+# chaque paire achetée ensemble compte une fois par session
+REFRESH_REBUILD_SOURCES = _expanding(text("""
+    INSERT INTO weighted_recommendations
+        (source_item_id, recommended_item_id, score, last_updated)
+    SELECT
+        source_item_id,
+        recommended_item_id,
+        SUM(CASE recommendation_type
+            WHEN 'BOUGHT_TOGETHER' THEN count * :bt_weight
+            ELSE count * :vp_weight
+        END),
+        :now
+    FROM recommendation_buckets
+    WHERE source_item_id IN :source_ids
+    AND (recommendation_type = 'VIEW_TO_PURCHASE' OR bucket_date >= :cutoff)
+    GROUP BY source_item_id, recommended_item_id
+    HAVING SUM(count) > 0
+"""), "source_ids")
+
+DATABASE_NOW = text("SELECT CURRENT_TIMESTAMP AS now").columns(now=DateTime)
+
+# Tampon de version d'un EventSnapshot : lignes ingérées après :since, lues sur les index ingested_at
+SNAPSHOT_STAMP = _datetimes(text("""
+    SELECT
+        (SELECT COUNT(*) FROM purchases WHERE ingested_at > :since) AS purchases,
+        (SELECT COUNT(*) FROM sessions WHERE ingested_at > :since) AS views
+"""), "since")
+
+# Scores décroissants (decay.py) : toutes les co-occurrences des paires touchées par une ligne
+# ingérée dans ]low, high], avec la date de leur dernier événement. Le compte décru jusqu'à :now
+# est recalculé sur tout l'historique de la paire et remplace celui de la table.
+_DECAY_BOUGHT_TOGETHER_EVENTS = """
+        SELECT
+            t.source_item_id,
+            t.recommended_item_id,
+            CASE WHEN p1.purchase_date >= p2.purchase_date
+                THEN p1.purchase_date ELSE p2.purchase_date END as event_time
+        FROM (
+            SELECT p1.item_id AS source_item_id, p2.item_id AS recommended_item_id
+            FROM purchases p1
+            JOIN purchases p2 ON p1.session_id = p2.session_id
+            WHERE p1.item_id <> p2.item_id
+            AND p1.ingested_at > :low AND p1.ingested_at <= :high
+            AND p2.ingested_at <= :high
+
+            UNION
+
+            SELECT p1.item_id, p2.item_id
+            FROM purchases p2
+            JOIN purchases p1 ON p1.session_id = p2.session_id
+            WHERE p1.item_id <> p2.item_id
+            AND p2.ingested_at > :low AND p2.ingested_at <= :high
+            AND p1.ingested_at <= :high
+        ) AS t
+        JOIN purchases p1 ON p1.item_id = t.source_item_id
+        JOIN purchases p2
+            ON p2.session_id = p1.session_id
+            AND p2.item_id = t.recommended_item_id
+        WHERE p1.ingested_at <= :high AND p2.ingested_at <= :high
+"""
+
+# Une consultation suivie d'un achat est datée par l'achat
+_DECAY_VIEW_TO_PURCHASE_EVENTS = """
+        SELECT
+            t.source_item_id,
+            t.recommended_item_id,
+            p.purchase_date as event_time
+        FROM (
+            SELECT s.item_id AS source_item_id, p.item_id AS recommended_item_id
+            FROM sessions s
+            JOIN purchases p
+                ON s.session_id = p.session_id
+                AND s.view_date < p.purchase_date
+            WHERE s.item_id <> p.item_id
+            AND s.ingested_at > :low AND s.ingested_at <= :high
+            AND p.ingested_at <= :high
+
+            UNION
+
+            SELECT s.item_id, p.item_id
+            FROM purchases p
+            JOIN sessions s
+                ON s.session_id = p.session_id
+                AND s.view_date < p.purchase_date
+            WHERE s.item_id <> p.item_id
+            AND p.ingested_at > :low AND p.ingested_at <= :high
+            AND s.ingested_at <= :high
+        ) AS t
+        JOIN sessions s ON s.item_id = t.source_item_id
+        JOIN purchases p
+            ON p.session_id = s.session_id
+            AND p.item_id = t.recommended_item_id
+            AND s.view_date < p.purchase_date
+        WHERE s.ingested_at <= :high AND p.ingested_at <= :high
+"""
+
+# Fusion dans decayed_recommendations : l'état recalculé remplace celui de la paire
+_DECAY_MERGE = """
+    INSERT INTO decayed_recommendations
+        (source_item_id, recommended_item_id, recommendation_type, count, decayed_count, updated_at)
+    SELECT
+        source_item_id,
+        recommended_item_id,
+        '{recommendation_type}',
+        COUNT(*),
+        SUM(POWER(0.5, {event_elapsed} / :half_life_seconds)),
+        :now
+    FROM ({events}) AS events
+    GROUP BY source_item_id, recommended_item_id
+    {conflict}
+"""
+
+# Secondes écoulées jusqu'à :now, bornées à 0 ("default" : SQLite)
+_ELAPSED_SECONDS = {
+    "mysql": "GREATEST(TIMESTAMPDIFF(SECOND, {since}, :now), 0)",
+    "postgresql": "GREATEST(EXTRACT(EPOCH FROM (:now - {since})), 0)",
+    "default": "MAX((julianday(:now) - julianday({since})) * 86400.0, 0)",
+}
+
+_DECAY_CONFLICT = {
+    "mysql": """ON DUPLICATE KEY UPDATE
+        count = VALUES(count),
+        decayed_count = VALUES(decayed_count),
+        updated_at = VALUES(updated_at)""",
+    "default": """ON CONFLICT (source_item_id, recommended_item_id, recommendation_type) DO UPDATE SET
+        count = excluded.count,
+        decayed_count = excluded.decayed_count,
+        updated_at = excluded.updated_at""",
+}
+
+
+def _decay_merge(recommendation_type, events):
+    statements = {}
+    for dialect, elapsed in _ELAPSED_SECONDS.items():
+        statements[dialect] = _datetimes(text(_DECAY_MERGE.format(
+            recommendation_type=recommendation_type,
+            event_elapsed=elapsed.format(since="event_time"),
+            events=events,
+            conflict=_DECAY_CONFLICT.get(dialect, _DECAY_CONFLICT["default"]),
+        )), "low", "high", "now")
+    return statements
+
+
+DECAY_SOURCE_STATES = _expanding(text("""
+    SELECT source_item_id, recommended_item_id, recommendation_type, count, decayed_count, updated_at
+    FROM decayed_recommendations
+    WHERE source_item_id IN :source_ids
+""").columns(
+    source_item_id=Integer, recommended_item_id=Integer, recommendation_type=String,
+    count=Integer, decayed_count=Float, updated_at=DateTime
+), "source_ids")
+
+# Score de recommend_for_product (fenêtre de 90 jours) des paires servies en mode décroissant
+DECAY_WEIGHTED_SCORES = _expanding(text("""
+    SELECT source_item_id, recommended_item_id, score
+    FROM weighted_recommendations
+    WHERE source_item_id IN :source_ids
+    AND recommended_item_id IN :item_ids
+"""), "source_ids", "item_ids")
+
+# Bucket recompté (refresher.py) : le compte complet remplace celui de la table
+_BUCKET_UPSERT = """
+    INSERT INTO recommendation_buckets
+        (source_item_id, recommended_item_id, recommendation_type, bucket_date, count)
+    VALUES (:source_item_id, :recommended_item_id, :recommendation_type, :bucket_date, :count)
+    {conflict}
+"""
+
+# Ingestion idempotente : une ligne déjà présente (même clé primaire) est conservée telle quelle
+_PURCHASE_UPSERT = """
+    INSERT INTO purchases (session_id, item_id, purchase_date)
+    VALUES (:session_id, :item_id, :purchase_date)
+    {conflict}
+"""
+
+_VIEW_UPSERT = """
+    INSERT INTO sessions (session_id, item_id, view_date)
+    VALUES (:session_id, :item_id, :view_date)
+    {conflict}
+"""
+
+# Registre des requêtes par dialecte ; "default" couvre les requêtes portables
+STATEMENTS = {
+    "recommend_for_product": {
+        "postgresql": RECOMMEND_FOR_PRODUCT_POSTGRESQL,
+        "default": RECOMMEND_FOR_PRODUCT_PORTABLE,
+    },
+    "recommend_for_products": {
+        "default": RECOMMEND_FOR_PRODUCTS,
+    },
+    "product_recent_interactions": {
+        "default": PRODUCT_RECENT_INTERACTIONS,
+    },
+    "product_bought_together": {
+        "default": PRODUCT_BOUGHT_TOGETHER,
+    },
+    "product_view_purchase": {
+        "default": PRODUCT_VIEW_PURCHASE,
+    },
+    "products_bought_together": {
+        "default": PRODUCTS_BOUGHT_TOGETHER,
+    },
+    "products_view_purchase": {
+        "default": PRODUCTS_VIEW_PURCHASE,
+    },
+    "recommend_for_each": {
+        "default": RECOMMEND_FOR_EACH,
+    },
+    "purchase_paths": {
+        "default": PURCHASE_PATHS,
+    },
+    "catalog_purchase_paths": {
+        "default": CATALOG_PURCHASE_PATHS,
+    },
+    "session_items": {
+        "default": SESSION_ITEMS,
+    },
+    "sessions_with_items": {
+        "default": SESSIONS_WITH_ITEMS,
+    },
+    "precomputed_recommendations": {
+        "default": PRECOMPUTED_RECOMMENDATIONS,
+    },
+    "weighted_scores": {
+        "default": WEIGHTED_SCORES,
+    },
+    "known_items": {
+        "default": KNOWN_ITEMS,
+    },
+    "item_exists": {
+        "default": ITEM_EXISTS,
+    },
+    "items_exist": {
+        "default": ITEMS_EXIST,
+    },
+    "item_id_bounds": {
+        "default": ITEM_ID_BOUNDS,
+    },
+    "item_at_or_after": {
+        "default": ITEM_AT_OR_AFTER,
+    },
+    "catalog_chunk_end": {
+        "default": CATALOG_CHUNK_END,
+    },
+    "catalog_item_stats": {
+        "default": CATALOG_ITEM_STATS,
+    },
+    "item_purchase_counts": {
+        "default": ITEM_PURCHASE_COUNTS,
+    },
+    "purchases_since": {
+        "default": PURCHASES_SINCE,
+    },
+    "item_degrees": {
+        "default": ITEM_DEGREES,
+    },
+    "refresh_bought_together_counts": {
+        "default": REFRESH_BOUGHT_TOGETHER_COUNTS,
+    },
+    "refresh_view_to_purchase_counts": {
+        "default": REFRESH_VIEW_TO_PURCHASE_COUNTS,
+    },
+    "refresh_expired_sources": {
+        "default": REFRESH_EXPIRED_SOURCES,
+    },
+    "refresh_delete_expired_buckets": {
+        "default": REFRESH_DELETE_EXPIRED_BUCKETS,
+    },
+    "refresh_delete_sources": {
+        "default": REFRESH_DELETE_SOURCES,
+    },
+    "refresh_rebuild_sources": {
+        "default": REFRESH_REBUILD_SOURCES,
+    },
+    "database_now": {
+        "default": DATABASE_NOW,
+    },
+    "snapshot_stamp": {
+        "default": SNAPSHOT_STAMP,
+    },
+    "decay_bought_together_merge": _decay_merge("BOUGHT_TOGETHER", _DECAY_BOUGHT_TOGETHER_EVENTS),
+    "decay_view_to_purchase_merge": _decay_merge("VIEW_TO_PURCHASE", _DECAY_VIEW_TO_PURCHASE_EVENTS),
+    "decay_source_states": {
+        "default": DECAY_SOURCE_STATES,
+    },
+    "decay_weighted_scores": {
+        "default": DECAY_WEIGHTED_SCORES,
+    },
+    "bucket_upsert": {
+        "mysql": text(_BUCKET_UPSERT.format(
+            conflict="ON DUPLICATE KEY UPDATE count = VALUES(count)"
+        )),
+        "default": text(_BUCKET_UPSERT.format(
+            conflict="ON CONFLICT (source_item_id, recommended_item_id, recommendation_type, bucket_date) "
+                     "DO UPDATE SET count = excluded.count"
+        )),
+    },
+    "purchase_upsert": {
+        "mysql": text(_PURCHASE_UPSERT.format(conflict="ON DUPLICATE KEY UPDATE session_id = session_id")),
+        "default": text(_PURCHASE_UPSERT.format(conflict="ON CONFLICT (session_id, item_id) DO NOTHING")),
+    },
+    "view_upsert": {
+        "mysql": text(_VIEW_UPSERT.format(conflict="ON DUPLICATE KEY UPDATE session_id = session_id")),
+        "default": text(_VIEW_UPSERT.format(conflict="ON CONFLICT (session_id, item_id, view_date) DO NOTHING")),
+    },
+}
+
+SUPPORTED_DIALECTS = ("mysql", "postgresql", "sqlite")
+
+_resolved = {}
+
+
+class DialectQueries:
+    """Requêtes résolues une fois pour un dialecte et réutilisées à chaque appel"""
+
+    def __init__(self, dialect):
+        if dialect not in SUPPORTED_DIALECTS:
+            logger.warning(f"Dialecte {dialect} non testé : utilisation des requêtes portables")
+        self.dialect = dialect
+        # Le nom du registre accompagne la requête jusqu'aux événements de l'engine (metrics.py)
+        self._statements = {
+            name: variants.get(dialect, variants["default"]).execution_options(query_name=name)
+            for name, variants in STATEMENTS.items()
+        }
+
+    def __getitem__(self, name):
+        return self._statements[name]
+
+
+def get_queries(bind):
+    """Renvoie les requêtes du dialecte de l'engine (ou de la connexion) fourni"""
+    dialect = bind.dialect.name
+    if dialect not in _resolved:
+        _resolved[dialect] = DialectQueries(dialect)
+    return _resolved[dialect]
@@ -1,279 +1,395 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import func, desc, text
-from collections import defaultdict
+from collections import defaultdict, Counter
+from datetime import datetime, timedelta
 from .models import Purchase, Session
 from .item_validator import ItemValidator
+from .cooccurrence_index import CooccurrenceIndex
+from .queries import get_queries, recent_purchase_cutoff
+from .sketches import SpaceSaving
+from .metrics import METRICS, timed
 import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Nombre de lignes lues par bloc lors de l'analyse des parcours d'achat
+PATH_FETCH_SIZE = 10000
+# Nombre d'items sources par requête de recommend_for_each
+BATCH_SOURCE_SIZE = 500
+
+class PathCounter:
+    """Regroupe au fil de l'eau les lignes de purchase_paths (triées par session) en parcours comptés
+
+    La mémoire dépend du nombre de parcours distincts, et reste bornée par
+    max_distinct_paths avec le comptage approximatif.
+    """
+
+    def __init__(self, max_path_length, max_distinct_paths=None):
+        self.max_path_length = max_path_length
+        self.path_counts = SpaceSaving(max_distinct_paths) if max_distinct_paths else Counter()
+        self._session = None
+        self._views, self._purchase = [], None
+
+    def _flush(self):
+        if self._session is not None:
+            self.path_counts.update([tuple(self._views + [self._purchase])])
+
+    def add(self, row):
+        session_id = row[0]
+        if session_id != self._session:
+            self._flush()
+            self._session = session_id
+            self._views, self._purchase = [], row[3]
+        # Limiter les chemins à max_path_length éléments dès la lecture
+        if len(self._views) < self.max_path_length:
+            self._views.append(row[1])
+
+    def frequent_paths(self, min_support):
+        """Parcours de fréquence au moins min_support, triés par fréquence"""
+        self._flush()
+        self._session = None
+        return [
+            {"path": list(path), "frequency": count}
+            for path, count in self.path_counts.most_common()
+            if count >= min_support
+        ]
+
 
 class ProductRecommender:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, index=None, use_precomputed=False,
+                 max_staleness=timedelta(days=1), refresher=None, validator=None,
+                 cache=None, path_index=None, snapshot=None, decayed_scores=None, neighbors=None,
+                 popularity=None):
         self.db = db
-        self.validator = ItemValidator(db)
+        self.validator = validator or ItemValidator(db)
+        # Dialecte détecté une seule fois : pas de requête en échec ni de repli à chaque appel
+        self.queries = get_queries(db.get_bind())
+        # Index de co-occurrence en mémoire optionnel (voir CooccurrenceIndex)
+        self.index = index
+        # EventSnapshot optionnel, ignoré s'il est périmé ; l'index en est construit sans requête
+        self.snapshot = None
+        if snapshot is not None:
+            if snapshot.is_stale(db):
+                logger.warning(f"Instantané {snapshot.path} périmé : lecture en base")
+                METRICS.increment("fallbacks", "stale_snapshot_to_db")
+            else:
+                self.snapshot = snapshot
+                if self.index is None:
+                    self.index = CooccurrenceIndex.from_snapshot(snapshot)
+        # Lecture des scores précalculés (weighted_recommendations) avant tout calcul en direct
+        self.use_precomputed = use_precomputed
+        self.max_staleness = max_staleness
+        # IncrementalRefresher optionnel : son watermark atteste la fraîcheur des lignes inchangées
+        self.refresher = refresher
+        # DecayedScores optionnel : classement par score à décroissance exponentielle, sans fenêtre de 90 jours
+        self.decayed_scores = decayed_scores
+        # NeighborTable optionnelle (top-K voisins approchés) pour les recommandations d'un item
+        self.neighbors = neighbors
+        # PopularityTracker optionnel : réponse directe pour les items froids, complément des listes courtes
+        self.popularity = popularity
+        # PurchasePathIndex optionnel construit hors ligne pour get_purchase_paths
+        self.path_index = path_index
+        # RecommendationCache optionnel partagé entre instances
+        self.cache = cache
+        # Chemin ayant servi le dernier appel ("cache", "decayed", "popularity", "neighbors", "index",
+        # "path_index", "precomputed" ou "live") ; les totaux sont dans METRICS (groupe "sources")
+        self.last_source = None
+    
+    def _record_source(self, source):
+        self.last_source = source
+        METRICS.increment("sources", source)
+    
+    def _padded(self, recommendations, num_recommendations, exclude):
+        """Complète une liste courte par les items populaires, sans requête supplémentaire"""
+        if self.popularity is None or len(recommendations) >= num_recommendations:
+            return recommendations
+        METRICS.increment("fallbacks", "short_list_to_popularity")
+        return self.popularity.pad(recommendations, num_recommendations, exclude)
+    
+    def _popular(self, num_recommendations, exclude):
+        """Recommandations des items froids : tendance puis popularité globale"""
+        self._record_source("popularity")
+        return self.popularity.pad([], num_recommendations, exclude)
+    
+    def _cached(self, method, item_ids, limit, compute, **params):
+        """Sert le résultat depuis le cache, ou le calcule une seule fois en cas d'absence"""
+        computed = []
+        
+        def compute_once():
+            computed.append(True)
+            return compute()
         
-    def recommend_for_product(self, item_id, num_recommendations=5):
+        key = self.cache.make_key(method, item_ids, limit, **params)
+        result = self.cache.get_or_compute(key, compute_once, item_ids=item_ids)
+        METRICS.increment("cache", f"{method}.{'miss' if computed else 'hit'}")
+        if not computed:
+            self._record_source("cache")
+        return result
+    
+    def _recommend_precomputed(self, item_id, num_recommendations):
+        """Lit les recommandations précalculées, None si absentes ou trop anciennes"""
+        try:
+            rows = self.db.execute(self.queries["precomputed_recommendations"], {
+                "item_id": item_id,
+                "limit": num_recommendations
+            }).fetchall()
+        except Exception as e:
+            logger.error(f"Erreur lors de la lecture des recommandations précalculées: {str(e)}")
+            METRICS.increment("fallbacks", "precomputed_error_to_live")
+            return None
+        
+        if not rows:
+            return None
+        
+        oldest_update = min((row[2] for row in rows if row[2] is not None), default=None)
+        if self.refresher is not None and self.refresher.watermark is not None:
+            oldest_update = max(oldest_update or self.refresher.watermark, self.refresher.watermark)
+        if oldest_update is None or oldest_update < datetime.now() - self.max_staleness:
+            return None
+        
+        return [{"item_id": row[0], "score": float(row[1])} for row in rows]
+        
+    @timed("ProductRecommender.recommend_for_product")
+    def recommend_for_product(self, item_id, num_recommendations=5, validate=True):
         """Recommande des produits basés sur un seul produit d'entrée"""
-        # Vérifier si l'item existe
-        if not self.validator.item_exists(item_id):
-            return []
-            
-        # Requête SQL optimisée combinant plusieurs stratégies dans une seule opération
-        query = text("""
-            WITH recent_interactions AS (
-                SELECT item_id, MAX(event_date) as last_interaction FROM (
-                    SELECT p2.item_id, p2.purchase_date as event_date
-                    FROM purchases p1
-                    JOIN purchases p2 ON p1.session_id = p2.session_id
-                    WHERE p1.item_id = :item_id AND p2.item_id <> :item_id
-                    
-                    UNION ALL
-                    
-                    SELECT s2.item_id, s2.view_date as event_date
-                    FROM sessions s1
-                    JOIN sessions s2 ON s1.session_id = s2.session_id
-                    WHERE s1.item_id = :item_id AND s2.item_id <> :item_id
-                ) all_events
-                GROUP BY item_id
-            ),
-            bought_together AS (
-                SELECT 
-                    p2.item_id, 
-                    COUNT(*) as bt_score,
-                    COUNT(DISTINCT p1.session_id) as unique_sessions
-                FROM purchases p1
-                JOIN purchases p2 ON p1.session_id = p2.session_id
-                WHERE p1.item_id = :item_id
-                AND p2.item_id <> :item_id
-                AND p1.purchase_date >= DATE_SUB(CURRENT_DATE(), INTERVAL 90 DAY)
-                GROUP BY p2.item_id
-            ),
-            view_purchase AS (
-                SELECT 
-                    p.item_id,
-                    COUNT(*) as vp_score
-                FROM sessions s
-                JOIN purchases p 
-                    ON s.session_id = p.session_id
-                    AND s.view_date < p.purchase_date
-                WHERE s.item_id = :item_id
-                AND p.item_id <> :item_id
-                GROUP BY p.item_id
+        if self.cache is not None:
+            return self._cached(
+                "recommend_for_product", [item_id], num_recommendations,
+                lambda: self._recommend_for_product(item_id, num_recommendations, validate),
+                validate=validate
             )
-            SELECT 
-                COALESCE(bt.item_id, vp.item_id) as item_id,
-                (COALESCE(bt.bt_score, 0) * 2) + 
-                (COALESCE(bt.unique_sessions, 0) * 1.5) + 
-                (COALESCE(vp.vp_score, 0) * 3) as score,
-                ri.last_interaction
-            FROM 
-                bought_together bt
-            FULL OUTER JOIN 
-                view_purchase vp ON bt.item_id = vp.item_id
-            LEFT JOIN
-                recent_interactions ri ON COALESCE(bt.item_id, vp.item_id) = ri.item_id
-            ORDER BY 
-                score DESC,
-                last_interaction DESC NULLS LAST
-            LIMIT :limit
-        """)
+        return self._recommend_for_product(item_id, num_recommendations, validate)
+    
+    def _recommend_for_product(self, item_id, num_recommendations, validate):
+        if self.decayed_scores is not None:
+            self._record_source("decayed")
+            if validate and not self.validator.item_exists(item_id):
+                return []
+            return self.decayed_scores.recommend(item_id, num_recommendations)
+        
+        if self.popularity is None:
+            return self._cooccurrence_for_product(item_id, num_recommendations, validate)
+        # Un item inconnu n'est jamais complété par les items populaires
+        if validate and not self.validator.item_exists(item_id):
+            return []
+        # Item froid connu d'avance (degré nul) : la requête de co-occurrence renverrait []
+        if self.popularity.is_cold(item_id):
+            return self._popular(num_recommendations, [item_id])
+        return self._padded(
+            self._cooccurrence_for_product(item_id, num_recommendations, False),
+            num_recommendations, [item_id]
+        )
+    
+    def _cooccurrence_for_product(self, item_id, num_recommendations, validate):
+        # Au-delà de k, la table de voisins ne connaît pas la suite du classement
+        if self.neighbors is not None and num_recommendations <= self.neighbors.k:
+            self._record_source("neighbors")
+            return self.neighbors.recommend(item_id, num_recommendations)
+        
+        # Avec un index chargé, la réponse ne nécessite aucune requête SQL
+        if self.index is not None:
+            self._record_source("index")
+            return self.index.recommend(item_id, num_recommendations)
+        
+        # Des lignes précalculées récentes suffisent : un seul parcours d'index
+        if self.use_precomputed:
+            recommendations = self._recommend_precomputed(item_id, num_recommendations)
+            if recommendations is not None:
+                self._record_source("precomputed")
+                return recommendations
+            METRICS.increment("fallbacks", "precomputed_to_live")
+        
+        self._record_source("live")
         
+        # Vérifier si l'item existe (sauf si l'appelant l'a déjà fait)
+        if validate and not self.validator.item_exists(item_id):
+            return []
+            
+        # Requête SQL combinant plusieurs stratégies dans une seule opération,
+        # choisie une fois pour toutes selon le dialecte de la base
         try:
-            # Utiliser une version compatible avec MySQL si nécessaire
-            result = self.db.execute(query, {"item_id": item_id, "limit": num_recommendations})
-            recommendations = [{"item_id": row[0], "score": row[1]} for row in result]
+            result = self.db.execute(self.queries["recommend_for_product"], {
+                "item_id": item_id,
+                "since": recent_purchase_cutoff(),
+                "limit": num_recommendations
+            })
+            recommendations = [{"item_id": row[0], "score": float(row[1])} for row in result]
         except Exception as e:
-            print(f"❌ Erreur SQL: {str(e)}. Essai avec une requête alternative.")
-            # Version alternative compatible avec MySQL
-            query_alt = text("""
-                WITH recent_events AS (
-                    SELECT item_id, event_date FROM (
-                        SELECT p2.item_id, p2.purchase_date as event_date
-                        FROM purchases p1
-                        JOIN purchases p2 ON p1.session_id = p2.session_id
-                        WHERE p1.item_id = :item_id AND p2.item_id <> :item_id
-                        AND p1.purchase_date >= DATE_SUB(CURRENT_DATE(), INTERVAL 90 DAY)
-                        
-                        UNION ALL
-                        
-                        SELECT s2.item_id, s2.view_date as event_date
-                        FROM sessions s1
-                        JOIN sessions s2 ON s1.session_id = s2.session_id
-                        WHERE s1.item_id = :item_id AND s2.item_id <> :item_id
-                    ) all_events
-                )
-                SELECT 
-                    c.item_id,
-                    c.total_score as score,
-                    MAX(re.event_date) as last_interaction
-                FROM (
-                    SELECT item_id, COUNT(*) * 2 as total_score
-                    FROM purchases p1
-                    JOIN purchases p2 ON p1.session_id = p2.session_id
-                    WHERE p1.item_id = :item_id
-                    AND p2.item_id <> :item_id
-                    GROUP BY p2.item_id
-                    
-                    UNION ALL
-                    
-                    SELECT p.item_id, COUNT(*) as total_score
-                    FROM sessions s
-                    JOIN purchases p ON s.session_id = p.session_id
-                    WHERE s.item_id = :item_id
-                    AND p.item_id <> :item_id
-                    AND s.view_date < p.purchase_date
-                    GROUP BY p.item_id
-                ) c
-                LEFT JOIN recent_events re ON c.item_id = re.item_id
-                GROUP BY c.item_id, c.total_score
-                ORDER BY score DESC, last_interaction DESC NULLS LAST
-                LIMIT :limit
-            """)
-            result = self.db.execute(query_alt, (item_id, item_id, item_id, item_id, num_recommendations))
-            recommendations = [{"item_id": row[0], "score": row[1]} for row in result]
+            logger.error(f"Erreur SQL: {str(e)}")
+            METRICS.increment("fallbacks", "sql_error_to_empty")
+            recommendations = []
             
         return recommendations
     
-    def recommend_for_products(self, item_ids, num_recommendations=5):
+    @timed("ProductRecommender.recommend_for_products")
+    def recommend_for_products(self, item_ids, num_recommendations=5, validate=True):
         """Recommande des produits basés sur plusieurs produits d'entrée"""
+        if self.cache is not None:
+            return self._cached(
+                "recommend_for_products", item_ids, num_recommendations,
+                lambda: self._recommend_for_products(item_ids, num_recommendations, validate),
+                validate=validate
+            )
+        return self._recommend_for_products(item_ids, num_recommendations, validate)
+    
+    def _recommend_for_products(self, item_ids, num_recommendations, validate):
+        if self.decayed_scores is not None:
+            self._record_source("decayed")
+            if validate:
+                item_ids = self.validator.items_exist(item_ids)[1]
+            if not item_ids:
+                return []
+            return self.decayed_scores.recommend_many(item_ids, num_recommendations)
+        
+        if self.popularity is None or not item_ids:
+            return self._cooccurrence_for_products(item_ids, num_recommendations, validate)
+        # Seuls les items existants comptent ; un panier sans aucun n'est pas complété
+        valid_items = self.validator.items_exist(item_ids)[1] if validate else list(item_ids)
+        if not valid_items:
+            return []
+        # Panier entièrement froid : aucune co-occurrence possible
+        if all(self.popularity.is_cold(item) for item in valid_items):
+            return self._popular(num_recommendations, item_ids)
+        return self._padded(
+            self._cooccurrence_for_products(valid_items, num_recommendations, False),
+            num_recommendations, item_ids
+        )
+    
+    def _cooccurrence_for_products(self, item_ids, num_recommendations, validate):
+        # Scoring vectorisé : les items inconnus de l'index sont ignorés comme les items invalides
+        if self.index is not None:
+            self._record_source("index")
+            return self.index.recommend_many(item_ids, num_recommendations)
+
+        self._record_source("live")
         # Vérifier si les items existent et obtenir la liste des items valides
-        all_exist, valid_items = self.validator.items_exist(item_ids)
+        if validate:
+            all_exist, valid_items = self.validator.items_exist(item_ids)
+        else:
+            valid_items = list(item_ids)
         
         if not valid_items:
             return []
         
         # Requête avec filtrage temporel et détection de séquences d'achat
-        query = text("""
-            -- Produits achetés ensemble
-            WITH purchase_together AS (
-                SELECT 
-                    p2.item_id, 
-                    COUNT(*) as together_score,
-                    COUNT(DISTINCT p1.session_id) as unique_sessions
-                FROM purchases p1
-                JOIN purchases p2 ON p1.session_id = p2.session_id
-                WHERE p1.item_id IN :item_ids
-                AND p2.item_id NOT IN :item_ids
-                -- Filtre sur les 90 derniers jours pour la pertinence temporelle
-                AND p1.purchase_date >= DATE_SUB(CURRENT_DATE(), INTERVAL 90 DAY)
-                GROUP BY p2.item_id
-            ),
-            -- Détection de séquences (consulté puis acheté)
-            sequence_patterns AS (
-                SELECT 
-                    p.item_id,
-                    COUNT(*) as sequence_score
-                FROM sessions s
-                JOIN purchases p 
-                    ON s.session_id = p.session_id
-                    -- Assurez-vous que la consultation a précédé l'achat
-                    AND s.view_date < p.purchase_date
-                WHERE s.item_id IN :item_ids
-                AND p.item_id NOT IN :item_ids
-                GROUP BY p.item_id
-            )
-            -- Combinaison des scores avec pondération
-            SELECT 
-                COALESCE(pt.item_id, sp.item_id) as item_id,
-                (COALESCE(pt.together_score, 0) * 2) + 
-                (COALESCE(pt.unique_sessions, 0) * 1.5) + 
-                (COALESCE(sp.sequence_score, 0) * 3) as weighted_score
-            FROM 
-                purchase_together pt
-            LEFT JOIN 
-                sequence_patterns sp ON pt.item_id = sp.item_id
-            ORDER BY 
-                weighted_score DESC
-            LIMIT :limit
-        """)
-        
         try:
-            result = self.db.execute(query, {
-                "item_ids": tuple(valid_items), 
+            result = self.db.execute(self.queries["recommend_for_products"], {
+                "item_ids": list(valid_items),
+                "since": recent_purchase_cutoff(),
                 "limit": num_recommendations
             })
             recommendations = [{"item_id": row[0], "score": float(row[1])} for row in result]
         except Exception as e:
-            print(f"❌ Erreur SQL: {str(e)}. Essai avec une requête alternative.")
-            # Version simplifiée compatible avec MySQL
-            query_alt = text("""
-                SELECT p2.item_id, COUNT(*) as score
-                FROM purchases p1
-                JOIN purchases p2 ON p1.session_id = p2.session_id
-                WHERE p1.item_id IN :item_ids
-                AND p2.item_id NOT IN :item_ids
-                GROUP BY p2.item_id
-                ORDER BY score DESC
-                LIMIT :limit
-            """)
-            result = self.db.execute(query_alt, {
-                "item_ids": tuple(valid_items), 
-                "limit": num_recommendations
-            })
-            recommendations = [{"item_id": row[0], "score": row[1]} for row in result]
+            logger.error(f"Erreur SQL: {str(e)}")
+            METRICS.increment("fallbacks", "sql_error_to_empty")
+            recommendations = []
             
         return recommendations
     
-    def get_purchase_paths(self, item_id, max_path_length=3, min_support=2):
+    @timed("ProductRecommender.recommend_for_each")
+    def recommend_for_each(self, item_ids, num_recommendations=5, validate=True):
+        """Recommande des produits pour chaque item source, en une requête par lot d'items"""
+        if self.popularity is None:
+            return self._cooccurrence_for_each(item_ids, num_recommendations, validate)
+        
+        # Items inconnus : liste vide, jamais complétée par les items populaires
+        known = set(self.validator.filter_existing(list(item_ids)).tolist()) if validate else set(item_ids)
+        recommendations = {item_id: [] for item_id in item_ids if item_id not in known}
+        # Les items froids ne partent pas en requête : réponse par popularité
+        cold = {item for item in known if self.popularity.is_cold(item)}
+        warm = [item for item in item_ids if item in known and item not in cold]
+        recommendations.update({
+            item_id: self._padded(recs, num_recommendations, [item_id])
+            for item_id, recs in (self._cooccurrence_for_each(warm, num_recommendations, False) if warm else {}).items()
+        })
+        if cold:
+            self._record_source("popularity")
+            for item_id in cold:
+                recommendations[item_id] = self.popularity.pad([], num_recommendations, [item_id])
+        return {item_id: recommendations[item_id] for item_id in item_ids}
+    
+    def _cooccurrence_for_each(self, item_ids, num_recommendations, validate):
+        if self.neighbors is not None and num_recommendations <= self.neighbors.k:
+            self._record_source("neighbors")
+            return self.neighbors.recommend_each(item_ids, num_recommendations)
+        
+        if self.index is not None:
+            self._record_source("index")
+            return self.index.recommend_each(item_ids, num_recommendations)
+        
+        self._record_source("live")
+        source_ids = list(dict.fromkeys(int(item) for item in item_ids))
+        if validate:
+            source_ids = [int(item) for item in self.validator.filter_existing(source_ids)]
+        
+        recommendations = {item_id: [] for item_id in item_ids}
+        for start in range(0, len(source_ids), BATCH_SOURCE_SIZE):
+            try:
+                result = self.db.execute(self.queries["recommend_for_each"], {
+                    "item_ids": source_ids[start:start + BATCH_SOURCE_SIZE],
+                    "since": recent_purchase_cutoff(),
+                    "limit": num_recommendations
+                })
+            except Exception as e:
+                logger.error(f"Erreur SQL: {str(e)}")
+                METRICS.increment("fallbacks", "sql_error_to_empty")
+                continue
+            for source_id, item_id, score in result:
+                recommendations[source_id].append({"item_id": item_id, "score": float(score)})
+        
+        return recommendations
+    
+    @timed("ProductRecommender.recommend_for_baskets")
+    def recommend_for_baskets(self, baskets, num_recommendations=5):
+        """Recommande des produits pour plusieurs paniers en un seul appel"""
+        if self.index is not None:
+            self._record_source("index")
+            return self.index.recommend_baskets(baskets, num_recommendations)
+        return [self.recommend_for_products(basket, num_recommendations) for basket in baskets]
+    
+    @timed("ProductRecommender.get_purchase_paths")
+    def get_purchase_paths(self, item_id, max_path_length=3, min_support=2, validate=True,
+                           max_distinct_paths=None):
         """Détermine les parcours d'achat typiques incluant l'item spécifié"""
-        if not self.validator.item_exists(item_id):
+        if self.cache is not None:
+            return self._cached(
+                "get_purchase_paths", [item_id], None,
+                lambda: self._get_purchase_paths(
+                    item_id, max_path_length, min_support, validate, max_distinct_paths
+                ),
+                max_path_length=max_path_length, min_support=min_support,
+                max_distinct_paths=max_distinct_paths, validate=validate
+            )
+        return self._get_purchase_paths(item_id, max_path_length, min_support, validate, max_distinct_paths)
+    
+    def _get_purchase_paths(self, item_id, max_path_length, min_support, validate, max_distinct_paths):
+        if validate and not self.validator.item_exists(item_id):
             return []
-            
-        # Requête pour extraire les séquences de consultation avant achat
-        query = text("""
-            SELECT 
-                s1.session_id,
-                s1.item_id as viewed_item,
-                s1.view_date,
-                p.item_id as purchased_item,
-                p.purchase_date
-            FROM 
-                sessions s1
-            JOIN 
-                purchases p ON s1.session_id = p.session_id
-            WHERE 
-                -- Limiter aux sessions qui incluent l'item d'intérêt
-                s1.session_id IN (
-                    SELECT DISTINCT session_id 
-                    FROM sessions 
-                    WHERE item_id = :item_id
-                )
-                -- S'assurer que la consultation précède l'achat
-                AND s1.view_date < p.purchase_date
-            ORDER BY 
-                s1.session_id, s1.view_date
-        """)
-        
-        result = self.db.execute(query, {"item_id": item_id})
         
-        # Traitement Python pour analyser les parcours
-        session_paths = {}
-        for row in result:
-            session_id = row[0]
-            viewed_item = row[1]
-            purchased_item = row[3]
+        # L'index hors ligne répond directement si sa profondeur et son seuil le permettent
+        if self.path_index is not None and self.path_index.covers(max_path_length, min_support):
+            self._record_source("path_index")
+            return self.path_index.get(item_id, max_path_length, min_support)
+        if self.path_index is not None:
+            METRICS.increment("fallbacks", "path_index_to_sql")
+        self._record_source("live")
             
-            if session_id not in session_paths:
-                session_paths[session_id] = {"views": [], "purchase": purchased_item}
-            
-            session_paths[session_id]["views"].append(viewed_item)
-        
-        # Limiter les chemins à max_path_length éléments
-        for session_id, data in session_paths.items():
-            data["views"] = data["views"][:max_path_length]
+        # Requête pour extraire les séquences de consultation avant achat,
+        # lue par blocs via un curseur côté serveur
+        result = self.db.execute(
+            self.queries["purchase_paths"],
+            {"item_id": item_id},
+            execution_options={"stream_results": True, "max_row_buffer": PATH_FETCH_SIZE}
+        )
         
-        # Compter la fréquence des chemins
-        path_counts = {}
-        for data in session_paths.values():
-            path = tuple(data["views"] + [data["purchase"]])
-            if path in path_counts:
-                path_counts[path] += 1
-            else:
-                path_counts[path] = 1
+        # Comptage au fil de l'eau, bloc par bloc
+        counter = PathCounter(max_path_length, max_distinct_paths)
+        for partition in result.partitions(PATH_FETCH_SIZE):
+            for row in partition:
+                counter.add(row)
         
         # Filtrer par support minimum et trier par fréquence
-        frequent_paths = [
-            {"path": list(path), "frequency": count}
-            for path, count in path_counts.items()
-            if count >= min_support
-        ]
+        frequent_paths = counter.frequent_paths(min_support)
         
-        return sorted(frequent_paths, key=lambda x: x["frequency"], reverse=True)
+        return frequent_paths
@@ -0,0 +1,210 @@
+from sqlalchemy.orm import Session
+from datetime import date, datetime, timedelta
+from .cooccurrence_index import DEFAULT_WEIGHTS
+from .queries import get_queries, recent_purchase_cutoff
+from .models import Base, RecommendationBucket, RefreshWatermark, WeightedRecommendation
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+BOUGHT_TOGETHER = "BOUGHT_TOGETHER"
+VIEW_TO_PURCHASE = "VIEW_TO_PURCHASE"
+WATERMARK_NAME = "weighted_recommendations"
+
+# Nombre d'items sources reconstruits par requête IN
+SOURCE_CHUNK_SIZE = 1000
+# Lignes déjà couvertes par le watermark mais recomptées à chaque passage : une transaction
+# validée moins de RESCAN_WINDOW après l'horodatage (ingested_at) de ses lignes est comptée
+RESCAN_WINDOW = timedelta(minutes=10)
+# Watermark initial : toutes les lignes sont nouvelles
+EPOCH = datetime(1970, 1, 1)
+
+def _as_date(value):
+    """DATE() renvoie une chaîne sous SQLite et une date ailleurs"""
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+class IncrementalRefresher:
+    """Met à jour weighted_recommendations à partir des seuls événements ingérés depuis le watermark
+
+    Le watermark porte sur ingested_at (horloge de la base à l'insertion) et non sur la
+    date des événements : un événement daté du passé mais arrivé en retard est compté au
+    rafraîchissement suivant son insertion. Les comptes sont tenus par jour de l'item
+    source pour expirer les achats sortis de la fenêtre de 90 jours de recommend_for_product.
+
+    ingested_at n'est pas l'ordre de validation : une transaction longue peut rendre ses
+    lignes visibles après le passage du watermark. Chaque passage relit donc les lignes
+    ingérées depuis watermark - rescan_window et recalcule en entier les buckets qu'elles
+    touchent ; les comptes remplacent ceux de la table, recompter est donc sans effet.
+    """
+
+    def __init__(self, db: Session, cache=None, weights=DEFAULT_WEIGHTS, rescan_window=RESCAN_WINDOW):
+        self.db = db
+        self.queries = get_queries(db.get_bind())
+        # RecommendationCache optionnel à invalider pour les items touchés
+        self.cache = cache
+        self.weights = tuple(weights)
+        self.rescan_window = rescan_window
+        self.watermark = None
+
+    def ensure_tables(self):
+        """Crée les tables de buckets, de scores et de watermark si nécessaire"""
+        Base.metadata.create_all(
+            self.db.get_bind(),
+            tables=[
+                WeightedRecommendation.__table__,
+                RecommendationBucket.__table__,
+                RefreshWatermark.__table__,
+            ]
+        )
+
+    def load_watermark(self):
+        """Lit le dernier watermark enregistré (None si jamais exécuté)"""
+        state = self.db.get(RefreshWatermark, WATERMARK_NAME)
+        self.watermark = state.watermark if state else None
+        return self.watermark
+
+    def _save_watermark(self, watermark):
+        state = self.db.get(RefreshWatermark, WATERMARK_NAME)
+        if state is None:
+            self.db.add(RefreshWatermark(name=WATERMARK_NAME, watermark=watermark))
+        else:
+            state.watermark = watermark
+        self.watermark = watermark
+
+    def _ingested_until(self):
+        """Borne haute des lignes à compter : horloge de la base"""
+        return self.db.execute(self.queries["database_now"]).scalar()
+
+    def _recount_buckets(self, low, high, cutoff):
+        """Comptes complets des buckets (source, recommandé, type, jour) touchés par ]low, high]"""
+        params = {"low": low, "high": high, "cutoff": cutoff}
+        counts = {}
+        for recommendation_type, name in (
+            (BOUGHT_TOGETHER, "refresh_bought_together_counts"),
+            (VIEW_TO_PURCHASE, "refresh_view_to_purchase_counts"),
+        ):
+            for source, recommended, day, count in self.db.execute(self.queries[name], params):
+                counts[(source, recommended, recommendation_type, _as_date(day))] = count
+        return counts
+
+    def _replace_buckets(self, counts):
+        rows = [
+            {
+                "source_item_id": source,
+                "recommended_item_id": recommended,
+                "recommendation_type": recommendation_type,
+                "bucket_date": day,
+                "count": count,
+            }
+            for (source, recommended, recommendation_type, day), count in counts.items()
+        ]
+        if rows:
+            self.db.execute(self.queries["bucket_upsert"], rows)
+
+    def _expire_buckets(self, cutoff_date):
+        """Supprime les buckets sortis de la fenêtre et renvoie les sources concernées"""
+        expired = {
+            source for source, in self.db.execute(self.queries["refresh_expired_sources"], {"cutoff": cutoff_date})
+        }
+        if expired:
+            self.db.execute(self.queries["refresh_delete_expired_buckets"], {"cutoff": cutoff_date})
+        return expired
+
+    def _rebuild_sources(self, sources, cutoff_date, now):
+        """Recalcule le score final des items sources touchés à partir de leurs buckets"""
+        bt_weight, us_weight, vp_weight = self.weights
+        sources = sorted(sources)
+        for start in range(0, len(sources), SOURCE_CHUNK_SIZE):
+            params = {
+                "source_ids": sources[start:start + SOURCE_CHUNK_SIZE],
+                "cutoff": cutoff_date,
+                "bt_weight": bt_weight + us_weight,
+                "vp_weight": vp_weight,
+                "now": now,
+            }
+            self.db.execute(self.queries["refresh_delete_sources"], params)
+            self.db.execute(self.queries["refresh_rebuild_sources"], params)
+
+    def _reset(self):
+        """Premier passage : repart de tables vides, toutes les lignes étant nouvelles"""
+        self.db.execute(RecommendationBucket.__table__.delete())
+        self.db.execute(WeightedRecommendation.__table__.delete())
+
+    def run_once(self, now=None, until=None):
+        """Recompte les buckets touchés depuis le dernier watermark (moins rescan_window) et expire la fenêtre
+
+        now fixe la fenêtre de 90 jours ; until, la borne haute d'ingestion
+        (par défaut l'horloge de la base).
+        """
+        now = now or datetime.now()
+        cutoff = recent_purchase_cutoff(now.date())
+        high = until or self._ingested_until()
+        low = self.load_watermark()
+        started = time.perf_counter()
+
+        try:
+            if low is None:
+                self._reset()
+            scan_low = low - self.rescan_window if low is not None else EPOCH
+            counts = self._recount_buckets(scan_low, high, cutoff)
+            self._replace_buckets(counts)
+
+            affected = {source for source, _, _, _ in counts}
+            affected |= self._expire_buckets(cutoff.date())
+            self._rebuild_sources(affected, cutoff.date(), now)
+
+            self._save_watermark(max(high, low or EPOCH))
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Erreur lors du rafraîchissement incrémental: {str(e)}")
+            raise
+
+        if self.cache is not None:
+            touched = set(affected)
+            touched.update(recommended for _, recommended, _, _ in counts)
+            self.cache.invalidate_items(touched)
+
+        stats = {
+            "watermark": self.watermark,
+            "recounted_buckets": len(counts),
+            "refreshed_sources": len(affected),
+            "duration_seconds": time.perf_counter() - started,
+        }
+        logger.info(f"Rafraîchissement incrémental terminé: {stats}")
+        return stats
+
+    def run_forever(self, interval_seconds=60):
+        """Boucle de rafraîchissement à exécuter à côté de l'application"""
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                # L'erreur est déjà journalisée : on retente au prochain cycle
+                pass
+            time.sleep(interval_seconds)
+
+
+if __name__ == "__main__":
+    import argparse
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Rafraîchissement incrémental des recommandations")
+    parser.add_argument("--loop", type=int, default=None, metavar="SECONDES",
+                        help="Relance le rafraîchissement toutes les SECONDES secondes")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    refresher = IncrementalRefresher(db)
+    refresher.ensure_tables()
+    if args.loop:
+        refresher.run_forever(args.loop)
+    else:
+        print(refresher.run_once())
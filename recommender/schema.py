@@ -0,0 +1,252 @@
+from sqlalchemy import event, inspect, text
+from datetime import date, datetime, timedelta
+from .models import Purchase, Session
+from .queries import get_queries, recent_purchase_cutoff
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Index composites couvrants déclarés dans models.py, créés ici sur une base existante
+COVERING_INDEXES = [
+    index
+    for table in (Purchase.__table__, Session.__table__)
+    for index in sorted(table.indexes, key=lambda index: index.name)
+    if index.name.startswith("idx_")
+]
+
+EVENT_TABLES = (Purchase.__tablename__, Session.__tablename__)
+# Colonne de partitionnement mensuel des tables partitionnables. MySQL exige qu'elle fasse
+# partie de la clé primaire : c'est déjà le cas de sessions. Pour purchases, l'élargir à
+# purchase_date autoriserait plusieurs achats d'une paire (session, item), alors que
+# refresher.py, decay.py, neighbors.py et WEIGHTED_SCORES comptent COUNT(*) comme le
+# nombre de sessions distinctes : purchases n'est donc pas partitionnée.
+PARTITION_COLUMNS = {"sessions": "view_date"}
+
+EXPLAIN_PREFIXES = {"sqlite": "EXPLAIN QUERY PLAN ", "mysql": "EXPLAIN ", "postgresql": "EXPLAIN "}
+# Index que le plan de chaque requête du registre doit utiliser
+EXPECTED_INDEXES = {
+    "recommend_for_product": ("idx_purchases_item_date", "idx_sessions_item_date"),
+    "recommend_for_products": ("idx_purchases_item_date",),
+    "recommend_for_each": ("idx_purchases_item_date",),
+    "purchase_paths": ("idx_sessions_item_date", "idx_sessions_session_date"),
+    "catalog_item_stats": ("idx_sessions_item_date",),
+}
+
+
+def apply_indexes(engine):
+    """Crée les index couvrants absents ; renvoie les noms créés"""
+    created = []
+    for index in COVERING_INDEXES:
+        existing = {entry["name"] for entry in inspect(engine).get_indexes(index.table.name)}
+        if index.name in existing:
+            continue
+        started = time.perf_counter()
+        index.create(engine)
+        created.append(index.name)
+        logger.info(f"Index {index.name} créé en {time.perf_counter() - started:.1f} s")
+    return created
+
+
+def add_ingestion_columns(engine):
+    """Ajoute ingested_at (horloge de la base à l'insertion) aux tables d'événements existantes
+
+    Les lignes déjà présentes reçoivent l'heure de la migration : le premier passage de
+    l'IncrementalRefresher, sans watermark, les compte toutes. SQLite n'accepte pas
+    de valeur par défaut non constante en ALTER TABLE : la base doit y être recréée.
+    """
+    if engine.dialect.name == "sqlite":
+        raise ValueError("SQLite : recréer les tables (Base.metadata.create_all) pour ajouter ingested_at")
+    column_type = "TIMESTAMP" if engine.dialect.name == "postgresql" else "DATETIME"
+    added = []
+    for table in EVENT_TABLES:
+        if "ingested_at" in {column["name"] for column in inspect(engine).get_columns(table)}:
+            continue
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"ALTER TABLE {table} ADD COLUMN ingested_at {column_type} NOT NULL DEFAULT CURRENT_TIMESTAMP"
+            ))
+        added.append(table)
+    return added
+
+
+def _month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def _next_month(value):
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def _partition_clause(month):
+    """Partition des dates du mois, bornée par le premier jour du mois suivant"""
+    return f"PARTITION p{month:%Y%m} VALUES LESS THAN (TO_DAYS('{_next_month(month):%Y-%m-%d}'))"
+
+
+def monthly_partitions(first_month, last_month):
+    """Premiers jours des mois de first_month à last_month inclus"""
+    months, month = [], _month_start(first_month)
+    while month <= _month_start(last_month):
+        months.append(month)
+        month = _next_month(month)
+    return months
+
+
+def _partitions_definition(months):
+    return ",\n".join([*map(_partition_clause, months), "PARTITION pmax VALUES LESS THAN MAXVALUE"])
+
+
+def _require_partitionable(table):
+    if table not in PARTITION_COLUMNS:
+        raise ValueError(
+            f"{table} n'est pas partitionnable : sa clé primaire devrait inclure la date "
+            f"(voir PARTITION_COLUMNS)"
+        )
+
+
+def _require_mysql(engine):
+    if engine.dialect.name != "mysql":
+        raise ValueError("Le partitionnement par intervalle n'est géré que pour MySQL")
+
+
+def existing_partitions(engine, table):
+    """Noms des partitions mensuelles existantes (pYYYYMM), triés"""
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table
+            AND PARTITION_NAME IS NOT NULL
+        """), {"table": table})
+        return sorted(row[0] for row in rows if row[0] != "pmax")
+
+
+def partition_by_month(engine, table, first_month, months_ahead=3):
+    """Partitionne une table d'événements par mois (RANGE sur TO_DAYS de sa date)
+
+    Les mois de first_month à aujourd'hui + months_ahead ont chacun leur partition,
+    pmax reçoit le reste. Les requêtes filtrées sur la date ne lisent alors que les
+    partitions concernées. Seules les tables de PARTITION_COLUMNS, dont la clé
+    primaire contient déjà la date, sont acceptées : la clé n'est pas modifiée.
+    """
+    _require_partitionable(table)
+    _require_mysql(engine)
+    months = monthly_partitions(first_month, date.today() + timedelta(days=31 * months_ahead))
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"ALTER TABLE {table} PARTITION BY RANGE (TO_DAYS({PARTITION_COLUMNS[table]})) "
+            f"(\n{_partitions_definition(months)}\n)"
+        ))
+    logger.info(f"{table} partitionnée en {len(months)} mois")
+    return len(months)
+
+
+def add_monthly_partitions(engine, table, until):
+    """Découpe pmax pour créer les partitions manquantes jusqu'au mois de until"""
+    _require_partitionable(table)
+    _require_mysql(engine)
+    existing = existing_partitions(engine, table)
+    if not existing:
+        raise ValueError(f"{table} n'est pas partitionnée")
+    months = monthly_partitions(_next_month(datetime.strptime(existing[-1], "p%Y%m").date()), until)
+    if months:
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO (\n{_partitions_definition(months)}\n)"
+            ))
+    return len(months)
+
+
+def drop_partitions_before(engine, table, cutoff):
+    """Supprime les partitions entièrement antérieures à cutoff (rétention)"""
+    _require_partitionable(table)
+    _require_mysql(engine)
+    expired = [
+        name for name in existing_partitions(engine, table)
+        if _next_month(datetime.strptime(name, "p%Y%m").date()) <= cutoff
+    ]
+    if expired:
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} DROP PARTITION {', '.join(expired)}"))
+    return expired
+
+
+def explain(engine, statement, params):
+    """Plan d'exécution d'une requête du registre, avec les paramètres rendus par le driver"""
+    prefix = EXPLAIN_PREFIXES[engine.dialect.name]
+
+    def add_prefix(conn, cursor, statement, parameters, context, executemany):
+        return prefix + statement, parameters
+
+    with engine.connect() as conn:
+        event.listen(conn, "before_cursor_execute", add_prefix, retval=True)
+        try:
+            result = conn.execute(statement, params)
+            return [tuple(row) for row in result.cursor.fetchall()]
+        finally:
+            event.remove(conn, "before_cursor_execute", add_prefix)
+
+
+def _plan_params(item_id):
+    since = recent_purchase_cutoff()
+    return {
+        "recommend_for_product": {"item_id": item_id, "since": since, "limit": 5},
+        "recommend_for_products": {"item_ids": [item_id], "since": since, "limit": 5},
+        "recommend_for_each": {"item_ids": [item_id], "since": since, "limit": 5},
+        "purchase_paths": {"item_id": item_id},
+        "catalog_item_stats": {"low": item_id - 1, "high": item_id},
+    }
+
+
+def check_plans(engine, item_id):
+    """Vérifie, requête par requête, que le plan utilise les index attendus"""
+    queries = get_queries(engine)
+    checks = {}
+    for name, params in _plan_params(item_id).items():
+        plan = explain(engine, queries[name], params)
+        rendered = " ".join(str(value) for row in plan for value in row)
+        missing = [index for index in EXPECTED_INDEXES[name] if index not in rendered]
+        checks[name] = {"ok": not missing, "missing": missing, "plan": plan}
+    return checks
+
+
+if __name__ == "__main__":
+    import argparse
+    from .database import engine
+
+    parser = argparse.ArgumentParser(description="Index couvrants et partitionnement des tables d'événements")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("indexes", help="Crée les index couvrants absents")
+    subparsers.add_parser("ingestion", help="Ajoute ingested_at aux tables d'événements, puis ses index")
+    partition = subparsers.add_parser("partition", help="Partitionne sessions par mois (MySQL)")
+    partition.add_argument("--first-month", required=True, help="AAAA-MM du plus ancien événement")
+    partition.add_argument("--months-ahead", type=int, default=3)
+    extend = subparsers.add_parser("extend", help="Ajoute les partitions des mois à venir (MySQL)")
+    extend.add_argument("--months-ahead", type=int, default=3)
+    extend.add_argument("--retention-days", type=int, default=None, help="Supprime les partitions plus anciennes")
+    check = subparsers.add_parser("explain", help="Vérifie les plans des requêtes du recommender")
+    check.add_argument("--item-id", type=int, required=True)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "indexes":
+        print(f"✅ Index créés: {apply_indexes(engine) or 'aucun'}")
+    elif args.command == "ingestion":
+        print(f"✅ Colonne ingested_at ajoutée: {add_ingestion_columns(engine) or 'aucune table'}")
+        print(f"✅ Index créés: {apply_indexes(engine) or 'aucun'}")
+    elif args.command == "partition":
+        first_month = datetime.strptime(args.first_month, "%Y-%m").date()
+        for table in PARTITION_COLUMNS:
+            partition_by_month(engine, table, first_month, args.months_ahead)
+    elif args.command == "extend":
+        until = date.today() + timedelta(days=31 * args.months_ahead)
+        for table in PARTITION_COLUMNS:
+            print(f"{table}: {add_monthly_partitions(engine, table, until)} partitions ajoutées")
+            if args.retention_days:
+                cutoff = date.today() - timedelta(days=args.retention_days)
+                print(f"{table}: partitions supprimées {drop_partitions_before(engine, table, cutoff)}")
+    else:
+        for name, result in check_plans(engine, args.item_id).items():
+            status = "✅" if result["ok"] else f"⚠️ index non utilisés {result['missing']}"
+            print(f"{status} {name}")
+            for row in result["plan"]:
+                print(f"    {row}")
@@ -0,0 +1,178 @@
+from flask import Flask, request
+from flask_restful import Api, Resource, abort
+from .database import ScopedSession
+from .recommender import ProductRecommender
+from .stats_analyzer import StatsAnalyzer
+from .item_validator import ItemValidator
+from .cache import RecommendationCache
+from .metrics import METRICS
+import json
+import os
+
+# Nombre maximal d'items acceptés par appel groupé
+MAX_BATCH_ITEMS = 1000
+MAX_RECOMMENDATIONS = 100
+
+
+def _limit(value, default=5):
+    try:
+        limit = int(value if value is not None else default)
+    except (TypeError, ValueError):
+        abort(400, message="limit doit être un entier")
+    if not 1 <= limit <= MAX_RECOMMENDATIONS:
+        abort(400, message=f"limit doit être compris entre 1 et {MAX_RECOMMENDATIONS}")
+    return limit
+
+
+def _payload():
+    """Corps JSON de la requête : un objet, vide si le corps est absent ou illisible"""
+    payload = request.get_json(silent=True)
+    if payload is None:
+        return {}
+    if not isinstance(payload, dict):
+        abort(400, message="Le corps de la requête doit être un objet JSON")
+    return payload
+
+
+def _item_ids(payload):
+    """Liste d'item_id du corps JSON, validée et bornée"""
+    item_ids = payload.get("item_ids")
+    if not isinstance(item_ids, list) or not item_ids:
+        abort(400, message="item_ids doit être une liste non vide")
+    if len(item_ids) > MAX_BATCH_ITEMS:
+        abort(400, message=f"Au plus {MAX_BATCH_ITEMS} items par appel")
+    try:
+        return [int(item_id) for item_id in item_ids]
+    except (TypeError, ValueError):
+        abort(400, message="item_ids doit contenir des entiers")
+
+
+def _records(frame):
+    """DataFrame en liste JSON (types numpy convertis, NaN remplacés par null)"""
+    return json.loads(frame.to_json(orient="records"))
+
+
+class _ServiceResource(Resource):
+    """Ressource partageant le recommender et l'analyseur de l'application"""
+
+    def __init__(self, recommender, analyzer):
+        self.recommender = recommender
+        self.analyzer = analyzer
+
+
+class ProductRecommendations(_ServiceResource):
+    def get(self, item_id):
+        if not self.recommender.validator.item_exists(item_id):
+            abort(404, message=f"L'item {item_id} n'existe pas")
+        recommendations = self.recommender.recommend_for_product(
+            item_id, num_recommendations=_limit(request.args.get("limit")), validate=False
+        )
+        return {"item_id": item_id, "recommendations": recommendations}
+
+
+class MultiProductRecommendations(_ServiceResource):
+    def post(self):
+        payload = _payload()
+        _, valid_ids = self.recommender.validator.items_exist(_item_ids(payload))
+        recommendations = self.recommender.recommend_for_products(
+            valid_ids, num_recommendations=_limit(payload.get("limit")), validate=False
+        ) if valid_ids else []
+        return {"item_ids": valid_ids, "recommendations": recommendations}
+
+
+class BatchRecommendations(_ServiceResource):
+    def post(self):
+        payload = _payload()
+        item_ids = _item_ids(payload)
+        results = self.recommender.recommend_for_each(
+            item_ids, num_recommendations=_limit(payload.get("limit"))
+        )
+        # Clés JSON en chaînes : l'ordre des items demandés est conservé
+        return {"results": {str(item_id): results.get(item_id, []) for item_id in item_ids}}
+
+
+class PurchasePaths(_ServiceResource):
+    def get(self, item_id):
+        if not self.recommender.validator.item_exists(item_id):
+            abort(404, message=f"L'item {item_id} n'existe pas")
+        try:
+            max_path_length = int(request.args.get("max_path_length", 3))
+            min_support = int(request.args.get("min_support", 2))
+        except ValueError:
+            abort(400, message="max_path_length et min_support doivent être des entiers")
+        paths = self.recommender.get_purchase_paths(
+            item_id, max_path_length=max_path_length, min_support=min_support, validate=False
+        )
+        return {"item_id": item_id, "paths": paths}
+
+
+class Stats(_ServiceResource):
+    def get(self):
+        try:
+            num_items = min(int(request.args.get("num_items", 10)), MAX_BATCH_ITEMS)
+        except ValueError:
+            abort(400, message="num_items doit être un entier")
+        items = self.analyzer.get_random_items(num_items)
+        return {"stats": _records(self.analyzer.calculate_stats(items)) if items else []}
+
+    def post(self):
+        return {"stats": _records(self.analyzer.calculate_stats(_item_ids(_payload())))}
+
+
+class Health(_ServiceResource):
+    def get(self):
+        return {"status": "ok", "sources": METRICS.counters("sources")}
+
+
+class Metrics(_ServiceResource):
+    def get(self):
+        metrics = METRICS.dump()
+        metrics["sources"] = METRICS.counters("sources")
+        if self.recommender.cache is not None:
+            metrics["cache_stats"] = self.recommender.cache.stats()
+        return metrics
+
+
+def create_app(recommender=None, session=ScopedSession):
+    """Application Flask ; la session est portée par le thread de chaque requête
+
+    Le recommender, son validateur et son cache sont partagés par tous les threads :
+    ils reçoivent la scoped_session, qui fournit à chaque thread sa propre Session.
+    """
+    app = Flask(__name__)
+    api = Api(app)
+    recommender = recommender or ProductRecommender(
+        session,
+        validator=ItemValidator(session),
+        cache=RecommendationCache(maxsize=10000, ttl=300)
+    )
+    analyzer = StatsAnalyzer(session, recommender=recommender)
+    shared = {"recommender": recommender, "analyzer": analyzer}
+
+    for resource, url in (
+        (ProductRecommendations, "/recommendations/<int:item_id>"),
+        (MultiProductRecommendations, "/recommendations"),
+        (BatchRecommendations, "/recommendations/batch"),
+        (PurchasePaths, "/paths/<int:item_id>"),
+        (Stats, "/stats"),
+        (Health, "/health"),
+        (Metrics, "/metrics"),
+    ):
+        api.add_resource(resource, url, resource_class_kwargs=shared)
+
+    @app.teardown_appcontext
+    def remove_session(exception=None):
+        # Rend la connexion au pool à la fin de chaque requête, même en cas d'erreur
+        session.remove()
+
+    return app
+
+
+if __name__ == "__main__":
+    # Serveur de développement multi-threads ; en production, plusieurs processus :
+    # gunicorn --workers 4 --threads 8 "recommender.service:create_app()"
+    create_app().run(
+        host=os.environ.get("HOST", "127.0.0.1"),
+        port=int(os.environ.get("PORT", 5000)),
+        threaded=True
+    )
@@ -0,0 +1,504 @@
+from collections import Counter
+from contextlib import contextmanager
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Client, Listener
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import numpy as np
+import scipy.sparse as sp
+import threading
+from .cooccurrence_index import DEFAULT_WEIGHTS, CooccurrenceIndex, count_events, to_timestamps, top_k
+from .database import engine_options
+from .queries import get_queries, recent_purchase_cutoff
+from .snapshot import EventSnapshot, read_events
+
+# Lignes (item source) et incidences (item → sessions) conservées par chaque shard
+ROW_MATRICES = ("scores", "bought_together", "view_purchase", "last_interaction")
+SESSION_MATRICES = ("recent_sessions", "purchased_sessions")
+# Items possédés par requête IN lors de la recherche des sessions d'un shard
+ITEM_CHUNK_SIZE = 1000
+
+
+@contextmanager
+def _database(url):
+    """Session sur une base propre au processus (shard ou coordinateur)"""
+    engine = create_engine(url, **engine_options(url))
+    db = sessionmaker(bind=engine)()
+    try:
+        yield db
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def source_items(snapshot=None, database_url=None):
+    """Univers trié des item_ids : positions communes au coordinateur et aux shards"""
+    if snapshot is not None:
+        return np.array(EventSnapshot.open(snapshot).item_ids)
+    with _database(database_url) as db:
+        rows = db.execute(get_queries(db.get_bind())["known_items"])
+        return np.unique(np.array([row[0] for row in rows], dtype=np.int64))
+
+
+def hash_owners(item_ids, num_shards):
+    """Shard propriétaire de chaque item : item_id modulo le nombre de shards"""
+    return (np.asarray(item_ids, dtype=np.int64) % num_shards).astype(np.int64)
+
+
+def range_owners(item_ids, boundaries):
+    """Shard propriétaire par intervalles d'item_id : boundaries[i] est le premier id du shard i + 1"""
+    return np.searchsorted(np.asarray(boundaries, dtype=np.int64), item_ids, side="right").astype(np.int64)
+
+
+def balanced_boundaries(item_ids, pairs, num_shards):
+    """Bornes d'intervalles répartissant équitablement les paires non nulles (la charge) entre shards
+
+    pairs[i] est le nombre de paires de l'item item_ids[i] (voir ShardCoordinator.pairs_per_item).
+    """
+    load = np.cumsum(np.asarray(pairs) + 1)
+    cuts = np.searchsorted(load, load[-1] * np.arange(1, num_shards) / num_shards)
+    return [int(item_ids[min(cut + 1, len(item_ids) - 1)]) for cut in cuts]
+
+
+def _within(events, item_ids):
+    """Événements (session, item, timestamp) des seuls items de l'univers, en int64
+
+    Un item apparu après la lecture de item_ids par le coordinateur n'a pas de position.
+    """
+    sessions, items, times = events
+    known = np.isin(items, item_ids)
+    return sessions[known].astype(np.int64), items[known].astype(np.int64), times[known]
+
+
+def _reindex_sessions(matrix, session_ids, new_session_ids):
+    """Renumérote les colonnes (sessions) d'une matrice item→sessions sur new_session_ids"""
+    indices = np.searchsorted(new_session_ids, session_ids[matrix.indices])
+    return sp.csr_matrix((matrix.data, indices, matrix.indptr), shape=(matrix.shape[0], len(new_session_ids)))
+
+
+class IndexShard:
+    """Partie d'un CooccurrenceIndex : lignes des items sources possédés, en positions globales
+
+    Les colonnes items recommandés gardent la numérotation de l'index complet, les lignes
+    suivent owned (positions globales triées). Les colonnes des matrices de sessions sont
+    des positions dans session_ids, propre au shard ; les shards échangent des session_id.
+    """
+
+    def __init__(self, item_ids, weights, owned, matrices, session_ids):
+        self.item_ids = item_ids
+        self.weights = weights
+        self.owned = np.asarray(owned, dtype=np.int64)
+        self.matrices = {name: matrix.tocsr() for name, matrix in matrices.items()}
+        self.session_ids = np.asarray(session_ids, dtype=np.int64)
+
+    @classmethod
+    def from_index(cls, index, positions, session_ids):
+        """Lignes possédées d'un index dont les lignes d'incidence sont les sessions session_ids"""
+        positions = np.sort(np.asarray(positions, dtype=np.int64))
+        matrices = {name: getattr(index, name)[positions] for name in ROW_MATRICES}
+        matrices["recent_sessions"] = index.recent_purchased[:, positions].T.tocsr()
+        matrices["purchased_sessions"] = index.purchased[:, positions].T.tocsr()
+        for matrix in matrices.values():
+            matrix.sort_indices()
+        return cls(index.item_ids, index.weights, positions, matrices, session_ids)._compacted()
+
+    @classmethod
+    def build(cls, item_ids, positions, weights=DEFAULT_WEIGHTS, snapshot=None, database_url=None, today=None):
+        """Construit, dans le processus shard, les lignes des positions possédées
+
+        Depuis un EventSnapshot, seules les lignes possédées de l'index mappé sont copiées.
+        Depuis la base, seuls les événements des sessions ayant acheté ou consulté un item
+        possédé sont lus : ils suffisent à compter les lignes de ces items.
+        """
+        item_ids = np.asarray(item_ids, dtype=np.int64)
+        if snapshot is not None:
+            events = EventSnapshot.open(snapshot)
+            if not np.array_equal(events.item_ids, item_ids):
+                raise ValueError(f"Instantané {snapshot} différent de celui du coordinateur : items divergents")
+            index = CooccurrenceIndex.from_snapshot(events, weights=weights)
+            return cls.from_index(index, positions, events.session_ids)
+
+        owned_items = item_ids[np.asarray(positions, dtype=np.int64)].tolist()
+        with _database(database_url) as db:
+            query = get_queries(db.get_bind())["sessions_with_items"]
+            sessions = set()
+            for start in range(0, len(owned_items), ITEM_CHUNK_SIZE):
+                chunk = owned_items[start:start + ITEM_CHUNK_SIZE]
+                sessions.update(row[0] for row in db.execute(query, {"item_ids": chunk}))
+            purchases, views = read_events(db, sessions=np.array(sorted(sessions), dtype=np.int64))
+
+        (p_sessions, p_items, p_times), (v_sessions, v_items, v_times) = (
+            _within(purchases, item_ids), _within(views, item_ids)
+        )
+        counts = count_events(
+            p_sessions, p_items, p_times, v_sessions, v_items, v_times,
+            item_ids, to_timestamps([recent_purchase_cutoff(today)])[0]
+        )
+        index = CooccurrenceIndex(item_ids, weights=weights, **counts)
+        return cls.from_index(index, positions, np.unique(np.concatenate([p_sessions, v_sessions])))
+
+    def _compacted(self):
+        """Ne garde dans session_ids que les sessions présentes dans les lignes possédées"""
+        used = np.unique(np.concatenate([self.matrices[name].indices for name in SESSION_MATRICES]))
+        session_ids = self.session_ids[used]
+        for name in SESSION_MATRICES:
+            self.matrices[name] = _reindex_sessions(self.matrices[name], self.session_ids, session_ids)
+        self.session_ids = session_ids
+        return self
+
+    @property
+    def nbytes(self):
+        return sum(
+            matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+            for matrix in self.matrices.values()
+        ) + self.session_ids.nbytes
+
+    def _row(self, position):
+        row = np.searchsorted(self.owned, position)
+        return row if row < len(self.owned) and self.owned[row] == position else None
+
+    def recommend(self, position, num_recommendations):
+        """Même calcul que CooccurrenceIndex.recommend, sur une ligne locale"""
+        row = self._row(position)
+        if row is None:
+            return []
+        scores_matrix = self.matrices["scores"]
+        start, end = scores_matrix.indptr[row:row + 2]
+        columns = scores_matrix.indices[start:end]
+        scores = scores_matrix.data[start:end]
+        if not len(columns):
+            return []
+
+        last = self.matrices["last_interaction"]
+        l_start, l_end = last.indptr[row:row + 2]
+        known = last.indices[l_start:l_end]
+        tiebreak = np.full(len(columns), -np.inf)
+        if len(known):
+            found = np.minimum(np.searchsorted(known, columns), len(known) - 1)
+            match = known[found] == columns
+            tiebreak[match] = last.data[l_start:l_end][found[match]]
+
+        best = top_k(scores, tiebreak, num_recommendations)
+        return [
+            {"item_id": int(self.item_ids[columns[i]]), "score": float(scores[i])}
+            for i in best
+        ]
+
+    def partial(self, positions):
+        """Phase 1 d'une requête multi-items : sommes des lignes et sessions récentes des graines"""
+        rows = [row for row in map(self._row, positions) if row is not None]
+        selector = sp.csr_matrix(
+            (np.ones(len(rows)), (np.zeros(len(rows), dtype=np.int64), rows)),
+            shape=(1, len(self.owned))
+        )
+        bought_together = (selector @ self.matrices["bought_together"]).tocoo()
+        view_purchase = (selector @ self.matrices["view_purchase"]).tocoo()
+        sessions = self.session_ids[np.unique(self.matrices["recent_sessions"][rows].indices)]
+        return (
+            (bought_together.col, bought_together.data),
+            (view_purchase.col, view_purchase.data),
+            sessions,
+        )
+
+    def unique_sessions(self, sessions, positions):
+        """Phase 2 : nombre de sessions (session_id) de l'ensemble ayant acheté chaque candidat possédé"""
+        rows = [(position, row) for position, row in zip(positions, map(self._row, positions)) if row is not None]
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        purchased = self.matrices["purchased_sessions"]
+        indicator = np.zeros(purchased.shape[1])
+        # Seules les sessions connues du shard peuvent avoir acheté un de ses items
+        local = np.searchsorted(self.session_ids, sessions)
+        known = local < len(self.session_ids)
+        known[known] = self.session_ids[local[known]] == np.asarray(sessions)[known]
+        indicator[local[known]] = 1.0
+        counts = purchased[[row for _, row in rows]] @ indicator
+        return np.array([position for position, _ in rows], dtype=np.int64), counts
+
+    def extract(self, positions):
+        """Sous-shard des positions données (pour déplacement lors d'un rééquilibrage)"""
+        keep = np.isin(self.owned, positions)
+        rows = np.flatnonzero(keep)
+        return IndexShard(
+            self.item_ids, self.weights, self.owned[rows],
+            {name: matrix[rows] for name, matrix in self.matrices.items()},
+            self.session_ids
+        )._compacted()
+
+    def drop(self, positions):
+        rows = np.flatnonzero(~np.isin(self.owned, positions))
+        self.owned = self.owned[rows]
+        self.matrices = {name: matrix[rows] for name, matrix in self.matrices.items()}
+        self._compacted()
+
+    def merge(self, other):
+        """Intègre les lignes d'un autre sous-shard (positions disjointes)"""
+        owned = np.concatenate([self.owned, other.owned])
+        order = np.argsort(owned, kind="stable")
+        session_ids = np.union1d(self.session_ids, other.session_ids)
+        merged = {}
+        for name, matrix in self.matrices.items():
+            added = other.matrices[name]
+            if name in SESSION_MATRICES:
+                matrix = _reindex_sessions(matrix, self.session_ids, session_ids)
+                added = _reindex_sessions(added, other.session_ids, session_ids)
+            merged[name] = sp.vstack([matrix, added]).tocsr()[order]
+        self.owned = owned[order]
+        self.matrices = merged
+        self.session_ids = session_ids
+
+    def pairs(self):
+        """Nombre de paires (recommandations possibles) de chaque item possédé"""
+        return self.owned, np.diff(self.matrices["scores"].indptr)
+
+    def stats(self):
+        return {"items": len(self.owned), "pairs": int(self.matrices["scores"].nnz), "bytes": self.nbytes}
+
+
+def _serve(connection):
+    """Boucle d'un processus shard : exécute les commandes (méthode, arguments) du coordinateur"""
+    shard = None
+    while True:
+        try:
+            command, args = connection.recv()
+        except EOFError:
+            return
+        if command == "close":
+            connection.close()
+            return
+        try:
+            if command == "build":
+                shard = IndexShard.build(*args)
+                result = None
+            else:
+                result = getattr(shard, command)(*args)
+        except Exception as e:
+            result = e
+        connection.send(result)
+
+
+def serve(address, authkey):
+    """Shard distant : attend un coordinateur sur address (hôte, port) et le sert"""
+    with Listener(address, authkey=authkey) as listener:
+        with listener.accept() as connection:
+            _serve(connection)
+
+
+class ShardCoordinator:
+    """Répartit un CooccurrenceIndex entre processus shards et sert les recommandations
+
+    Le coordinateur ne garde que item_ids et la répartition : chaque shard construit ses
+    lignes lui-même, depuis la base ou un EventSnapshot.
+
+    Une requête multi-items est diffusée aux shards possédant les graines (sommes des
+    lignes, sessions récentes), puis aux shards possédant les candidats (sessions
+    distinctes), avant le top-k final. Mêmes résultats que CooccurrenceIndex ; s'utilise
+    aussi comme index de ProductRecommender.
+    """
+
+    def __init__(self, item_ids, weights, connections, owners):
+        self.item_ids = np.asarray(item_ids, dtype=np.int64)
+        self.weights = tuple(weights)
+        self.connections = list(connections)
+        self.owners = np.asarray(owners, dtype=np.int64)
+        self._positions = {int(item): pos for pos, item in enumerate(self.item_ids)}
+        self._locks = [threading.Lock() for _ in self.connections]
+        self._processes = []
+        # Requêtes en cours par époque de répartition : un rééquilibrage attend la fin des
+        # requêtes routées avec l'ancienne répartition avant de retirer les lignes déplacées
+        self._epoch = 0
+        self._in_flight = Counter()
+        self._routing = threading.Condition()
+
+    @classmethod
+    def start_local(cls, num_shards, snapshot=None, database_url=None, owners=None,
+                    weights=DEFAULT_WEIGHTS, today=None):
+        """Lance num_shards processus locaux construisant chacun ses lignes (hachage par défaut)
+
+        Source : répertoire d'un EventSnapshot, ou URL de la base lue par chaque shard.
+        """
+        item_ids = source_items(snapshot, database_url)
+        owners = hash_owners(item_ids, num_shards) if owners is None else owners
+        connections, processes = [], []
+        for _ in range(num_shards):
+            parent, child = Pipe()
+            process = Process(target=_serve, args=(child,), daemon=True)
+            process.start()
+            child.close()
+            connections.append(parent)
+            processes.append(process)
+        coordinator = cls(item_ids, weights, connections, owners)
+        coordinator._processes = processes
+        coordinator._build(snapshot, database_url, today)
+        return coordinator
+
+    @classmethod
+    def connect(cls, addresses, authkey, snapshot=None, database_url=None, owners=None,
+                weights=DEFAULT_WEIGHTS, today=None):
+        """Fait construire leurs lignes à des shards distants lancés par serve()
+
+        snapshot et database_url doivent être accessibles depuis chaque shard.
+        """
+        item_ids = source_items(snapshot, database_url)
+        owners = hash_owners(item_ids, len(addresses)) if owners is None else owners
+        connections = [Client(tuple(address), authkey=authkey) for address in addresses]
+        coordinator = cls(item_ids, weights, connections, owners)
+        coordinator._build(snapshot, database_url, today)
+        return coordinator
+
+    def _build(self, snapshot, database_url, today):
+        self._scatter({
+            shard: ("build", (
+                self.item_ids, np.flatnonzero(self.owners == shard), self.weights,
+                snapshot, database_url, today,
+            ))
+            for shard in range(len(self.connections))
+        })
+
+    def _scatter(self, requests):
+        """Envoie les commandes {shard: (méthode, arguments)} puis rassemble les réponses"""
+        shards = sorted(requests)
+        for shard in shards:
+            self._locks[shard].acquire()
+        try:
+            for shard in shards:
+                self.connections[shard].send(requests[shard])
+            results = {shard: self.connections[shard].recv() for shard in shards}
+        finally:
+            for shard in shards:
+                self._locks[shard].release()
+        for result in results.values():
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    @contextmanager
+    def _routed(self):
+        with self._routing:
+            epoch = self._epoch
+            self._in_flight[epoch] += 1
+        try:
+            yield
+        finally:
+            with self._routing:
+                self._in_flight[epoch] -= 1
+                self._routing.notify_all()
+
+    def _by_owner(self, positions):
+        groups = {}
+        for position in positions:
+            groups.setdefault(int(self.owners[position]), []).append(position)
+        return groups
+
+    def recommend_for_product(self, item_id, num_recommendations=5):
+        position = self._positions.get(item_id)
+        if position is None:
+            return []
+        with self._routed():
+            shard = int(self.owners[position])
+            return self._scatter({shard: ("recommend", (position, num_recommendations))})[shard]
+
+    def recommend_for_each(self, item_ids, num_recommendations=5):
+        return {item_id: self.recommend_for_product(item_id, num_recommendations) for item_id in item_ids}
+
+    def recommend_for_products(self, item_ids, num_recommendations=5):
+        seeds = sorted({self._positions[item] for item in item_ids if item in self._positions})
+        if not seeds:
+            return []
+
+        with self._routed():
+            n_items = len(self.item_ids)
+            bought_together, view_purchase = np.zeros(n_items), np.zeros(n_items)
+            sessions = []
+            partials = self._scatter({
+                shard: ("partial", (positions,)) for shard, positions in self._by_owner(seeds).items()
+            })
+            for (bt_columns, bt_values), (vp_columns, vp_values), shard_sessions in partials.values():
+                np.add.at(bought_together, bt_columns, bt_values)
+                np.add.at(view_purchase, vp_columns, vp_values)
+                sessions.append(shard_sessions)
+            sessions = np.unique(np.concatenate(sessions))
+
+            # Seuls les items achetés ensemble sont candidats, hors items du panier
+            bought_together[seeds] = 0
+            candidates = np.flatnonzero(bought_together > 0)
+            unique_sessions = np.zeros(n_items)
+            if len(candidates):
+                counts = self._scatter({
+                    shard: ("unique_sessions", (sessions, positions))
+                    for shard, positions in self._by_owner(candidates).items()
+                })
+                for positions, values in counts.values():
+                    unique_sessions[positions] = values
+
+            bt_weight, us_weight, vp_weight = self.weights
+            values = (
+                bought_together[candidates] * bt_weight
+                + unique_sessions[candidates] * us_weight
+                + view_purchase[candidates] * vp_weight
+            )
+            best = np.argsort(-values, kind="stable")[:num_recommendations]
+            return [
+                {"item_id": int(self.item_ids[candidates[i]]), "score": float(values[i])}
+                for i in best
+            ]
+
+    # Interface d'index de ProductRecommender
+    recommend = recommend_for_product
+    recommend_each = recommend_for_each
+    recommend_many = recommend_for_products
+
+    def recommend_baskets(self, baskets, num_recommendations=5):
+        return [self.recommend_for_products(basket, num_recommendations) for basket in baskets]
+
+    def rebalance(self, owners):
+        """Déplace entre shards les lignes dont le propriétaire change, sans reconstruire l'index"""
+        owners = np.asarray(owners, dtype=np.int64)
+        moved = np.flatnonzero(owners != self.owners)
+        moves = {}
+        for position in moved:
+            moves.setdefault((int(self.owners[position]), int(owners[position])), []).append(position)
+
+        # Copie vers la cible, bascule du propriétaire, puis suppression à la source : une
+        # requête trouve toujours les lignes sur le shard vers lequel elle a été routée
+        for (source, target), positions in moves.items():
+            piece = self._scatter({source: ("extract", (positions,))})[source]
+            self._scatter({target: ("merge", (piece,))})
+            with self._routing:
+                self.owners[positions] = target
+                previous = self._epoch
+                self._epoch += 1
+                self._routing.wait_for(lambda: not any(
+                    count for epoch, count in self._in_flight.items() if epoch <= previous
+                ))
+            self._scatter({source: ("drop", (positions,))})
+        return len(moved)
+
+    def pairs_per_item(self):
+        """Nombre de paires de chaque item, relevé sur les shards (charge de balanced_boundaries)"""
+        pairs = np.zeros(len(self.item_ids), dtype=np.int64)
+        for owned, counts in self._scatter({shard: ("pairs", ()) for shard in range(len(self.connections))}).values():
+            pairs[owned] = counts
+        return pairs
+
+    def stats(self):
+        return self._scatter({shard: ("stats", ()) for shard in range(len(self.connections))})
+
+    def close(self):
+        for shard, connection in enumerate(self.connections):
+            with self._locks[shard]:
+                connection.send(("close", ()))
+                connection.close()
+        for process in self._processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Processus shard distant du ShardCoordinator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--authkey", required=True)
+    args = parser.parse_args()
+    serve((args.host, args.port), args.authkey.encode())
@@ -0,0 +1,77 @@
+import heapq
+import itertools
+
+
+class SpaceSaving:
+    """Compteur approximatif des éléments fréquents (Space-Saving) en mémoire bornée
+
+    Au plus `capacity` éléments sont suivis. Le compte estimé d'un élément surestime
+    son compte réel d'au plus `error(key)`, lui-même borné par total / capacity.
+    """
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("La capacité doit être au moins de 1")
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        # Tas (compte, ordre, clé) avec suppression paresseuse des entrées périmées
+        self._heap = []
+        self._order = itertools.count()
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __contains__(self, key):
+        return key in self.counts
+
+    def _push(self, key):
+        heapq.heappush(self._heap, (self.counts[key], next(self._order), key))
+        # Reconstruction lorsque les entrées périmées dominent le tas
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(count, next(self._order), k) for k, count in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self):
+        while True:
+            count, _, key = heapq.heappop(self._heap)
+            if self.counts.get(key) == count:
+                return key, count
+
+    def add(self, key, weight=1):
+        """Ajoute une occurrence (ou un poids) pour key"""
+        self.total += weight
+        if key in self.counts:
+            self.counts[key] += weight
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = weight
+            self.errors[key] = 0
+        else:
+            # Le nouvel élément hérite du compte minimal comme erreur maximale
+            victim, minimum = self._pop_min()
+            del self.counts[victim]
+            del self.errors[victim]
+            self.counts[key] = minimum + weight
+            self.errors[key] = minimum
+        self._push(key)
+
+    def update(self, keys):
+        """Ajoute une occurrence pour chaque clé (même interface que Counter.update)"""
+        for key in keys:
+            self.add(key)
+
+    def error_bound(self):
+        """Surestimation maximale possible d'un compte"""
+        return self.total / self.capacity
+
+    def count(self, key):
+        return self.counts.get(key, 0)
+
+    def error(self, key):
+        return self.errors.get(key, 0)
+
+    def most_common(self, n=None):
+        """Éléments suivis triés par compte estimé décroissant"""
+        ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        return ranked if n is None else ranked[:n]
@@ -0,0 +1,304 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import hashlib
+import json
+import os
+import shutil
+from .cooccurrence_index import DEFAULT_WEIGHTS, MATRICES, CooccurrenceIndex, to_timestamps
+from .queries import get_queries
+from .refresher import RESCAN_WINDOW
+
+# Incrémenté à chaque changement de disposition des fichiers
+SNAPSHOT_VERSION = 2
+SNAPSHOT_FETCH_SIZE = 50000
+MANIFEST_FILE = "manifest.json"
+
+PURCHASES_BY_SESSION = text("""
+    SELECT session_id, item_id, purchase_date
+    FROM purchases
+    ORDER BY session_id, purchase_date
+""")
+
+VIEWS_BY_SESSION = text("""
+    SELECT session_id, item_id, view_date
+    FROM sessions
+    ORDER BY session_id, view_date
+""")
+
+ARRAYS = {
+    "purchase_sessions": np.int32,
+    "purchase_items": np.int32,
+    "purchase_times": np.int64,
+    "view_sessions": np.int32,
+    "view_items": np.int32,
+    "view_times": np.int64,
+    "session_ids": np.int32,
+    "purchase_offsets": np.int64,
+    "view_offsets": np.int64,
+}
+
+# Tableaux de l'index : identifiants des items, puis data / indices / indptr de chaque matrice
+# de MATRICES (types de scipy, relevés dans le manifeste)
+INDEX_ARRAYS = ("item_ids",) + tuple(
+    f"{name}_{part}" for name in MATRICES for part in ("data", "indices", "indptr")
+)
+
+
+def _as_int32(values, name):
+    values = np.asarray(values, dtype=np.int64)
+    info = np.iinfo(np.int32)
+    if len(values) and (values.min() < info.min or values.max() > info.max):
+        raise ValueError(f"{name} dépasse la plage int32 : instantané impossible")
+    return values.astype(np.int32)
+
+
+def _read_events(db: Session, query, keep=None):
+    """Lit une table triée par session en flux et la convertit en colonnes compactes"""
+    sessions, items, times = [], [], []
+    result = db.execute(query, execution_options={"stream_results": True})
+    for partition in result.partitions(SNAPSHOT_FETCH_SIZE):
+        if keep is not None:
+            partition = [row for row, kept in zip(partition, np.isin([row[0] for row in partition], keep)) if kept]
+        sessions.append(_as_int32([row[0] for row in partition], "session_id"))
+        items.append(_as_int32([row[1] for row in partition], "item_id"))
+        times.append(to_timestamps([row[2] for row in partition]))
+    if not sessions:
+        return np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.int64)
+    return np.concatenate(sessions), np.concatenate(items), np.concatenate(times)
+
+
+def read_events(db: Session, sessions=None):
+    """Achats et consultations (session, item, timestamp) triés par session
+
+    sessions restreint la lecture à ces sessions (filtrées au fil du flux).
+    """
+    return _read_events(db, PURCHASES_BY_SESSION, sessions), _read_events(db, VIEWS_BY_SESSION, sessions)
+
+
+def _version_stamp(db: Session, since=None):
+    """Lignes ingérées depuis since (par défaut RESCAN_WINDOW avant l'horloge de la base)
+
+    Seule la fin des index ingested_at est lue. Une ligne ajoutée après l'export, y compris
+    validée en retard de moins de RESCAN_WINDOW, change ce compte.
+    """
+    queries = get_queries(db.get_bind())
+    if since is None:
+        since = db.execute(queries["database_now"]).scalar() - RESCAN_WINDOW
+    purchases, views = db.execute(queries["snapshot_stamp"], {"since": since}).one()
+    return {"since": since.isoformat(sep=" "), "purchases": int(purchases), "views": int(views)}
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _save(directory, name, array):
+    filename = f"{name}.npy"
+    np.save(os.path.join(directory, filename), array)
+    return {
+        "file": filename,
+        "dtype": array.dtype.str,
+        "length": len(array),
+        "sha256": _sha256(os.path.join(directory, filename)),
+    }
+
+
+def _load(path, name, entry, dtype, verify):
+    filename = os.path.join(path, entry["file"])
+    if verify and _sha256(filename) != entry["sha256"]:
+        raise ValueError(f"Instantané {path} corrompu : somme de contrôle invalide pour {name}")
+    array = np.load(filename, mmap_mode="r")
+    if array.dtype != np.dtype(dtype) or len(array) != entry["length"]:
+        raise ValueError(f"Instantané {path} corrompu : {name} ne correspond pas au manifeste")
+    return array
+
+
+class EventSnapshot:
+    """Instantané colonnaire de purchases et sessions, ouvert en mémoire partagée (mmap)
+
+    Les événements sont triés par session ; pour la session session_ids[i], ses achats
+    sont purchase_*[purchase_offsets[i]:purchase_offsets[i + 1]] (idem pour les consultations).
+    Les dates sont en secondes epoch, MISSING_TIMESTAMP pour NULL.
+
+    L'index de co-occurrence construit à l'export est enregistré avec : index_matrices
+    (matrices CSR sur les fichiers mappés) et item_ids.
+    """
+
+    def __init__(self, path, manifest, arrays):
+        self.path = path
+        self.manifest = manifest
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        shapes = manifest["index"]["shapes"]
+        self.index_matrices = {
+            name: sp.csr_matrix(
+                (arrays[f"{name}_data"], arrays[f"{name}_indices"], arrays[f"{name}_indptr"]),
+                shape=tuple(shapes[name]), copy=False
+            )
+            for name in MATRICES
+        }
+
+    @classmethod
+    def export(cls, db: Session, path, today=None, weights=DEFAULT_WEIGHTS):
+        """Écrit l'instantané et son index dans le répertoire path (remplacé de façon atomique)"""
+        # Tampon relevé avant la lecture : une ligne arrivée pendant l'export rend l'instantané périmé
+        stamp = _version_stamp(db)
+        purchases, views = read_events(db)
+        purchase_sessions, purchase_items, purchase_times = purchases
+        view_sessions, view_items, view_times = views
+
+        session_ids = np.union1d(purchase_sessions, view_sessions).astype(np.int32)
+        arrays = {
+            "purchase_sessions": purchase_sessions,
+            "purchase_items": purchase_items,
+            "purchase_times": purchase_times,
+            "view_sessions": view_sessions,
+            "view_items": view_items,
+            "view_times": view_times,
+            "session_ids": session_ids,
+            "purchase_offsets": np.append(
+                np.searchsorted(purchase_sessions, session_ids), len(purchase_sessions)
+            ).astype(np.int64),
+            "view_offsets": np.append(
+                np.searchsorted(view_sessions, session_ids), len(view_sessions)
+            ).astype(np.int64),
+        }
+
+        arrays = {name: array.astype(ARRAYS[name], copy=False) for name, array in arrays.items()}
+
+        index = CooccurrenceIndex.from_events(
+            purchase_sessions.astype(np.int64), purchase_items.astype(np.int64), purchase_times,
+            view_sessions.astype(np.int64), view_items.astype(np.int64), view_times,
+            today=today, weights=weights
+        )
+        arrays["item_ids"] = index.item_ids
+        for name in MATRICES:
+            matrix = getattr(index, name)
+            arrays[f"{name}_data"] = matrix.data
+            arrays[f"{name}_indices"] = matrix.indices
+            arrays[f"{name}_indptr"] = matrix.indptr
+
+        staging = f"{path}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        manifest = {
+            "version": SNAPSHOT_VERSION,
+            "created_at": index.built_at.isoformat(),
+            "stamp": stamp,
+            "arrays": {name: _save(staging, name, array) for name, array in arrays.items()},
+            "index": {
+                "weights": list(index.weights),
+                "shapes": {name: list(getattr(index, name).shape) for name in MATRICES},
+            },
+        }
+        with open(os.path.join(staging, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(staging, path)
+        return manifest
+
+    @classmethod
+    def open(cls, path, verify=False):
+        """Ouvre l'instantané en lecture seule (mmap) après contrôle de version et de structure
+
+        Avec verify=True, les sommes de contrôle de tous les fichiers sont aussi vérifiées.
+        """
+        with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(
+                f"Instantané {path} en version {manifest.get('version')}, "
+                f"version {SNAPSHOT_VERSION} attendue : ré-exporter l'instantané"
+            )
+
+        entries = manifest["arrays"]
+        arrays = {name: _load(path, name, entries[name], dtype, verify) for name, dtype in ARRAYS.items()}
+        # Les tableaux de l'index gardent les types choisis par scipy à l'export
+        for name in INDEX_ARRAYS:
+            arrays[name] = _load(path, name, entries[name], entries[name]["dtype"], verify)
+
+        if len(arrays["purchase_offsets"]) != len(arrays["session_ids"]) + 1 \
+                or len(arrays["view_offsets"]) != len(arrays["session_ids"]) + 1:
+            raise ValueError(f"Instantané {path} corrompu : tableaux d'offsets incohérents")
+        for name, (rows, _) in manifest["index"]["shapes"].items():
+            if len(arrays[f"{name}_indptr"]) != rows + 1 \
+                    or len(arrays[f"{name}_indices"]) != len(arrays[f"{name}_data"]):
+                raise ValueError(f"Instantané {path} corrompu : matrice {name} incohérente")
+        return cls(path, manifest, arrays)
+
+    def is_stale(self, db: Session):
+        """Indique si des lignes ont été ingérées depuis l'export (comparaison au tampon de version)"""
+        stamp = self.manifest["stamp"]
+        return _version_stamp(db, datetime.fromisoformat(stamp["since"])) != stamp
+
+    def session_events(self, session_id):
+        """Achats et consultations (item, timestamp) d'une session"""
+        position = np.searchsorted(self.session_ids, session_id)
+        if position >= len(self.session_ids) or self.session_ids[position] != session_id:
+            return (np.empty(0, np.int32), np.empty(0, np.int64)), (np.empty(0, np.int32), np.empty(0, np.int64))
+        p_start, p_end = self.purchase_offsets[position], self.purchase_offsets[position + 1]
+        v_start, v_end = self.view_offsets[position], self.view_offsets[position + 1]
+        return (
+            (self.purchase_items[p_start:p_end], self.purchase_times[p_start:p_end]),
+            (self.view_items[v_start:v_end], self.view_times[v_start:v_end]),
+        )
+
+    def item_stats(self, item_ids):
+        """Consultations et achats par item, comme la jointure de StatsAnalyzer.calculate_stats"""
+        wanted = np.unique(np.asarray(item_ids, dtype=np.int64))
+        mask = np.isin(self.view_items, wanted)
+        view_items = np.asarray(self.view_items[mask], dtype=np.int64)
+        view_keys = (np.asarray(self.view_sessions[mask], dtype=np.int64) << 32) | (view_items & 0xFFFFFFFF)
+
+        purchase_mask = np.isin(self.purchase_items, wanted)
+        purchase_keys = (
+            (np.asarray(self.purchase_sessions[purchase_mask], dtype=np.int64) << 32)
+            | (np.asarray(self.purchase_items[purchase_mask], dtype=np.int64) & 0xFFFFFFFF)
+        )
+        purchased = np.isin(view_keys, purchase_keys)
+
+        items, positions = np.unique(view_items, return_inverse=True)
+        total_views = np.bincount(positions, minlength=len(items))
+        total_purchases = np.bincount(positions, weights=purchased, minlength=len(items)).astype(np.int64)
+        return pd.DataFrame({
+            "item_id": items,
+            "total_views": total_views,
+            "total_purchases": total_purchases,
+            "view_to_purchase_rate": total_purchases / np.maximum(total_views, 1),
+        })
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Instantané colonnaire des événements")
+    parser.add_argument("command", choices=["export", "check"])
+    parser.add_argument("path", nargs="?", default="events.snapshot")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    if args.command == "export":
+        started = time.perf_counter()
+        manifest = EventSnapshot.export(db, args.path)
+        print(
+            f"✅ Instantané {args.path} : {manifest['arrays']['purchase_items']['length']} achats, "
+            f"{manifest['arrays']['view_items']['length']} consultations, "
+            f"{manifest['arrays']['item_ids']['length']} items indexés ({time.perf_counter() - started:.1f} s)"
+        )
+    else:
+        snapshot = EventSnapshot.open(args.path, verify=True)
+        if snapshot.is_stale(db):
+            print(f"⚠️ Instantané {args.path} périmé (exporté le {snapshot.manifest['created_at']})")
+        else:
+            print(f"✅ Instantané {args.path} intègre et à jour")
@@ -1,80 +1,162 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import text
-from sqlalchemy import text
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import random
+import time
 from .models import Purchase, Session as SessionModel
-from .item_validator import ItemValidator
 from .recommender import ProductRecommender
+from .queries import get_queries
+from .metrics import timed
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Nombre d'items consultés par lot du rapport catalogue
+REPORT_CHUNK_SIZE = 5000
+# Lignes lues par fetch depuis le curseur serveur
+REPORT_FETCH_SIZE = 10000
+
+REPORT_COLUMNS = {
+    'item_id': 'int64',
+    'total_views': 'int64',
+    'total_purchases': 'int64',
+    'view_to_purchase_rate': 'float64',
+    'top_recommendation': 'Int64',
+    'recommendation_score': 'float64',
+}
+
+# Analyseur propre à chaque processus du pool, créé par _init_report_worker
+_worker_analyzer = None
+
+
+def _init_report_worker(url):
+    global _worker_analyzer
+    engine = create_engine(url, poolclass=NullPool)
+    _worker_analyzer = StatsAnalyzer(sessionmaker(bind=engine)())
+
+
+def _report_chunk(bounds):
+    low, high = bounds
+    return _worker_analyzer.catalog_chunk_stats(low, high)
+
+
+class _ReportWriter:
+    """Écrit le rapport lot par lot en CSV ou en Parquet (selon l'extension)"""
+
+    def __init__(self, output):
+        self.output = output
+        self.parquet = output.endswith(".parquet")
+        self._parquet_writer = None
+        self.rows = 0
+
+    def write(self, frame):
+        if self.parquet:
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ImportError("pyarrow est requis pour générer un rapport Parquet")
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.output, table.schema)
+            self._parquet_writer.write_table(table)
+        elif self.rows == 0:
+            frame.to_csv(self.output, index=False, encoding='utf-8-sig')
+        else:
+            frame.to_csv(self.output, mode='a', header=False, index=False, encoding='utf-8')
+        self.rows += len(frame)
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
 class StatsAnalyzer:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, recommender=None, snapshot=None):
         self.db = db
-        self.validator = ItemValidator(db)
-        self.recommender = ProductRecommender(db)
+        # Un ProductRecommender existant (index, cache...) peut être réutilisé
+        self.recommender = recommender or ProductRecommender(db, snapshot=snapshot)
+        self.validator = self.recommender.validator
+        # EventSnapshot à jour du recommender : statistiques lues en mmap plutôt qu'en base
+        self.snapshot = self.recommender.snapshot
+
+    @timed("StatsAnalyzer.get_random_items")
+    def get_random_items(self, num_items=10, max_attempts=None):
+        """Récupère des items aléatoires existants dans la base
 
-    def get_random_items(self, num_items=10):
-        """Récupère des items aléatoires existants dans la base"""
+        Chaque item est trouvé par une recherche d'index (premier item_id supérieur
+        ou égal à un pivot aléatoire) plutôt qu'en triant tout le catalogue. Les items
+        qui suivent un grand écart d'identifiants sont donc un peu plus souvent tirés.
+        """
         try:
-            # Requête optimisée pour récupérer des items aléatoires
-            query = text("""
-                SELECT item_id FROM (
-                    SELECT DISTINCT item_id FROM purchases
-                    UNION
-                    SELECT DISTINCT item_id FROM sessions
-                ) AS combined_items
-                ORDER BY RAND()
-                LIMIT %s
-            """)
-            result = self.db.execute(query, (num_items,))
-            return [row[0] for row in result]
+            queries = get_queries(self.db.get_bind())
+            low, high = self.db.execute(queries["item_id_bounds"]).one()
+            if low is None:
+                return []
+
+            items = []
+            for _ in range(max_attempts or num_items * 10):
+                if len(items) >= num_items:
+                    break
+                item = self.db.execute(
+                    queries["item_at_or_after"], {"pivot": random.randint(low, high)}
+                ).scalar()
+                if item is not None and item not in items:
+                    items.append(item)
+            return items
         except Exception as e:
             logger.error(f"Erreur lors de la récupération des items aléatoires: {str(e)}")
             return []
 
+    def _query_item_stats(self, item_ids):
+        """Consultations et achats par item, calculés depuis la base"""
+        # Importation des données jointes
+        purchases_query = self.db.query(
+            Purchase.session_id,
+            Purchase.item_id,
+            Purchase.purchase_date
+        ).filter(Purchase.item_id.in_(item_ids))
+
+        sessions_query = self.db.query(
+            SessionModel.session_id,
+            SessionModel.item_id,
+            SessionModel.view_date
+        ).filter(SessionModel.item_id.in_(item_ids))
+
+        # Création des DataFrames
+        purchases_df = pd.read_sql(purchases_query.statement, self.db.bind)
+        sessions_df = pd.read_sql(sessions_query.statement, self.db.bind)
+
+        # Fusion des données
+        merged_df = pd.merge(
+            sessions_df,
+            purchases_df,
+            on=['session_id', 'item_id'],
+            how='left',
+            suffixes=('_view', '_purchase')
+        )
+
+        # Calcul des métriques
+        return merged_df.groupby('item_id').agg(
+            total_views=('item_id', 'count'),
+            total_purchases=('purchase_date', 'count'),
+            view_to_purchase_rate=('purchase_date', lambda x: x.notna().mean())
+        ).reset_index()
+
+    @timed("StatsAnalyzer.calculate_stats")
     def calculate_stats(self, item_ids):
         """Calcule les statistiques de recommandation"""
         try:
-            # Importation des données jointes
-            purchases_query = self.db.query(
-                Purchase.session_id,
-                Purchase.item_id,
-                Purchase.purchase_date
-            ).filter(Purchase.item_id.in_(item_ids))
-
-            sessions_query = self.db.query(
-                SessionModel.session_id,
-                SessionModel.item_id,
-                SessionModel.view_date
-            ).filter(SessionModel.item_id.in_(item_ids))
-
-            # Création des DataFrames
-            purchases_df = pd.read_sql(purchases_query.statement, self.db.bind)
-            sessions_df = pd.read_sql(sessions_query.statement, self.db.bind)
-
-            # Fusion des données
-            merged_df = pd.merge(
-                sessions_df,
-                purchases_df,
-                on=['session_id', 'item_id'],
-                how='left',
-                suffixes=('_view', '_purchase')
-            )
+            if self.snapshot is not None:
+                stats = self.snapshot.item_stats(item_ids)
+            else:
+                stats = self._query_item_stats(item_ids)
 
-            # Calcul des métriques
-            stats = merged_df.groupby('item_id').agg(
-                total_views=('item_id', 'count'),
-                total_purchases=('purchase_date', 'count'),
-                view_to_purchase_rate=('purchase_date', lambda x: x.notna().mean())
-            ).reset_index()
-
-            # Ajout des recommandations
+            # Ajout des recommandations : top-1 de tous les items en un seul appel groupé
             recommendations = []
-            for item_id in item_ids:
-                recs = self.recommender.recommend_for_product(item_id)
+            for item_id, recs in self.recommender.recommend_for_each(item_ids, num_recommendations=1).items():
                 if recs:
                     recommendations.append({
                         'item_id': item_id,
@@ -82,7 +164,10 @@ class StatsAnalyzer:
                         'recommendation_score': recs[0]['score']
                     })
 
-            recommendations_df = pd.DataFrame(recommendations)
+            recommendations_df = pd.DataFrame(
+                recommendations,
+                columns=['item_id', 'top_recommendation', 'recommendation_score']
+            )
             final_df = pd.merge(stats, recommendations_df, on='item_id', how='left')
 
             return final_df
@@ -90,6 +175,85 @@ class StatsAnalyzer:
             logger.error(f"Erreur lors du calcul des statistiques: {str(e)}")
             return pd.DataFrame()
 
+    @timed("StatsAnalyzer.catalog_chunk_stats")
+    def catalog_chunk_stats(self, low, high, fetch_size=REPORT_FETCH_SIZE):
+        """Statistiques et top-1 des items consultés dont l'id est dans ]low, high]"""
+        query = get_queries(self.db.get_bind())["catalog_item_stats"]
+        frames = []
+        with self.db.get_bind().connect() as connection:
+            connection = connection.execution_options(stream_results=True)
+            for stats in pd.read_sql(query, connection, params={"low": low, "high": high}, chunksize=fetch_size):
+                stats['view_to_purchase_rate'] = stats['total_purchases'] / stats['total_views']
+                top = self.recommender.recommend_for_each(
+                    stats['item_id'].tolist(), num_recommendations=1, validate=False
+                )
+                stats['top_recommendation'] = [
+                    recs[0]['item_id'] if recs else None for recs in map(top.get, stats['item_id'])
+                ]
+                stats['recommendation_score'] = [
+                    recs[0]['score'] if recs else None for recs in map(top.get, stats['item_id'])
+                ]
+                frames.append(stats)
+
+        if not frames:
+            return pd.DataFrame(columns=list(REPORT_COLUMNS)).astype(REPORT_COLUMNS)
+        return pd.concat(frames, ignore_index=True)[list(REPORT_COLUMNS)].astype(REPORT_COLUMNS)
+
+    def _catalog_chunks(self, chunk_size):
+        """Découpe les item_id consultés en intervalles ]low, high] de chunk_size items (pagination par clé)"""
+        queries = get_queries(self.db.get_bind())
+        low, _ = self.db.execute(queries["item_id_bounds"]).one()
+        if low is None:
+            return
+        after = low - 1
+        while True:
+            end = self.db.execute(
+                queries["catalog_chunk_end"], {"after": after, "chunk_size": chunk_size}
+            ).scalar()
+            if end is None:
+                return
+            yield after, end
+            after = end
+
+    @timed("StatsAnalyzer.generate_catalog_report")
+    def generate_catalog_report(self, output='rapport_catalogue.csv', chunk_size=REPORT_CHUNK_SIZE, workers=1):
+        """Génère le rapport de tout le catalogue, lot par lot, en mémoire bornée
+
+        Avec workers > 1, les lots sont calculés par un pool de processus (chacun avec
+        sa propre connexion) et écrits dans l'ordre des item_id au fil de l'eau.
+        """
+        started = time.perf_counter()
+        writer = _ReportWriter(output)
+        chunks = 0
+        try:
+            if workers > 1:
+                url = self.db.get_bind().url.render_as_string(hide_password=False)
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_report_worker, initargs=(url,)) as executor:
+                    # Au plus deux lots en attente par worker pour borner la mémoire
+                    pending = deque()
+                    for bounds in self._catalog_chunks(chunk_size):
+                        pending.append(executor.submit(_report_chunk, bounds))
+                        if len(pending) >= 2 * workers:
+                            writer.write(pending.popleft().result())
+                            chunks += 1
+                    while pending:
+                        writer.write(pending.popleft().result())
+                        chunks += 1
+            else:
+                for low, high in self._catalog_chunks(chunk_size):
+                    writer.write(self.catalog_chunk_stats(low, high))
+                    chunks += 1
+        except Exception as e:
+            logger.error(f"Erreur lors de la génération du rapport catalogue: {str(e)}")
+            return None
+        finally:
+            writer.close()
+
+        elapsed = time.perf_counter() - started
+        logger.info(f"Rapport catalogue généré: {output} ({writer.rows} items, {chunks} lots, {elapsed:.1f} s)")
+        return {"output": output, "items": writer.rows, "chunks": chunks, "seconds": elapsed}
+
+    @timed("StatsAnalyzer.generate_report")
     def generate_report(self, num_items=10):
         """Génère un rapport complet"""
         items = self.get_random_items(num_items)
@@ -110,10 +274,23 @@ class StatsAnalyzer:
             return None
 
 if __name__ == "__main__":
+    import argparse
     from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Rapport de recommandations")
+    parser.add_argument("--catalog", action="store_true", help="Rapport de tout le catalogue plutôt qu'un échantillon")
+    parser.add_argument("--num-items", type=int, default=10)
+    parser.add_argument("--output", default="rapport_catalogue.csv", help="Fichier .csv ou .parquet du rapport catalogue")
+    parser.add_argument("--chunk-size", type=int, default=REPORT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
     db = SessionLocal()
     analyzer = StatsAnalyzer(db)
-    report = analyzer.generate_report()
+    if args.catalog:
+        report = analyzer.generate_catalog_report(args.output, chunk_size=args.chunk_size, workers=args.workers)
+    else:
+        report = analyzer.generate_report(args.num_items)
     if report is not None:
         print("Rapport généré avec succès!")
     else:
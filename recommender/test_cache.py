@@ -0,0 +1,100 @@
+import threading
+import time
+from .cache import RecommendationCache
+
+def test_single_flight(num_threads=8):
+    """Vérifie que les appels concurrents sur une même clé ne calculent qu'une fois"""
+    cache = RecommendationCache()
+    key = cache.make_key("recommend_for_product", [1], 5, validate=True)
+    calls = []
+    results = []
+
+    def compute():
+        calls.append(True)
+        time.sleep(0.05)
+        return [{"item_id": 2, "score": 1.0}]
+
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_compute(key, compute, item_ids=[1])))
+        for _ in range(num_threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = cache.stats()
+    assert len(calls) == 1, calls
+    assert results == [[{"item_id": 2, "score": 1.0}]] * num_threads
+    assert stats["misses"] == 1 and stats["coalesced"] == num_threads - 1
+    print(f"✅ Un seul calcul pour {num_threads} appels concurrents")
+
+def test_returns_copies():
+    """Vérifie qu'un appelant qui modifie sa liste n'altère pas l'entrée en cache"""
+    cache = RecommendationCache()
+    key = cache.make_key("recommend_for_product", [1], 5, validate=True)
+    first = cache.get_or_compute(key, lambda: [{"item_id": 2, "score": 1.0}], item_ids=[1])
+    first.append({"item_id": 3, "score": 0.5})
+    first[0]["score"] = 99.0
+
+    second = cache.get_or_compute(key, lambda: [], item_ids=[1])
+    assert second == [{"item_id": 2, "score": 1.0}], second
+    second.clear()
+    assert cache.get_or_compute(key, lambda: [], item_ids=[1]) == [{"item_id": 2, "score": 1.0}]
+    print("✅ Les résultats servis sont des copies")
+
+def test_key_includes_params():
+    """Vérifie que validate (et les autres paramètres) distinguent les entrées"""
+    cache = RecommendationCache()
+    validated = cache.make_key("recommend_for_product", [1], 5, validate=True)
+    unvalidated = cache.make_key("recommend_for_product", [1], 5, validate=False)
+    assert validated != unvalidated
+    cache.get_or_compute(validated, lambda: [], item_ids=[1])
+    assert cache.get_or_compute(unvalidated, lambda: [{"item_id": 2, "score": 1.0}], item_ids=[1])
+    assert cache.make_key("recommend_for_products", [2, 1, 2], 5) == cache.make_key("recommend_for_products", [1, 2], 5)
+    print("✅ La clé tient compte de validate")
+
+def test_invalidation():
+    """Vérifie l'invalidation par item source, par item recommandé et pendant un calcul"""
+    cache = RecommendationCache()
+    source = cache.make_key("recommend_for_product", [1], 5)
+    other = cache.make_key("recommend_for_product", [5], 5)
+    cache.get_or_compute(source, lambda: [{"item_id": 2, "score": 1.0}], item_ids=[1])
+    cache.get_or_compute(other, lambda: [{"item_id": 6, "score": 1.0}], item_ids=[5])
+
+    # Item recommandé : l'entrée de l'item source 1 est concernée, pas celle de 5
+    assert cache.invalidate_items([2]) == 1
+    assert cache.stats()["size"] == 1
+    assert cache.invalidate_items([1]) == 0
+
+    # Invalidation pendant le calcul : le résultat est renvoyé mais pas conservé
+    def compute():
+        cache.invalidate_items([1])
+        return [{"item_id": 2, "score": 1.0}]
+
+    assert cache.get_or_compute(source, compute, item_ids=[1]) == [{"item_id": 2, "score": 1.0}]
+    assert cache.stats()["size"] == 1
+    print("✅ Invalidation des entrées concernées, y compris en cours de calcul")
+
+def test_ttl_and_lru():
+    """Vérifie l'expiration et l'éviction de l'entrée la moins récemment utilisée"""
+    cache = RecommendationCache(maxsize=2, ttl=0.05)
+    keys = [cache.make_key("recommend_for_product", [item], 5) for item in range(3)]
+    cache.get_or_compute(keys[0], lambda: [0], item_ids=[0])
+    cache.get_or_compute(keys[1], lambda: [1], item_ids=[1])
+    cache.get_or_compute(keys[0], lambda: None, item_ids=[0])
+    cache.get_or_compute(keys[2], lambda: [2], item_ids=[2])
+    assert cache.stats()["evictions"] == 1
+    assert cache.get_or_compute(keys[0], lambda: None, item_ids=[0]) == [0]
+
+    time.sleep(0.06)
+    assert cache.get_or_compute(keys[0], lambda: ["recalculé"], item_ids=[0]) == ["recalculé"]
+    assert cache.stats()["expirations"] == 1
+    print("✅ Expiration TTL et éviction LRU")
+
+if __name__ == "__main__":
+    test_single_flight()
+    test_returns_copies()
+    test_key_includes_params()
+    test_invalidation()
+    test_ttl_and_lru()
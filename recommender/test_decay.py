@@ -0,0 +1,169 @@
+import math
+from datetime import datetime, timedelta
+from .decay import DecayedScores
+from .models import DecayedRecommendation
+from .recommender import ProductRecommender
+from .refresher import IncrementalRefresher
+from .test_fixtures import memory_session, insert_events, synthetic_events, as_rows
+
+NOW = datetime.now().replace(microsecond=0)
+HALF_LIFE = timedelta(days=30)
+
+def _close(actual, expected):
+    """Dictionnaires item -> score égaux aux arrondis de calcul près"""
+    return actual.keys() == expected.keys() and all(
+        math.isclose(actual[key], expected[key], rel_tol=1e-6) for key in expected
+    )
+
+def _refused(call):
+    try:
+        call()
+    except ValueError:
+        return True
+    return False
+
+def _scores(db, half_life=HALF_LIFE):
+    scores = DecayedScores(db, half_life=half_life)
+    scores.ensure_tables()
+    return scores
+
+def _decayed_at(db, scores, now):
+    """Comptes décrus de la table, ramenés à now"""
+    table = DecayedRecommendation.__table__
+    return {
+        (row.source_item_id, row.recommended_item_id, row.recommendation_type):
+            (row.count, round(row.decayed_count * scores.decay(now - row.updated_at), 6))
+        for row in db.execute(table.select())
+    }
+
+def test_decay_math():
+    """Vérifie qu'une demi-vie écoulée divise par deux la contribution d'un événement"""
+    db = memory_session()
+    ingested_at = NOW - timedelta(minutes=10)
+    insert_events(
+        db.get_bind(),
+        purchases=[(1, 1, NOW - HALF_LIFE), (1, 2, NOW - HALF_LIFE), (2, 1, NOW), (2, 2, NOW),
+                   (3, 3, NOW - 2 * HALF_LIFE)],
+        views=[(3, 1, NOW - 2 * HALF_LIFE - timedelta(minutes=1))],
+        ingested_at=ingested_at,
+    )
+    scores = _scores(db)
+    scores.update(now=NOW, until=ingested_at)
+
+    recommendations = {rec["item_id"]: rec["decayed_score"] for rec in scores.recommend(1, 5, now=NOW)}
+    # Achetés ensemble (2 + 1,5) : 1 + 0,5 ; consultation puis achat (3) : 0,25
+    assert math.isclose(recommendations[2], 3.5 * 1.5)
+    assert math.isclose(recommendations[3], 3 * 0.25)
+    later = {rec["item_id"]: rec["decayed_score"] for rec in scores.recommend(1, 5, now=NOW + HALF_LIFE)}
+    assert math.isclose(later[2], recommendations[2] / 2)
+    assert scores.decay(-HALF_LIFE) == 1.0
+    print("✅ Contributions divisées par deux à chaque demi-vie")
+
+def test_incremental_matches_full_build():
+    """Vérifie que des mises à jour successives (événements tardifs compris) égalent une construction unique"""
+    purchases, views = synthetic_events(num_sessions=300, num_items=30, days=80)
+    db = memory_session()
+    scores = _scores(db)
+    # Trois lots ingérés à des jours d'intervalle, chacun mêlant événements récents et anciens
+    for part in range(3):
+        ingested_at = NOW - timedelta(minutes=10 - part)
+        insert_events(
+            db.get_bind(),
+            *(as_rows(tuple(column[part::3] for column in table)) for table in (purchases, views)),
+            ingested_at=ingested_at,
+        )
+        scores.update(now=NOW - timedelta(days=2 - part), until=ingested_at)
+    incremental = _decayed_at(db, scores, NOW)
+
+    scores.reset()
+    scores.update(now=NOW, until=ingested_at)
+    full = _decayed_at(db, scores, NOW)
+    assert {key: count for key, (count, _) in incremental.items()} == {key: count for key, (count, _) in full.items()}
+    assert _close({key: value for key, (_, value) in incremental.items()}, {key: value for key, (_, value) in full.items()})
+    # Une mise à jour sans nouvelle ligne recompte la fenêtre sans rien changer
+    scores.update(now=NOW, until=ingested_at)
+    assert _decayed_at(db, scores, NOW) == full
+    print(f"✅ Mises à jour incrémentales identiques à la construction complète ({len(full)} paires)")
+
+def test_late_commit():
+    """Vérifie qu'une transaction validée après le passage du watermark est comptée une fois"""
+    purchases, views = synthetic_events(num_sessions=200, num_items=20, days=40)
+    db = memory_session()
+    insert_events(db.get_bind(), as_rows(purchases), as_rows(views), ingested_at=NOW - timedelta(minutes=10))
+    scores = _scores(db)
+    scores.update(now=NOW, until=NOW - timedelta(minutes=5))
+
+    # Lignes horodatées avant le watermark mais visibles seulement maintenant
+    insert_events(db.get_bind(), [(0, 101, NOW), (1, 101, NOW)], [(2, 101, NOW - timedelta(days=1))],
+                  ingested_at=NOW - timedelta(minutes=7))
+    scores.update(now=NOW, until=NOW - timedelta(minutes=4))
+    scores.update(now=NOW, until=NOW - timedelta(minutes=3))
+    incremental = _decayed_at(db, scores, NOW)
+    scores.reset()
+    scores.update(now=NOW, until=NOW - timedelta(minutes=3))
+    full = _decayed_at(db, scores, NOW)
+    assert incremental.keys() == full.keys() and any(key[1] == 101 for key in full)
+    assert all(incremental[key][0] == full[key][0] for key in full)
+    assert _close({key: value for key, (_, value) in incremental.items()}, {key: value for key, (_, value) in full.items()})
+    print("✅ Transaction validée en retard comptée une seule fois")
+
+def test_half_life_mismatch():
+    """Vérifie qu'une table construite avec une autre demi-vie est refusée jusqu'au reset"""
+    purchases, views = synthetic_events(num_sessions=50, num_items=10, days=10)
+    db = memory_session()
+    ingested_at = NOW - timedelta(minutes=10)
+    insert_events(db.get_bind(), as_rows(purchases), as_rows(views), ingested_at=ingested_at)
+    _scores(db).update(now=NOW, until=ingested_at)
+
+    other = _scores(db, half_life=timedelta(days=7))
+    assert _refused(lambda: other.update(now=NOW, until=ingested_at))
+    assert _refused(lambda: other.recommend(0))
+    other.reset()
+    other.update(now=NOW, until=ingested_at)
+    assert other.recommend(0)
+    assert _refused(lambda: _scores(db).recommend(0))
+    print("✅ Demi-vie différente refusée, acceptée après reset")
+
+def test_weighted_score_parity(limit=50):
+    """Vérifie "score" et, sans décroissance, "decayed_score" contre recommend_for_product"""
+    purchases, views = synthetic_events(num_sessions=300, num_items=30, days=60)
+    db = memory_session()
+    ingested_at = NOW - timedelta(minutes=10)
+    insert_events(db.get_bind(), as_rows(purchases), as_rows(views), ingested_at=ingested_at)
+    refresher = IncrementalRefresher(db)
+    refresher.ensure_tables()
+    refresher.run_once(now=NOW, until=ingested_at)
+    # Demi-vie très longue : tous les événements comptent pour 1, comme dans la fenêtre de 90 jours
+    scores = _scores(db, half_life=timedelta(days=10 ** 8))
+    scores.update(now=NOW, until=ingested_at)
+
+    live = ProductRecommender(db)
+    for item_id in range(30):
+        expected = {rec["item_id"]: rec["score"] for rec in live.recommend_for_product(item_id, limit)}
+        decayed = scores.recommend(item_id, limit, now=NOW)
+        assert _close({rec["item_id"]: rec["score"] for rec in decayed}, expected)
+        assert _close({rec["item_id"]: rec["decayed_score"] for rec in decayed}, expected)
+    print("✅ Scores identiques à recommend_for_product")
+
+def test_validation():
+    """Vérifie que le mode décroissant valide les items comme les autres chemins"""
+    purchases, views = synthetic_events(num_sessions=50, num_items=10, days=10)
+    db = memory_session()
+    ingested_at = NOW - timedelta(minutes=10)
+    insert_events(db.get_bind(), as_rows(purchases), as_rows(views), ingested_at=ingested_at)
+    scores = _scores(db)
+    scores.update(now=NOW, until=ingested_at)
+
+    recommender = ProductRecommender(db, decayed_scores=scores)
+    assert recommender.recommend_for_product(999) == []
+    assert recommender.recommend_for_products([999]) == []
+    assert recommender.recommend_for_product(0)
+    print("✅ Items inconnus refusés en mode décroissant")
+
+if __name__ == "__main__":
+    test_decay_math()
+    test_incremental_matches_full_build()
+    test_late_commit()
+    test_half_life_mismatch()
+    test_weighted_score_parity()
+    test_validation()
@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+import math
+import numpy as np
+from .data_generator import generate_events
+from .evaluation import evaluate_events, grid_search, heldout_sessions, time_split
+from .recommender import ProductRecommender
+from .test_fixtures import memory_session, as_rows
+
+SPLIT = datetime(2026, 2, 1)
+DAY = timedelta(days=1)
+
+def _table(rows):
+    sessions, items, dates = zip(*rows)
+    return np.array(sessions), np.array(items), np.array(dates, dtype="datetime64[s]")
+
+# Entraînement : 1 acheté avec 2 (deux sessions) et avec 3 (une session).
+# Test : la session 10 achète 1 puis 3, la 11 achète 1 puis 2 et 4 (inconnu), la 12 un seul item.
+# La session 5 commence avant le découpage : ni son achat ultérieur ni elle-même ne comptent.
+PURCHASES = [
+    (1, 1, SPLIT - 30 * DAY), (1, 2, SPLIT - 30 * DAY), (2, 1, SPLIT - 29 * DAY), (2, 2, SPLIT - 29 * DAY),
+    (3, 1, SPLIT - 28 * DAY), (3, 3, SPLIT - 28 * DAY), (5, 2, SPLIT + DAY),
+    (10, 1, SPLIT + DAY), (10, 3, SPLIT + DAY + timedelta(minutes=5)),
+    (11, 1, SPLIT + 2 * DAY), (11, 2, SPLIT + 2 * DAY + timedelta(minutes=1)),
+    (11, 4, SPLIT + 2 * DAY + timedelta(minutes=2)), (12, 2, SPLIT + 3 * DAY),
+]
+VIEWS = [(5, 3, SPLIT - timedelta(hours=1))]
+EVENTS = (_table(PURCHASES), _table(VIEWS))
+
+def test_time_split():
+    """Vérifie que l'entraînement s'arrête au découpage et que le test ne garde que les sessions postérieures"""
+    train, test, split_at = time_split(EVENTS, split_at=SPLIT)
+    assert split_at == SPLIT
+    assert train[0][0].tolist() == [1, 1, 2, 2, 3, 3] and train[1][0].tolist() == [5]
+    assert sorted(set(test[0][0].tolist())) == [10, 11, 12] and len(test[1][0]) == 0
+
+    # Par défaut : quantile des dates d'achat
+    _, _, split_at = time_split(EVENTS, train_fraction=0.5)
+    median = int(np.quantile(EVENTS[0][2].astype(np.int64), 0.5))
+    assert split_at == np.datetime64(median, "s").astype(datetime)
+    print("✅ Découpage temporel sans fuite du test vers l'entraînement")
+
+def test_heldout_sessions():
+    """Vérifie les graines, les cibles et l'abandon des sessions sans cible"""
+    _, test, _ = time_split(EVENTS, split_at=SPLIT)
+    sessions, items, is_seed = heldout_sessions(test[0])
+    assert list(zip(sessions.tolist(), items.tolist(), is_seed.tolist())) == [
+        (10, 1, True), (10, 3, False), (11, 1, True), (11, 2, False), (11, 4, False),
+    ]
+    # Achat répété : seul le premier compte ; deux graines : la session 10 n'a plus de cible
+    sessions, items, is_seed = heldout_sessions(_table(PURCHASES[7:12] + [(11, 1, SPLIT + 3 * DAY)]), 2)
+    assert list(zip(sessions.tolist(), items.tolist(), is_seed.tolist())) == [
+        (11, 1, True), (11, 2, True), (11, 4, False),
+    ]
+    print("✅ Graines et cibles des sessions de test")
+
+def test_evaluate():
+    """Vérifie les métriques calculées à la main et le classement de la grille"""
+    evaluation = evaluate_events(EVENTS, split_at=SPLIT)
+    assert evaluation.num_sessions == 2
+    # Depuis 1 : 2 (score 7) puis 3 (score 3.5) ; la session 10 vise 3, la 11 vise 2 et 4
+    expected = {
+        "hit_rate@1": 0.5, "hit_rate@5": 1.0, "recall@1": 0.25, "recall@5": 0.75, "mrr@1": 0.5, "mrr@5": 0.75,
+    }
+    result = evaluation.evaluate(ks=(1, 5))
+    assert all(math.isclose(result[name], value) for name, value in expected.items()), result
+
+    grid = ((1, 2), (0, 1.5), (0, 3))
+    results = grid_search(evaluation, grid=grid, ks=(1, 5), metric="mrr@5")
+    assert len(results) == 8 and all(math.isclose(r["mrr@5"], 0.75) for r in results)
+    assert grid_search(evaluation, grid=grid, ks=(1, 5), metric="mrr@5", workers=2) == results
+    print("✅ Métriques et grille de poids conformes au calcul à la main")
+
+def test_same_scores_as_recommend_for_products(num_sessions=40):
+    """Vérifie que les scores du jeu d'évaluation sont ceux de recommend_for_products (SQL)"""
+    events = generate_events(num_sessions=1500, num_items=60, months=2, seed=1)
+    train, _, split_at = time_split(events)
+    evaluation = evaluate_events(events, split_at=split_at)
+    live = ProductRecommender(memory_session(as_rows(train[0]), as_rows(train[1])))
+    num_items = len(evaluation.item_ids)
+    scores = evaluation.bought_together * 2 + evaluation.unique_sessions * 1.5 + evaluation.view_purchase * 3
+
+    hits = recalls = 0.0
+    for row in range(evaluation.num_sessions):
+        seeds = evaluation.item_ids[evaluation.seeds[row].indices].tolist()
+        expected = live.recommend_for_products(seeds, num_recommendations=num_items, validate=False)
+        if row < num_sessions:
+            candidates = [pos for pos in evaluation.bought_together[row].indices
+                          if evaluation.item_ids[pos] not in seeds and evaluation.bought_together[row, pos] > 0]
+            served = {int(evaluation.item_ids[pos]): round(scores[row, pos], 6) for pos in candidates}
+            assert served == {rec["item_id"]: round(rec["score"], 6) for rec in expected}, seeds
+        # Au rang num_items, hit-rate et recall ne dépendent pas des ex-aequo
+        targets = set(evaluation.item_ids[evaluation.targets[row].indices].tolist())
+        found = len(targets & {rec["item_id"] for rec in expected})
+        hits += found > 0
+        recalls += found / evaluation.num_targets[row]
+
+    result = evaluation.evaluate(ks=(num_items,))
+    assert math.isclose(result[f"hit_rate@{num_items}"], hits / evaluation.num_sessions)
+    assert math.isclose(result[f"recall@{num_items}"], recalls / evaluation.num_sessions)
+    print(f"✅ Scores identiques à recommend_for_products sur {evaluation.num_sessions} sessions de test")
+
+if __name__ == "__main__":
+    test_time_split()
+    test_heldout_sessions()
+    test_evaluate()
+    test_same_scores_as_recommend_for_products()
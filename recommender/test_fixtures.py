@@ -0,0 +1,60 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from datetime import date
+from .models import Base, Purchase, Session, event_rows
+import numpy as np
+
+def memory_session(purchases=(), views=()):
+    """Session SQLite en mémoire, tables créées et remplies des événements (session, item, date)"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    insert_events(engine, purchases, views)
+    return sessionmaker(bind=engine)()
+
+def insert_events(bind, purchases=(), views=(), ingested_at=None):
+    """Insère des listes de tuples (session_id, item_id, datetime) d'achats et de consultations
+
+    ingested_at remplace l'horloge de la base comme date d'insertion des lignes.
+    """
+    for table, columns, events in (
+        (Purchase.__table__, ("session_id", "item_id", "purchase_date"), purchases),
+        (Session.__table__, ("session_id", "item_id", "view_date"), views),
+    ):
+        if not events:
+            continue
+        sessions, items, dates = zip(*events)
+        rows = event_rows(columns, sessions, items, np.array(dates, dtype="datetime64[s]"))
+        if ingested_at is not None:
+            for row in rows:
+                row["ingested_at"] = ingested_at
+        with bind.begin() as conn:
+            conn.execute(table.insert(), rows)
+
+def synthetic_events(num_sessions=2000, num_items=150, days=55, seed=0, end=None):
+    """Événements ((sessions, items, dates) des achats et des consultations) sur les derniers jours
+
+    Popularité en loi de puissance ; dans chaque session, les consultations précèdent les achats.
+    """
+    rng = np.random.default_rng(seed)
+    popularity = 1 / np.arange(1, num_items + 1) ** 1.1
+    popularity /= popularity.sum()
+    tables = ([], [])
+    start = np.datetime64(end or date.today(), "s") - np.timedelta64(days, "D")
+    for session in range(num_sessions):
+        at = start + np.timedelta64(int(rng.integers(0, (days - 1) * 86400)), "s")
+        bought = rng.choice(num_items, size=rng.integers(1, 5), replace=False, p=popularity)
+        viewed = rng.choice(num_items, size=rng.integers(0, 4), replace=False, p=popularity)
+        for offset, item in enumerate(viewed):
+            tables[1].append((session, int(item), at + np.timedelta64(offset, "s")))
+        for offset, item in enumerate(bought):
+            tables[0].append((session, int(item), at + np.timedelta64(60 + offset, "s")))
+    return tuple(
+        (np.array([e[0] for e in table], dtype=np.int64), np.array([e[1] for e in table], dtype=np.int64),
+         np.array([e[2] for e in table], dtype="datetime64[s]"))
+        for table in tables
+    )
+
+def as_rows(table):
+    """Tableaux (sessions, items, dates) en tuples (session_id, item_id, datetime) pour insert_events"""
+    return list(zip(table[0].tolist(), table[1].tolist(), table[2].astype("datetime64[s]").tolist()))
@@ -0,0 +1,89 @@
+import os
+import tempfile
+from datetime import datetime
+from .ingest import EventIngester, validator_listener
+from .item_validator import ItemValidator
+from .models import Purchase, Session
+from .test_fixtures import memory_session
+
+CSV_PURCHASES = """session_id,item_id,purchase_date
+1,10,2026-01-01 10:00:00
+1,11,2026-01-01 10:05:00
+2,10,2026-01-02 09:00:00
+3,12,2026-01-03 08:00:00
+3,13,2026-01-03 08:01:00
+"""
+# Dates avec fuseau ramenées en UTC naïf ; colonne de date sous un alias
+JSONL_VIEWS = """{"session_id": 1, "item_id": 12, "timestamp": "2026-01-01T11:00:00+02:00"}
+{"session_id": 2, "item_id": 11, "timestamp": "2026-01-02T08:00:00Z"}
+{"session_id": 2, "item_id": 11, "timestamp": "2026-01-02T08:00:00Z"}
+"""
+
+def _write(content, suffix):
+    handle, path = tempfile.mkstemp(suffix=suffix)
+    with os.fdopen(handle, "w", encoding="utf-8") as f:
+        f.write(content)
+    return path
+
+def _rows(db, table):
+    return sorted(tuple(row)[:3] for row in db.execute(table.select()))
+
+def test_idempotent_ingestion():
+    """Vérifie qu'ingérer deux fois les mêmes fichiers ne crée aucun doublon"""
+    db = memory_session()
+    ingester = EventIngester(db.get_bind(), chunk_size=2)
+    purchases, views = _write(CSV_PURCHASES, ".csv"), _write(JSONL_VIEWS, ".jsonl")
+    try:
+        for _ in range(2):
+            assert ingester.ingest_file(purchases, "purchases")["rows_sent"] == 5
+            ingester.ingest_file(views, "views")
+            assert len(_rows(db, Purchase.__table__)) == 5
+    finally:
+        os.remove(purchases)
+        os.remove(views)
+    assert _rows(db, Session.__table__) == [
+        (1, 12, datetime(2026, 1, 1, 9)), (2, 11, datetime(2026, 1, 2, 8)),
+    ]
+    print("✅ Ré-ingestion sans doublon, dates ramenées en UTC")
+
+def test_resume_after_failure():
+    """Vérifie qu'une ingestion interrompue se relance sur le même fichier"""
+    db = memory_session()
+    calls = []
+
+    def failing_listener(table, events):
+        calls.append(len(events[0]))
+        if len(calls) == 2:
+            raise RuntimeError("interruption")
+
+    path = _write(CSV_PURCHASES, ".csv")
+    try:
+        try:
+            EventIngester(db.get_bind(), chunk_size=2, listeners=[failing_listener]).ingest_file(path, "purchases")
+        except RuntimeError:
+            pass
+        # Les lots validés avant l'interruption sont conservés
+        assert len(_rows(db, Purchase.__table__)) == 4
+        EventIngester(db.get_bind(), chunk_size=2).ingest_file(path, "purchases")
+    finally:
+        os.remove(path)
+    assert len(_rows(db, Purchase.__table__)) == 5
+    print("✅ Reprise après interruption sans perte ni doublon")
+
+def test_listeners():
+    """Vérifie que les items ingérés sont visibles du validateur sans rechargement"""
+    db = memory_session([(1, 10, datetime(2026, 1, 1))])
+    validator = ItemValidator(db, refresh_interval=None)
+    assert not validator.item_exists(13)
+    path = _write(CSV_PURCHASES, ".csv")
+    try:
+        EventIngester(db.get_bind(), listeners=[validator_listener(validator)]).ingest_file(path, "purchases")
+    finally:
+        os.remove(path)
+    assert validator.items_exist([10, 11, 12, 13]) == (True, [10, 11, 12, 13])
+    print("✅ Items ingérés ajoutés au validateur")
+
+if __name__ == "__main__":
+    test_idempotent_ingestion()
+    test_resume_after_failure()
+    test_listeners()
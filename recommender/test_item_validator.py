@@ -0,0 +1,66 @@
+import threading
+import time
+from datetime import datetime
+from .item_validator import ItemValidator
+from .test_fixtures import memory_session, insert_events
+
+PURCHASES = [(1, 10, datetime(2026, 1, 1)), (1, 11, datetime(2026, 1, 1)), (2, 12, datetime(2026, 1, 2))]
+
+def test_items_exist():
+    """Vérifie la validation par lot : ordre conservé, doublons et items inconnus retirés"""
+    db = memory_session(PURCHASES)
+    validator = ItemValidator(db)
+    assert validator.item_exists(10)
+    assert not validator.item_exists(99)
+    assert validator.items_exist([12, 99, 10, 12]) == (False, [12, 10])
+    assert validator.items_exist([10, 11]) == (True, [10, 11])
+    assert validator.items_exist([]) == (False, [])
+    # Même résultat sans cache en mémoire
+    assert ItemValidator(db, cache_ids=False).items_exist([12, 99]) == (False, [12])
+    print("✅ Validation par lot identique avec et sans cache")
+
+def test_add_items_and_refresh():
+    """Vérifie l'ajout d'items ingérés et le rechargement à expiration"""
+    db = memory_session(PURCHASES)
+    validator = ItemValidator(db, refresh_interval=0.05)
+    assert not validator.item_exists(13)
+    validator.add_items([13])
+    assert validator.item_exists(13)
+
+    insert_events(db.get_bind(), [(3, 14, datetime(2026, 1, 3))])
+    assert not validator.item_exists(14)
+    time.sleep(0.06)
+    assert validator.item_exists(14)
+    print("✅ Items ajoutés visibles immédiatement, base relue à expiration")
+
+def test_single_refresh(num_threads=8):
+    """Vérifie que des appels concurrents ne déclenchent qu'un chargement"""
+    db = memory_session(PURCHASES)
+    validator = ItemValidator(db)
+    refreshes = []
+    refresh = validator.refresh
+
+    def counted_refresh():
+        refreshes.append(True)
+        time.sleep(0.05)
+        return refresh()
+
+    validator.refresh = counted_refresh
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(validator.items_exist([10, 12, 99])[1]))
+        for _ in range(num_threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(refreshes) == 1, refreshes
+    assert results == [[10, 12]] * num_threads
+    print(f"✅ Un seul chargement pour {num_threads} validations concurrentes")
+
+if __name__ == "__main__":
+    test_items_exist()
+    test_add_items_and_refresh()
+    test_single_refresh()
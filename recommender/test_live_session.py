@@ -0,0 +1,70 @@
+import time
+from datetime import date
+from .cooccurrence_index import CooccurrenceIndex, to_timestamps
+from .live_session import BYTES_PER_ENTRY, LiveSession, LiveSessionStore
+from .test_fixtures import synthetic_events
+
+TODAY = date.today()
+
+def _index(num_sessions=400, num_items=40):
+    (ps, pi, pt), (vs, vi, vt) = synthetic_events(num_sessions=num_sessions, num_items=num_items)
+    return CooccurrenceIndex.from_events(ps, pi, to_timestamps(pt), vs, vi, to_timestamps(vt), today=TODAY)
+
+def _scores(recommendations):
+    return {rec["item_id"]: round(rec["score"], 9) for rec in recommendations}
+
+def test_incremental_parity(limit=10):
+    """Vérifie qu'après chaque événement le top-k égale recommend_for_products sur la session"""
+    index = _index()
+    session = LiveSession(index)
+    items = index.item_ids.tolist()[:8]
+    for position, item_id in enumerate(items):
+        assert session.view(item_id) if position % 2 else session.buy(item_id)
+        # Mêmes scores ; à égalité de score en limite du top-k, l'item retenu peut différer
+        complete = _scores(index.recommend_many(items[:position + 1], len(index.item_ids)))
+        top = _scores(session.top(limit))
+        assert all(complete[item] == score for item, score in top.items())
+        assert sorted(top.values(), reverse=True) == sorted(complete.values(), reverse=True)[:limit]
+    assert not session.view(items[0])
+    assert not session.view(-1)
+    print(f"✅ Top-k incrémental identique au calcul complet sur {len(items)} événements")
+
+def test_memory_budget(num_sessions=50):
+    """Vérifie que le budget mémoire est tenu en évinçant les sessions les moins récentes"""
+    index = _index()
+    items = index.item_ids.tolist()
+    store = LiveSessionStore(index, max_bytes=2000 * BYTES_PER_ENTRY)
+    for session_id in range(num_sessions):
+        for offset in range(3):
+            store.view(session_id, items[(session_id + offset) % len(items)])
+        # La session 0 reste la plus récemment utilisée
+        store.top(0)
+        assert store.stats()["estimated_bytes"] <= store.max_bytes
+    stats = store.stats()
+    assert stats["evictions"] > 0 and stats["sessions"] < num_sessions
+    assert store.top(0) and store.top(1) == []
+
+    # Entrées comptées égales à celles réellement conservées
+    assert stats["estimated_bytes"] == sum(len(session) for session in store._sessions.values()) * BYTES_PER_ENTRY
+    for session_id in list(store._sessions):
+        store.end(session_id)
+    assert store.stats()["estimated_bytes"] == 0 and len(store) == 0
+    print(f"✅ Budget mémoire tenu ({stats['evictions']} évictions, {stats['sessions']} sessions conservées)")
+
+def test_idle_expiry():
+    """Vérifie l'expiration des sessions inactives"""
+    index = _index(num_sessions=100, num_items=20)
+    items = index.item_ids.tolist()
+    store = LiveSessionStore(index, idle_timeout=0.05)
+    store.view(1, items[0])
+    store.view(2, items[1])
+    time.sleep(0.06)
+    store.view(3, items[2])
+    assert store.top(1) == [] and len(store) == 1
+    assert store.stats()["expirations"] == 2
+    print("✅ Sessions inactives expirées")
+
+if __name__ == "__main__":
+    test_incremental_parity()
+    test_memory_budget()
+    test_idle_expiry()
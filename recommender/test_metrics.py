@@ -0,0 +1,61 @@
+import logging
+from datetime import datetime
+from sqlalchemy import text
+from .cooccurrence_index import CooccurrenceIndex
+from .metrics import ExplainWorker, Metrics, instrument_engine, slow_query_logger
+from .recommender import ProductRecommender
+from .test_fixtures import memory_session
+
+NOW = datetime.now().replace(microsecond=0)
+PURCHASES = [(1, 1, NOW), (1, 2, NOW), (2, 1, NOW), (2, 3, NOW)]
+VIEWS = [(1, 3, NOW)]
+
+class _Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+def test_explain_off_request_path():
+    """Vérifie que le plan d'une requête lente est calculé et journalisé hors du thread appelant"""
+    db = memory_session(PURCHASES, VIEWS)
+    metrics, worker, handler = Metrics(), ExplainWorker(), _Records()
+    instrument_engine(db.get_bind(), metrics, slow_query_ms=0, explain_worker=worker)
+    slow_query_logger.addHandler(handler)
+    try:
+        db.execute(text("SELECT item_id FROM purchases WHERE session_id = :session_id"), {"session_id": 1})
+        worker.join()
+    finally:
+        slow_query_logger.removeHandler(handler)
+    assert metrics.dump()["counters"]["slow_queries"]
+    record = handler.records[-1]
+    assert record.threadName == "explain-worker"
+    assert "Plan: [" in record.getMessage()
+    print("✅ EXPLAIN des requêtes lentes exécuté par le thread dédié")
+
+def test_sources():
+    """Vérifie que chaque chemin de calcul enregistre sa source"""
+    db = memory_session(PURCHASES, VIEWS)
+    for recommender, source in (
+        (ProductRecommender(db), "live"),
+        (ProductRecommender(db, index=CooccurrenceIndex.load(db)), "index"),
+    ):
+        calls = (
+            lambda: recommender.recommend_for_product(1),
+            lambda: recommender.recommend_for_products([1, 2]),
+            lambda: recommender.recommend_for_each([1, 2]),
+        )
+        for call in calls:
+            recommender.last_source = None
+            call()
+            assert recommender.last_source == source, (source, recommender.last_source)
+    recommender = ProductRecommender(db)
+    recommender.get_purchase_paths(3, min_support=1)
+    assert recommender.last_source == "live"
+    print("✅ Source enregistrée sur chaque chemin")
+
+if __name__ == "__main__":
+    test_explain_off_request_path()
+    test_sources()
@@ -0,0 +1,54 @@
+import numpy as np
+from datetime import date
+from .cooccurrence_index import CooccurrenceIndex, to_timestamps
+from .neighbors import NeighborTable, TopKNeighborBuilder, evaluate
+from .test_fixtures import synthetic_events
+
+TODAY = date.today()
+
+def _index(events):
+    (ps, pi, pt), (vs, vi, vt) = events
+    return CooccurrenceIndex.from_events(ps, pi, to_timestamps(pt), vs, vi, to_timestamps(vt), today=TODAY)
+
+def test_exact_scores():
+    """Vérifie que les scores servis sont les scores exacts, même avec des compteurs saturés"""
+    events = synthetic_events()
+    index = _index(events)
+    for error_bound in (1e-9, 0.05):
+        builder = TopKNeighborBuilder(k=10, error_bound=error_bound, session_chunk_size=300)
+        result = evaluate(builder.build(events, today=TODAY), index)
+        assert result["score_error"] < 1e-9, result
+    print("✅ Scores servis égaux aux scores exacts")
+
+def test_recall():
+    """Vérifie le rappel : exact avec une capacité suffisante, élevé avec des compteurs bornés"""
+    events = synthetic_events()
+    index = _index(events)
+    exact = TopKNeighborBuilder(k=10, error_bound=1e-9).build(events, today=TODAY)
+    assert evaluate(exact, index)["recall"] == 1.0
+    for item_id in index.item_ids.tolist()[:20]:
+        assert exact.recommend(item_id, 10) == index.recommend(item_id, 10) or (
+            [rec["score"] for rec in exact.recommend(item_id, 10)]
+            == [rec["score"] for rec in index.recommend(item_id, 10)]
+        )
+
+    bounded = TopKNeighborBuilder(k=10, error_bound=0.05)
+    recall = evaluate(bounded.build(events, today=TODAY), index)["recall"]
+    assert recall >= 0.85, recall
+    print(f"✅ Rappel exact sans borne, {recall:.3f} avec {bounded.stats['capacity']} compteurs par item")
+
+def test_save_open(tmp_path="/tmp/test_neighbors.npz"):
+    """Vérifie l'aller-retour sur disque de la table"""
+    events = synthetic_events(num_sessions=200, num_items=30)
+    table = TopKNeighborBuilder(k=5).build(events, today=TODAY)
+    table.save(tmp_path)
+    reopened = NeighborTable.open(tmp_path)
+    assert reopened.k == 5
+    assert all(reopened.recommend(item, 5) == table.recommend(item, 5) for item in table.item_ids.tolist())
+    assert reopened.recommend(-1) == []
+    print("✅ Table relue à l'identique")
+
+if __name__ == "__main__":
+    test_exact_scores()
+    test_recall()
+    test_save_open()
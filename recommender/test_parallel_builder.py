@@ -0,0 +1,37 @@
+import random
+from datetime import date
+import numpy as np
+from .cooccurrence_index import CooccurrenceIndex, to_timestamps
+from .data_generator import generate_events
+from .parallel_builder import ParallelCooccurrenceBuilder
+
+TODAY = date(2026, 3, 1)
+
+def _same(left, right):
+    return (left != right).nnz == 0
+
+def test_parallel_build(num_baskets=20, basket_size=4, seed=0):
+    """Vérifie qu'un index construit par 1 ou 2 workers égale CooccurrenceIndex.from_events"""
+    generated = generate_events(num_sessions=1500, num_items=80, months=4, end=TODAY, seed=seed)
+    # Même format que read_events : dates en secondes epoch
+    purchases, views = ((sessions, items, to_timestamps(times)) for sessions, items, times in generated)
+    expected = CooccurrenceIndex.from_events(*purchases, *views, today=TODAY)
+    rng = random.Random(seed)
+    items = expected.item_ids.tolist()
+    baskets = [rng.sample(items, basket_size) for _ in range(num_baskets)]
+
+    for workers in (1, 2):
+        index = ParallelCooccurrenceBuilder(workers=workers).build_index((purchases, views), today=TODAY)
+        assert np.array_equal(index.item_ids, expected.item_ids)
+        for name in ("bought_together", "unique_sessions", "view_purchase", "last_interaction", "scores"):
+            assert _same(getattr(index, name), getattr(expected, name)), (workers, name)
+        # Les incidences session×item sont empilées par fragment : mêmes totaux par item
+        for name in ("purchased", "recent_purchased"):
+            assert np.array_equal(getattr(index, name).sum(axis=0), getattr(expected, name).sum(axis=0))
+        for basket in baskets:
+            assert [rec["score"] for rec in index.recommend_many(basket, 10)] == \
+                [rec["score"] for rec in expected.recommend_many(basket, 10)], (workers, basket)
+    print("✅ Index parallèle (1 et 2 workers) identique à from_events")
+
+if __name__ == "__main__":
+    test_parallel_build()
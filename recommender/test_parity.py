@@ -0,0 +1,187 @@
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from .data_generator import generate_events, load_events
+from .recommender import ProductRecommender
+from .cooccurrence_index import CooccurrenceIndex
+from .test_fixtures import memory_session, as_rows
+
+# Événements générés sur deux mois : la plupart tombent dans la fenêtre de 90 jours
+EVENTS = dict(num_sessions=800, num_items=60, months=2, seed=0)
+
+def _db():
+    purchases, views = generate_events(**EVENTS)
+    return memory_session(as_rows(purchases), as_rows(views))
+
+def _as_scores(recommendations):
+    return {rec["item_id"]: round(float(rec["score"]), 6) for rec in recommendations}
+
+def test_recommend_for_products_parity(num_baskets=20, basket_size=5, seed=0):
+    """Vérifie que le scoring vectorisé reproduit le weighted_score de la requête SQL"""
+    db = _db()
+    try:
+        index = CooccurrenceIndex.load(db)
+        sql_recommender = ProductRecommender(db)
+        index_recommender = ProductRecommender(db, index=index)
+
+        items = [int(item) for item in index.item_ids]
+        # Limite suffisante pour comparer l'ensemble des candidats sans ambiguïté d'ex-aequo
+        limit = len(items)
+        rng = random.Random(seed)
+
+        baskets = [rng.sample(items, min(basket_size, len(items))) for _ in range(num_baskets)]
+        batched = index_recommender.recommend_for_baskets(baskets, num_recommendations=limit)
+
+        mismatches = []
+        for basket, batch_result in zip(baskets, batched):
+            expected = _as_scores(sql_recommender.recommend_for_products(basket, num_recommendations=limit))
+            single_result = index_recommender.recommend_for_products(basket, num_recommendations=limit)
+            if _as_scores(single_result) != expected or _as_scores(batch_result) != expected:
+                mismatches.append(basket)
+
+        if mismatches:
+            print(f"❌ {len(mismatches)} paniers divergent entre SQL et l'index : {mismatches}")
+        else:
+            print(f"✅ Scores identiques entre SQL et l'index sur {len(baskets)} paniers")
+        assert not mismatches
+    finally:
+        db.close()
+
+def test_recommend_for_product_parity(num_items=50, seed=0):
+    """Vérifie que l'index reproduit le score de la requête SQL du dialecte courant"""
+    db = _db()
+    try:
+        index = CooccurrenceIndex.load(db)
+        sql_recommender = ProductRecommender(db)
+        index_recommender = ProductRecommender(db, index=index)
+
+        items = [int(item) for item in index.item_ids]
+        limit = len(items)
+        rng = random.Random(seed)
+
+        mismatches = []
+        for item_id in rng.sample(items, min(num_items, len(items))):
+            expected = _as_scores(sql_recommender.recommend_for_product(item_id, num_recommendations=limit))
+            if _as_scores(index_recommender.recommend_for_product(item_id, num_recommendations=limit)) != expected:
+                mismatches.append(item_id)
+
+        if mismatches:
+            print(f"❌ {len(mismatches)} items divergent entre SQL et l'index : {mismatches}")
+        else:
+            print(f"✅ Scores identiques entre SQL ({sql_recommender.queries.dialect}) et l'index")
+        assert not mismatches
+    finally:
+        db.close()
+
+def test_async_parity(num_items=30, basket_size=5, seed=0):
+    """Vérifie que la variante asyncio renvoie les mêmes résultats que l'API synchrone"""
+    from .async_recommender import AsyncProductRecommender, get_async_engine
+
+    # Base sur disque : l'engine asyncio ouvre ses propres connexions
+    directory = tempfile.mkdtemp(prefix="test_parity_")
+    url = f"sqlite:///{os.path.join(directory, 'parity.db')}"
+    load_events(create_engine(url), *generate_events(**EVENTS))
+    db = sessionmaker(bind=create_engine(url))()
+    try:
+        sync_recommender = ProductRecommender(db)
+        items = sync_recommender.validator.filter_existing(range(1, 100000)).tolist()
+        rng = random.Random(seed)
+        sample = rng.sample(items, min(num_items, len(items)))
+        baskets = [rng.sample(items, min(basket_size, len(items))) for _ in range(num_items)]
+
+        async def run():
+            engine = get_async_engine(url)
+            try:
+                recommender = AsyncProductRecommender(engine)
+                singles = await asyncio.gather(*(recommender.recommend_for_product(item, 10) for item in sample))
+                multiples = await asyncio.gather(*(recommender.recommend_for_products(basket, 10) for basket in baskets))
+                paths = await asyncio.gather(*(recommender.get_purchase_paths(item) for item in sample))
+                return singles, multiples, paths
+            finally:
+                await engine.dispose()
+
+        singles, multiples, paths = asyncio.run(run())
+        mismatches = [
+            item for item, result in zip(sample, singles)
+            if [rec["score"] for rec in result]
+            != [rec["score"] for rec in sync_recommender.recommend_for_product(item, 10)]
+        ]
+        mismatches += [
+            basket for basket, result in zip(baskets, multiples)
+            if _as_scores(result) != _as_scores(sync_recommender.recommend_for_products(basket, 10))
+        ]
+        mismatches += [
+            item for item, result in zip(sample, paths)
+            if result != sync_recommender.get_purchase_paths(item)
+        ]
+
+        if mismatches:
+            print(f"❌ {len(mismatches)} divergences entre les API asyncio et synchrone : {mismatches}")
+        else:
+            print("✅ Résultats identiques entre les API asyncio et synchrone")
+        assert not mismatches
+    finally:
+        db.close()
+        shutil.rmtree(directory)
+
+def test_sharded_parity(num_shards=3, num_baskets=20, basket_size=5, seed=0):
+    """Vérifie que le ShardCoordinator renvoie les résultats de l'index, avant et après rééquilibrage
+
+    Chaque shard construit ses lignes depuis la base, puis depuis un instantané.
+    """
+    from .sharding import ShardCoordinator, balanced_boundaries, range_owners
+    from .snapshot import EventSnapshot
+
+    # Base sur disque : chaque processus shard ouvre ses propres connexions
+    directory = tempfile.mkdtemp(prefix="test_parity_")
+    url = f"sqlite:///{os.path.join(directory, 'parity.db')}"
+    load_events(create_engine(url), *generate_events(**EVENTS))
+    db = sessionmaker(bind=create_engine(url))()
+    try:
+        index = CooccurrenceIndex.load(db)
+        snapshot = os.path.join(directory, "events.snapshot")
+        EventSnapshot.export(db, snapshot)
+        items = index.item_ids.tolist()
+        rng = random.Random(seed)
+        baskets = [rng.sample(items, min(basket_size, len(items))) for _ in range(num_baskets)]
+
+        mismatches = []
+        for source in ({"database_url": url}, {"snapshot": snapshot}):
+            coordinator = ShardCoordinator.start_local(num_shards, **source)
+            try:
+                assert coordinator.item_ids.tolist() == items
+                for _ in range(2):
+                    mismatches += [
+                        (source, item) for item in items
+                        if coordinator.recommend_for_product(item, 10) != index.recommend(item, 10)
+                    ]
+                    # Les ex-aequo au dixième rang sont départagés arbitrairement : comparaison des scores
+                    mismatches += [
+                        (source, basket) for basket in baskets
+                        if [rec["score"] for rec in coordinator.recommend_for_products(basket, 10)]
+                        != [rec["score"] for rec in index.recommend_many(basket, 10)]
+                    ]
+                    boundaries = balanced_boundaries(coordinator.item_ids, coordinator.pairs_per_item(), num_shards)
+                    coordinator.rebalance(range_owners(coordinator.item_ids, boundaries))
+                assert sum(stats["items"] for stats in coordinator.stats().values()) == len(items)
+            finally:
+                coordinator.close()
+
+        if mismatches:
+            print(f"❌ {len(mismatches)} divergences entre l'index réparti et l'index local : {mismatches}")
+        else:
+            print(f"✅ Résultats identiques sur {num_shards} shards, avant et après rééquilibrage")
+        assert not mismatches
+    finally:
+        db.close()
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    test_recommend_for_product_parity()
+    test_recommend_for_products_parity()
+    test_async_parity()
+    test_sharded_parity()
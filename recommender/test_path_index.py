@@ -0,0 +1,50 @@
+import os
+import tempfile
+from .path_index import PurchasePathIndex
+from .recommender import ProductRecommender
+from .test_fixtures import memory_session, synthetic_events, as_rows
+
+def _as_set(paths):
+    return sorted((tuple(entry["path"]), entry["frequency"]) for entry in paths)
+
+def _db(num_sessions=600, num_items=20):
+    purchases, views = synthetic_events(num_sessions=num_sessions, num_items=num_items)
+    return memory_session(as_rows(purchases), as_rows(views))
+
+def test_index_parity(num_items=20):
+    """Vérifie que l'index répond comme la requête en direct, quel que soit le nombre de workers"""
+    db = _db(num_items=num_items)
+    live = ProductRecommender(db)
+    for workers in (1, 2):
+        index = PurchasePathIndex.build(db, max_depth=3, min_support=2, workers=workers)
+        for item_id in range(num_items):
+            for max_path_length in (1, 2, 3):
+                for min_support in (2, 3):
+                    expected = live.get_purchase_paths(item_id, max_path_length, min_support, validate=False)
+                    served = index.get(item_id, max_path_length, min_support)
+                    assert _as_set(served) == _as_set(expected), (item_id, max_path_length, min_support)
+                    frequencies = [entry["frequency"] for entry in served]
+                    assert frequencies == sorted(frequencies, reverse=True)
+    print(f"✅ Parcours de l'index identiques à la requête en direct sur {num_items} items")
+
+def test_fallback_and_save():
+    """Vérifie le repli SQL hors couverture de l'index et l'aller-retour sur disque"""
+    db = _db(num_sessions=200, num_items=10)
+    index = PurchasePathIndex.build(db, max_depth=2, min_support=2)
+    assert index.covers(2, 3) and not index.covers(3, 2) and not index.covers(2, 1)
+
+    recommender = ProductRecommender(db, path_index=index)
+    live = ProductRecommender(db)
+    assert _as_set(recommender.get_purchase_paths(0, 3, 2, validate=False)) == \
+        _as_set(live.get_purchase_paths(0, 3, 2, validate=False))
+
+    path = os.path.join(tempfile.mkdtemp(prefix="test_path_index_"), "paths.idx")
+    index.save(path)
+    reloaded = PurchasePathIndex.load(path)
+    os.remove(path)
+    assert all(reloaded.get(item, 2, 2) == index.get(item, 2, 2) for item in range(10))
+    print("✅ Repli SQL hors couverture, index relu à l'identique")
+
+if __name__ == "__main__":
+    test_index_parity()
+    test_fallback_and_save()
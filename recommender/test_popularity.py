@@ -0,0 +1,122 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from .cooccurrence_index import CooccurrenceIndex
+from .models import WeightedRecommendation
+from .popularity import PopularityTracker
+from .recommender import ProductRecommender
+from .refresher import IncrementalRefresher
+from .test_fixtures import memory_session, insert_events
+
+NOW = datetime.now().replace(microsecond=0)
+# Item 1 acheté avec 2 ; 3 consulté avant l'achat de 4 ; 5 acheté seul ; 6 et 7 hors fenêtre
+PURCHASES = [
+    (1, 1, NOW), (1, 2, NOW), (2, 4, NOW), (3, 5, NOW), (4, 2, NOW), (5, 2, NOW),
+    (6, 6, NOW - timedelta(days=200)), (6, 7, NOW - timedelta(days=200)),
+]
+VIEWS = [(2, 3, NOW - timedelta(minutes=1))]
+
+def _refreshed(purchases=PURCHASES, views=VIEWS):
+    db = memory_session()
+    ingested_at = NOW - timedelta(minutes=10)
+    insert_events(db.get_bind(), purchases, views, ingested_at=ingested_at)
+    refresher = IncrementalRefresher(db)
+    refresher.ensure_tables()
+    refresher.run_once(now=NOW, until=ingested_at)
+    return db
+
+def test_cold_items():
+    """Vérifie que les items froids sont ceux sans co-occurrence servie, consultations comprises"""
+    db = _refreshed()
+    tracker = PopularityTracker(db).load()
+    live = ProductRecommender(db)
+    for item_id in range(1, 8):
+        assert tracker.is_cold(item_id) == (live.recommend_for_product(item_id) == []), item_id
+    assert not tracker.is_cold(3)
+    assert tracker.is_cold(5) and tracker.is_cold(6)
+
+    # Achats écrits hors de l'ingester : visibles au rafraîchissement suivant
+    insert_events(db.get_bind(), [(7, 5, NOW), (7, 6, NOW)], ingested_at=NOW - timedelta(minutes=5))
+    IncrementalRefresher(db).run_once(now=NOW, until=NOW - timedelta(minutes=5))
+    tracker.refresh_degrees()
+    assert not tracker.is_cold(5) and not tracker.is_cold(6)
+    print("✅ Items froids identiques aux listes vides de recommend_for_product")
+
+def test_no_degrees():
+    """Vérifie qu'aucun item n'est froid tant que weighted_recommendations est vide"""
+    db = memory_session(PURCHASES, VIEWS)
+    IncrementalRefresher(db).ensure_tables()
+    tracker = PopularityTracker(db).load()
+    assert not any(tracker.is_cold(item_id) for item_id in range(1, 8))
+    print("✅ Détection désactivée sans table de scores")
+
+def test_missing_table():
+    """Vérifie qu'une base sans weighted_recommendations (init_db) se charge sans détection"""
+    db = memory_session(PURCHASES, VIEWS)
+    WeightedRecommendation.__table__.drop(db.get_bind())
+    tracker = PopularityTracker(db).load()
+    assert tracker.degrees is None and not tracker.is_cold(5)
+    assert ProductRecommender(db, popularity=tracker).recommend_for_product(1, 3)
+    print("✅ Table de scores absente traitée comme vide")
+
+def test_unknown_items():
+    """Vérifie que les items inconnus renvoient [] sans complément, quel que soit le chemin"""
+    db = _refreshed()
+    empty = memory_session(PURCHASES, VIEWS)
+    IncrementalRefresher(empty).ensure_tables()
+    for database, index in ((db, None), (db, CooccurrenceIndex.load(db)), (empty, None)):
+        recommender = ProductRecommender(database, index=index, popularity=PopularityTracker(database).load())
+        assert recommender.recommend_for_product(999) == []
+        assert recommender.recommend_for_products([999, 998]) == []
+        assert recommender.recommend_for_each([999, 5], 2) == {999: [], 5: recommender.recommend_for_product(5, 2)}
+        assert len(recommender.recommend_for_products([999, 1], 3)) == 3
+    print("✅ Items inconnus jamais complétés par popularité")
+
+def test_padding():
+    """Vérifie le complément par les items populaires et la réponse directe des items froids"""
+    db = _refreshed()
+    tracker = PopularityTracker(db).load(now=NOW)
+    assert tracker.top(2) == [2, 1]
+    padded = tracker.pad([{"item_id": 2, "score": 3.5}], 3, exclude=[1])
+    assert padded == [
+        {"item_id": 2, "score": 3.5}, {"item_id": 4, "score": 0.0}, {"item_id": 5, "score": 0.0}
+    ]
+
+    recommender = ProductRecommender(db, popularity=tracker)
+    assert recommender.recommend_for_product(5, 2) == [{"item_id": 2, "score": 0.0}, {"item_id": 1, "score": 0.0}]
+    assert recommender.last_source == "popularity"
+    assert [rec["item_id"] for rec in recommender.recommend_for_product(1, 3)] == [2, 4, 5]
+    assert recommender.recommend_for_product(999) == []
+    print("✅ Listes complétées par popularité, items froids servis directement")
+
+def test_single_load(num_threads=8):
+    """Vérifie que des appels concurrents ne déclenchent qu'un chargement"""
+    db = _refreshed()
+    tracker = PopularityTracker(db)
+    loads = []
+    load = tracker.load
+
+    def counted_load(*args, **kwargs):
+        loads.append(True)
+        time.sleep(0.05)
+        return load(*args, **kwargs)
+
+    tracker.load = counted_load
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(tracker.is_cold(5))) for _ in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(loads) == 1, loads
+    assert results == [True] * num_threads
+    print(f"✅ Un seul chargement pour {num_threads} appels concurrents")
+
+if __name__ == "__main__":
+    test_cold_items()
+    test_no_degrees()
+    test_missing_table()
+    test_unknown_items()
+    test_padding()
+    test_single_load()
@@ -0,0 +1,40 @@
+from sqlalchemy import text
+from .cooccurrence_index import CooccurrenceIndex
+from .parallel_builder import ParallelCooccurrenceBuilder
+from .recommender import ProductRecommender
+from .test_fixtures import memory_session, synthetic_events, as_rows
+
+def _scores(recommendations):
+    return [round(rec["score"], 6) for rec in recommendations]
+
+def test_precomputed_parity(limit=10):
+    """Vérifie que weighted_recommendations sert les scores de la requête en direct"""
+    purchases, views = synthetic_events(num_sessions=600, num_items=60, days=120)
+    db = memory_session(as_rows(purchases), as_rows(views))
+    index = CooccurrenceIndex.load(db)
+    ParallelCooccurrenceBuilder().write_scores(db, index)
+
+    live = ProductRecommender(db)
+    precomputed = ProductRecommender(db, use_precomputed=True)
+    mismatches = []
+    for item_id in index.item_ids.tolist():
+        served = precomputed.recommend_for_product(item_id, limit)
+        assert precomputed.last_source == "precomputed"
+        if _scores(served) != _scores(live.recommend_for_product(item_id, limit)):
+            mismatches.append(item_id)
+    assert not mismatches, mismatches
+    print(f"✅ Scores précalculés identiques au calcul en direct sur {len(index.item_ids)} items")
+
+def test_precomputed_plan():
+    """Vérifie que la lecture du top-N n'utilise que l'index couvrant, sans tri"""
+    db = memory_session()
+    plan = " ".join(str(row[-1]) for row in db.execute(text(
+        "EXPLAIN QUERY PLAN SELECT recommended_item_id, score, last_updated FROM weighted_recommendations "
+        "WHERE source_item_id = 1 ORDER BY score DESC LIMIT 5"
+    )))
+    assert "COVERING INDEX idx_weighted_recommendations_top" in plan and "TEMP B-TREE" not in plan, plan
+    print("✅ Top-N lu par l'index couvrant")
+
+if __name__ == "__main__":
+    test_precomputed_parity()
+    test_precomputed_plan()
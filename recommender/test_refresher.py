@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta
+from .cooccurrence_index import DEFAULT_WEIGHTS
+from .queries import get_queries, recent_purchase_cutoff
+from .recommender import ProductRecommender
+from .refresher import IncrementalRefresher
+from .models import WeightedRecommendation
+from .test_fixtures import memory_session, insert_events, synthetic_events, as_rows
+
+NOW = datetime.now().replace(microsecond=0)
+
+def _served(db):
+    """Contenu de weighted_recommendations"""
+    table = WeightedRecommendation.__table__
+    return {
+        (row.source_item_id, row.recommended_item_id): round(row.score, 6)
+        for row in db.execute(table.select())
+    }
+
+def _full_rebuild(db, now):
+    """Scores recalculés sur tout l'historique par la requête de reconstruction complète"""
+    bt_weight, us_weight, vp_weight = DEFAULT_WEIGHTS
+    rows = db.execute(get_queries(db.get_bind())["weighted_scores"], {
+        "since": recent_purchase_cutoff(now.date()),
+        "bt_weight": bt_weight, "us_weight": us_weight, "vp_weight": vp_weight,
+    })
+    return {(source, recommended): round(score, 6) for source, recommended, score in rows}
+
+def _refresher(db):
+    refresher = IncrementalRefresher(db)
+    refresher.ensure_tables()
+    return refresher
+
+def test_incremental_matches_full_rebuild():
+    """Vérifie qu'une suite de rafraîchissements reproduit une reconstruction complète"""
+    purchases, views = synthetic_events(num_sessions=400, num_items=40, days=80)
+    db = memory_session()
+    # Trois lots à une minute d'intervalle ; les paires d'une session sont réparties entre lots
+    batches = [
+        [as_rows(tuple(column[part::3] for column in table)) for table in (purchases, views)]
+        for part in range(3)
+    ]
+    refresher = _refresher(db)
+    for offset, (batch_purchases, batch_views) in enumerate(batches):
+        ingested_at = NOW - timedelta(minutes=10 - offset)
+        insert_events(db.get_bind(), batch_purchases, batch_views, ingested_at=ingested_at)
+        refresher.run_once(now=NOW, until=ingested_at)
+        assert _served(db) == _full_rebuild(db, NOW)
+    print("✅ Rafraîchissements successifs identiques à la reconstruction complète")
+
+def test_late_events():
+    """Vérifie que des événements datés du passé mais ingérés après le watermark sont comptés"""
+    purchases, views = synthetic_events(num_sessions=300, num_items=30, days=60)
+    db = memory_session()
+    ingested_at = NOW - timedelta(minutes=10)
+    insert_events(db.get_bind(), as_rows(purchases), as_rows(views), ingested_at=ingested_at)
+    refresher = _refresher(db)
+    refresher.run_once(now=NOW, until=ingested_at)
+
+    # Arrivées tardives : achats et consultations d'il y a 40 jours, dans des sessions
+    # existantes (avant et après leurs achats) et dans une nouvelle session
+    late = NOW - timedelta(days=40)
+    late_purchases = [(0, 101, late), (1, 102, late), (5000, 101, late), (5000, 102, late + timedelta(minutes=1))]
+    late_views = [(0, 103, datetime(2000, 1, 1)), (2, 101, late), (5000, 104, late - timedelta(minutes=1))]
+    ingested_at = NOW - timedelta(minutes=5)
+    insert_events(db.get_bind(), late_purchases, late_views, ingested_at=ingested_at)
+    stats = refresher.run_once(now=NOW, until=ingested_at)
+
+    assert stats["recounted_buckets"] > 0
+    assert refresher.watermark == ingested_at
+    assert _served(db) == _full_rebuild(db, NOW)
+    # Un rafraîchissement sans nouvelle ligne recompte la fenêtre sans rien changer
+    refresher.run_once(now=NOW, until=ingested_at)
+    assert _served(db) == _full_rebuild(db, NOW)
+    print("✅ Événements tardifs comptés, résultat identique à la reconstruction complète")
+
+def test_late_commit():
+    """Vérifie qu'une transaction validée après le passage du watermark est comptée"""
+    purchases, views = synthetic_events(num_sessions=300, num_items=30, days=60)
+    db = memory_session()
+    insert_events(db.get_bind(), as_rows(purchases), as_rows(views), ingested_at=NOW - timedelta(minutes=10))
+    refresher = _refresher(db)
+    refresher.run_once(now=NOW, until=NOW - timedelta(minutes=5))
+
+    # Lignes horodatées avant le watermark mais visibles seulement maintenant ; puis d'autres
+    # au-delà de rescan_window, qui ne sont plus recomptées
+    insert_events(db.get_bind(), [(0, 101, NOW), (1, 101, NOW)], [(2, 101, NOW - timedelta(days=1))],
+                  ingested_at=NOW - timedelta(minutes=7))
+    refresher.run_once(now=NOW, until=NOW - timedelta(minutes=4))
+    assert _served(db) == _full_rebuild(db, NOW)
+    served = _served(db)
+    insert_events(db.get_bind(), [(9000, 101, NOW), (9000, 102, NOW)], ingested_at=NOW - timedelta(minutes=20))
+    refresher.run_once(now=NOW, until=NOW - timedelta(minutes=3))
+    assert _served(db) == served != _full_rebuild(db, NOW)
+    print("✅ Transaction validée en retard comptée dans la fenêtre de relecture")
+
+def test_window_expiry_and_live_parity(limit=10):
+    """Vérifie l'expiration de la fenêtre de 90 jours et la parité avec la requête en direct"""
+    purchases, views = synthetic_events(num_sessions=300, num_items=30, days=120)
+    db = memory_session()
+    ingested_at = NOW - timedelta(minutes=10)
+    insert_events(db.get_bind(), as_rows(purchases), as_rows(views), ingested_at=ingested_at)
+    refresher = _refresher(db)
+    refresher.run_once(now=NOW - timedelta(days=20), until=ingested_at)
+    assert _served(db) == _full_rebuild(db, NOW - timedelta(days=20))
+
+    # Vingt jours plus tard, sans nouvel événement : seuls les achats sortis de la fenêtre changent
+    refresher.run_once(now=NOW, until=ingested_at)
+    assert _served(db) == _full_rebuild(db, NOW)
+
+    live = ProductRecommender(db)
+    precomputed = ProductRecommender(db, use_precomputed=True)
+    for item_id in range(30):
+        expected = [rec["score"] for rec in live.recommend_for_product(item_id, limit)]
+        assert [rec["score"] for rec in precomputed.recommend_for_product(item_id, limit)] == expected
+    print("✅ Fenêtre expirée comme la requête en direct")
+
+def test_ingestion_clock():
+    """Vérifie la borne par défaut : horloge de la base, lignes insérées sans ingested_at"""
+    purchases, views = synthetic_events(num_sessions=50, num_items=10, days=10)
+    db = memory_session(as_rows(purchases), as_rows(views))
+    refresher = IncrementalRefresher(db)
+    refresher.ensure_tables()
+    refresher.run_once()
+    assert _served(db) == _full_rebuild(db, datetime.now())
+    print("✅ Lignes horodatées par la base comptées au premier passage")
+
+if __name__ == "__main__":
+    test_incremental_matches_full_rebuild()
+    test_late_events()
+    test_late_commit()
+    test_window_expiry_and_live_parity()
+    test_ingestion_clock()
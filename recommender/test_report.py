@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from .models import Base, Session
+from .stats_analyzer import StatsAnalyzer
+from .test_fixtures import insert_events, synthetic_events, as_rows
+
+def _file_session(directory):
+    """Base SQLite sur disque : les workers du rapport ouvrent leur propre connexion"""
+    engine = create_engine(f"sqlite:///{os.path.join(directory, 'report.db')}")
+    Base.metadata.create_all(engine)
+    purchases, views = synthetic_events(num_sessions=300, num_items=40)
+    insert_events(engine, as_rows(purchases), as_rows(views))
+    return sessionmaker(bind=engine)()
+
+def test_catalog_report(chunk_size=7):
+    """Vérifie que le rapport par lots, séquentiel ou parallèle, égale calculate_stats sur tout le catalogue"""
+    directory = tempfile.mkdtemp(prefix="test_report_")
+    try:
+        db = _file_session(directory)
+        analyzer = StatsAnalyzer(db)
+        viewed = sorted(item for item, in db.query(Session.item_id).distinct())
+        expected = analyzer.calculate_stats(viewed).sort_values("item_id").reset_index(drop=True)
+
+        for workers in (1, 2):
+            output = os.path.join(directory, f"report_{workers}.csv")
+            stats = analyzer.generate_catalog_report(output, chunk_size=chunk_size, workers=workers)
+            assert stats["items"] == len(viewed)
+            assert stats["chunks"] == -(-len(viewed) // chunk_size)
+            report = pd.read_csv(output, encoding="utf-8-sig")
+            assert report["item_id"].tolist() == viewed
+            for column in ("total_views", "total_purchases", "view_to_purchase_rate", "recommendation_score"):
+                pd.testing.assert_series_equal(
+                    report[column].astype(float), expected[column].astype(float), check_names=False
+                )
+            # À score égal, le top-1 retenu peut différer : on vérifie seulement sa présence
+            assert report["top_recommendation"].isna().tolist() == expected["top_recommendation"].isna().tolist()
+    finally:
+        shutil.rmtree(directory)
+    print(f"✅ Rapport catalogue identique à calculate_stats (lots de {chunk_size} items, 1 et 2 workers)")
+
+if __name__ == "__main__":
+    test_catalog_report()
@@ -0,0 +1,59 @@
+from datetime import date
+from sqlalchemy import inspect
+from .models import Purchase
+from .schema import (
+    COVERING_INDEXES, PARTITION_COLUMNS, _partition_clause, add_monthly_partitions, apply_indexes,
+    check_plans, drop_partitions_before, monthly_partitions, partition_by_month
+)
+from .test_fixtures import memory_session, synthetic_events, as_rows
+
+def _refused(call):
+    try:
+        call()
+    except ValueError as e:
+        return str(e)
+    return None
+
+def test_monthly_partitions():
+    """Vérifie les mois couverts, le passage d'année et la borne de chaque partition"""
+    assert monthly_partitions(date(2025, 11, 17), date(2026, 2, 1)) == [
+        date(2025, 11, 1), date(2025, 12, 1), date(2026, 1, 1), date(2026, 2, 1),
+    ]
+    assert monthly_partitions(date(2026, 3, 5), date(2026, 2, 28)) == []
+    assert _partition_clause(date(2025, 12, 1)) == \
+        "PARTITION p202512 VALUES LESS THAN (TO_DAYS('2026-01-01'))"
+    print("✅ Partitions mensuelles bornées au premier jour du mois suivant")
+
+def test_purchases_not_partitioned():
+    """Vérifie que purchases est refusée : sa clé (session, item) garantit COUNT(*) = sessions distinctes"""
+    engine = memory_session().get_bind()
+    assert "purchases" not in PARTITION_COLUMNS
+    for call in (
+        lambda: partition_by_month(engine, "purchases", date(2026, 1, 1)),
+        lambda: add_monthly_partitions(engine, "purchases", date(2026, 6, 1)),
+        lambda: drop_partitions_before(engine, "purchases", date(2026, 1, 1)),
+    ):
+        assert "purchases" in _refused(call)
+    # sessions est partitionnable, mais seulement sous MySQL
+    assert "MySQL" in _refused(lambda: partition_by_month(engine, "sessions", date(2026, 1, 1)))
+    assert [column.name for column in Purchase.__table__.primary_key] == ["session_id", "item_id"]
+    print("✅ purchases jamais partitionnée, sessions réservée à MySQL")
+
+def test_indexes_and_plans():
+    """Vérifie la création des index manquants et leur usage par les requêtes du registre"""
+    purchases, views = synthetic_events(num_sessions=200, num_items=20, days=30)
+    db = memory_session(as_rows(purchases), as_rows(views))
+    engine = db.get_bind()
+    next(index for index in COVERING_INDEXES if index.name == "idx_purchases_item_date").drop(engine)
+    assert apply_indexes(engine) == ["idx_purchases_item_date"]
+    assert apply_indexes(engine) == []
+    assert "idx_purchases_item_date" in {index["name"] for index in inspect(engine).get_indexes("purchases")}
+
+    checks = check_plans(engine, item_id=1)
+    assert all(check["ok"] for check in checks.values()), {name: check["missing"] for name, check in checks.items()}
+    print("✅ Index recréés et utilisés par les plans SQLite")
+
+if __name__ == "__main__":
+    test_monthly_partitions()
+    test_purchases_not_partitioned()
+    test_indexes_and_plans()
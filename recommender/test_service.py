@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+from sqlalchemy.orm import scoped_session, sessionmaker
+from .metrics import METRICS
+from .recommender import ProductRecommender
+from .service import MAX_RECOMMENDATIONS, create_app
+from .test_fixtures import memory_session
+
+NOW = datetime.now().replace(microsecond=0)
+PURCHASES = [(1, 1, NOW), (1, 2, NOW), (2, 1, NOW), (2, 3, NOW), (3, 2, NOW)]
+VIEWS = [(1, 3, NOW - timedelta(minutes=5)), (2, 2, NOW - timedelta(minutes=5)),
+         (3, 3, NOW - timedelta(minutes=5))]
+
+def _client():
+    """Client de test de l'application sur une base en mémoire, et un recommender de référence"""
+    db = memory_session(PURCHASES, VIEWS)
+    session = scoped_session(sessionmaker(bind=db.get_bind()))
+    return create_app(session=session).test_client(), ProductRecommender(db)
+
+def test_recommendations():
+    """Vérifie les réponses des endpoints de recommandation contre ProductRecommender"""
+    client, reference = _client()
+    response = client.get("/recommendations/1?limit=2")
+    assert response.status_code == 200
+    assert response.get_json() == {"item_id": 1, "recommendations": reference.recommend_for_product(1, 2)}
+    assert client.get("/recommendations/999").status_code == 404
+
+    response = client.post("/recommendations", json={"item_ids": [1, 999], "limit": 3})
+    assert response.get_json() == {"item_ids": [1], "recommendations": reference.recommend_for_products([1], 3)}
+
+    response = client.post("/recommendations/batch", json={"item_ids": [2, 999, 1]})
+    results = response.get_json()["results"]
+    assert list(results) == ["2", "999", "1"]
+    assert results["999"] == [] and results["1"] == reference.recommend_for_product(1)
+
+    response = client.get("/paths/3?max_path_length=2&min_support=1")
+    assert response.get_json()["paths"] == reference.get_purchase_paths(3, 2, 1)
+    print("✅ Endpoints de recommandation identiques à ProductRecommender")
+
+def test_bad_requests():
+    """Vérifie les 400 sur les paramètres et corps invalides, dont un JSON qui n'est pas un objet"""
+    client, _ = _client()
+    for url in ("/recommendations/1?limit=0", f"/recommendations/1?limit={MAX_RECOMMENDATIONS + 1}",
+                "/recommendations/1?limit=abc", "/paths/1?min_support=x", "/stats?num_items=x"):
+        assert client.get(url).status_code == 400, url
+    for url in ("/recommendations", "/recommendations/batch", "/stats"):
+        for payload in ([1, 2], "1", {"item_ids": []}, {"item_ids": ["a"]}):
+            assert client.post(url, json=payload).status_code == 400, (url, payload)
+        assert client.post(url, data="{", content_type="application/json").status_code == 400, url
+    for url in ("/recommendations", "/recommendations/batch"):
+        assert client.post(url, json={"item_ids": [1], "limit": -1}).status_code == 400, url
+    print("✅ Requêtes invalides refusées en 400")
+
+def test_stats_and_health():
+    """Vérifie /stats, et que /health et /metrics lisent les sources dans METRICS"""
+    client, _ = _client()
+    # Statistiques calculées sur les items consultés (2 et 3)
+    stats = client.post("/stats", json={"item_ids": [2, 3]}).get_json()["stats"]
+    assert sorted(row["item_id"] for row in stats) == [2, 3]
+    # Tirage aléatoire : seuls les items consultés ont des statistiques
+    assert {row["item_id"] for row in client.get("/stats?num_items=2").get_json()["stats"]} <= {2, 3}
+
+    before = METRICS.counters("sources").get("cache", 0)
+    client.get("/recommendations/1")
+    client.get("/recommendations/1")
+    sources = client.get("/health").get_json()["sources"]
+    assert sources["cache"] == before + 1
+    metrics = client.get("/metrics").get_json()
+    assert metrics["sources"] == sources and "cache_stats" in metrics
+    print("✅ Statistiques servies, sources lues dans le registre METRICS")
+
+if __name__ == "__main__":
+    test_recommendations()
+    test_bad_requests()
+    test_stats_and_health()
@@ -0,0 +1,126 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+import numpy as np
+from .cooccurrence_index import MATRICES, CooccurrenceIndex
+from .recommender import ProductRecommender
+from .snapshot import MANIFEST_FILE, EventSnapshot, read_events
+from .test_fixtures import memory_session, insert_events, synthetic_events, as_rows
+
+def _exported(num_sessions=200):
+    purchases, views = synthetic_events(num_sessions=num_sessions, num_items=30)
+    db = memory_session(as_rows(purchases), as_rows(views))
+    path = os.path.join(tempfile.mkdtemp(prefix="test_snapshot_"), "events.snapshot")
+    EventSnapshot.export(db, path)
+    return db, path
+
+def _refused(path, **options):
+    try:
+        EventSnapshot.open(path, **options)
+    except ValueError:
+        return True
+    return False
+
+def test_round_trip():
+    """Vérifie que l'instantané relu contient les événements de la base, triés par session"""
+    db, path = _exported()
+    try:
+        snapshot = EventSnapshot.open(path, verify=True)
+        (ps, pi, pt), (vs, vi, vt) = read_events(db)
+        assert np.array_equal(snapshot.purchase_sessions, ps) and np.array_equal(snapshot.purchase_items, pi)
+        assert np.array_equal(snapshot.purchase_times, pt) and np.array_equal(snapshot.view_times, vt)
+        session_id = int(snapshot.session_ids[len(snapshot.session_ids) // 2])
+        (items, _), (viewed, _) = snapshot.session_events(session_id)
+        assert sorted(items.tolist()) == sorted(pi[ps == session_id].tolist())
+        assert sorted(viewed.tolist()) == sorted(vi[vs == session_id].tolist())
+        assert len(snapshot.session_events(-1)[0][0]) == 0
+    finally:
+        shutil.rmtree(os.path.dirname(path))
+    print("✅ Instantané relu à l'identique")
+
+def test_integrity():
+    """Vérifie le refus d'un instantané corrompu, tronqué ou d'une autre version"""
+    db, path = _exported()
+    try:
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        # Octet modifié : seule la vérification des sommes de contrôle le détecte
+        items_path = os.path.join(path, manifest["arrays"]["purchase_items"]["file"])
+        with open(items_path, "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 0xFF]))
+        assert not _refused(path)
+        assert _refused(path, verify=True)
+
+        # Tableau tronqué : longueur différente du manifeste
+        np.save(os.path.join(path, manifest["arrays"]["view_items"]["file"]), np.zeros(3, np.int32))
+        assert _refused(path)
+
+        manifest["version"] = manifest["version"] + 1
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        assert _refused(path)
+    finally:
+        shutil.rmtree(os.path.dirname(path))
+    print("✅ Instantané corrompu, tronqué ou d'une autre version refusé")
+
+def test_mapped_index():
+    """Vérifie que l'index est relu depuis les fichiers mappés, sans copie ni reconstruction"""
+    db, path = _exported()
+    try:
+        snapshot = EventSnapshot.open(path, verify=True)
+        index = CooccurrenceIndex.from_snapshot(snapshot)
+        expected = CooccurrenceIndex.load(db)
+        assert np.array_equal(index.item_ids, expected.item_ids)
+        for name in MATRICES:
+            matrix = getattr(index, name)
+            assert (matrix != getattr(expected, name)).nnz == 0, name
+            assert np.shares_memory(matrix.data, getattr(snapshot, f"{name}_data")), name
+            assert not matrix.indices.flags.writeable, name
+        items = index.item_ids[:5].tolist()
+        assert index.recommend_many(items, 10) == expected.recommend_many(items, 10)
+
+        # Autres pondérations : seuls les scores sont recalculés
+        reweighted = CooccurrenceIndex.from_snapshot(snapshot, weights=(1, 1, 1))
+        assert reweighted.bought_together is index.bought_together
+        assert (reweighted.scores != CooccurrenceIndex.load(db, weights=(1, 1, 1)).scores).nnz == 0
+
+        recommender = ProductRecommender(db, snapshot=snapshot)
+        assert recommender.index.scores is snapshot.index_matrices["scores"]
+    finally:
+        shutil.rmtree(os.path.dirname(path))
+    print("✅ Index mappé depuis l'instantané, identique à CooccurrenceIndex.load")
+
+def test_staleness():
+    """Vérifie la détection d'un instantané périmé, y compris par un événement tardif"""
+    db, path = _exported()
+    try:
+        snapshot = EventSnapshot.open(path)
+        assert not snapshot.is_stale(db)
+        # Consultation datée du passé : seul le compte des lignes ingérées le révèle
+        insert_events(db.get_bind(), views=[(10 ** 6, 1, datetime(2000, 1, 1))])
+        assert snapshot.is_stale(db)
+        EventSnapshot.export(db, path)
+        snapshot = EventSnapshot.open(path)
+        assert not snapshot.is_stale(db)
+
+        # Transaction validée après l'export, horodatée avant lui (dans RESCAN_WINDOW)
+        since = datetime.fromisoformat(snapshot.manifest["stamp"]["since"])
+        insert_events(db.get_bind(), purchases=[(10 ** 6, 2, datetime(2000, 1, 1))],
+                      ingested_at=since + timedelta(minutes=1))
+        assert snapshot.is_stale(db)
+    finally:
+        shutil.rmtree(os.path.dirname(path))
+    print("✅ Instantané périmé détecté")
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_integrity()
+    test_mapped_index()
+    test_staleness()
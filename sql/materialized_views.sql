@@ -8,6 +8,58 @@ CREATE TABLE IF NOT EXISTS product_recommendations (
     PRIMARY KEY (source_item_id, recommended_item_id, recommendation_type)
 );
 
+-- Index de lecture des top-N par item source (ProductRecommender en mode précalculé)
+CREATE INDEX idx_product_recommendations_lookup
+    ON product_recommendations (source_item_id, recommendation_type, score);
+
+-- Score final de recommend_for_product par paire (lu par ProductRecommender en mode précalculé)
+CREATE TABLE IF NOT EXISTS weighted_recommendations (
+    source_item_id INT,
+    recommended_item_id INT,
+    score DOUBLE NOT NULL,
+    last_updated DATETIME,
+    PRIMARY KEY (source_item_id, recommended_item_id)
+);
+
+-- Top-N par ORDER BY score DESC LIMIT n, servi entièrement par l'index
+CREATE INDEX idx_weighted_recommendations_top
+    ON weighted_recommendations (source_item_id, score, recommended_item_id, last_updated);
+
+-- Procédure de reconstruction complète avec la formule de recommend_for_product :
+-- achats ensemble sur 90 jours (x2, sessions distinctes x1.5), consultation puis achat (x3)
+DELIMITER //
+CREATE PROCEDURE update_weighted_recommendations()
+BEGIN
+    START TRANSACTION;
+    DELETE FROM weighted_recommendations;
+    INSERT INTO weighted_recommendations
+    SELECT source_item_id, recommended_item_id, SUM(score), NOW()
+    FROM (
+        SELECT
+            p1.item_id as source_item_id,
+            p2.item_id as recommended_item_id,
+            COUNT(*) * 2 + COUNT(DISTINCT p1.session_id) * 1.5 as score
+        FROM purchases p1
+        JOIN purchases p2 ON p1.session_id = p2.session_id
+        WHERE p1.item_id <> p2.item_id
+        AND p1.purchase_date >= DATE_SUB(CURRENT_DATE(), INTERVAL 90 DAY)
+        GROUP BY p1.item_id, p2.item_id
+
+        UNION ALL
+
+        SELECT s.item_id, p.item_id, COUNT(*) * 3
+        FROM sessions s
+        JOIN purchases p
+            ON s.session_id = p.session_id
+            AND s.view_date < p.purchase_date
+        WHERE s.item_id <> p.item_id
+        GROUP BY s.item_id, p.item_id
+    ) scored
+    GROUP BY source_item_id, recommended_item_id;
+    COMMIT;
+END //
+DELIMITER ;
+
 -- Procédure pour mettre à jour les recommandations BOUGHT_TOGETHER
 DELIMITER //
 CREATE PROCEDURE update_bought_together_recommendations()
@@ -53,10 +105,12 @@ END //
 DELIMITER ;
 
 -- Événement pour mettre à jour automatiquement les recommandations chaque jour
+-- (remplaçable par le rafraîchissement incrémental : python -m recommender.refresher --loop 60)
 CREATE EVENT IF NOT EXISTS update_recommendations
 ON SCHEDULE EVERY 1 DAY
 DO
 BEGIN
     CALL update_bought_together_recommendations();
     CALL update_view_to_purchase_recommendations();
+    CALL update_weighted_recommendations();
 END;
\ No newline at end of file